@@ -0,0 +1,286 @@
+"""Cart line writes, with ``Cart.total_money`` kept up to date by deltas.
+
+A cart holds one ``item`` row per (cart, food, size), enforced by the two
+partial unique indexes on ``Item``: ``(cart_id, food_id, food_option_id)``
+where a size is set and ``(cart_id, food_id)`` where it is NULL. Adding a line
+that already exists adds to its quantity in the same statement, so two quick
+taps can no longer insert the same line twice.
+
+Every write also adds its effect on the total (``quantity * (food price + size
+price)``, as a ``Decimal``) to ``cart.total_money`` instead of re-summing the
+cart. On PostgreSQL the line statements run as data-modifying CTEs of the cart
+UPDATE, so a line and the total never change apart; other databases run them
+one after another and rely on the caller's transaction.
+
+Totals drift when a price changes after the line was added. ``signals.py``
+reprices the affected carts on food and size saves, and ``manage.py
+repair_cart_totals`` recomputes any cart that still differs.
+
+Each line also keeps a pricing snapshot (``LinePrice``): the food and size
+prices it was last added at and the food's ``price_version`` at that time.
+Checkout writes the order details from the snapshot instead of reading the
+catalog again. A line whose version no longer matches its food's is stale;
+checkout and ``get_cart`` compare the two in the query that already joins
+the food, and only stale lines are priced from the catalog.
+"""
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from django.db import connection
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Cart, Item
+
+# Conflict target per index, matching the partial unique constraints on Item
+_SIZED = '(cart_id, food_id, food_option_id) WHERE food_option_id IS NOT NULL'
+_UNSIZED = '(cart_id, food_id) WHERE food_option_id IS NULL'
+
+_RETURNING = 'RETURNING id, food_id, food_option_id, quantity, item_note'
+
+_money = DecimalField(max_digits=13, decimal_places=3)
+
+
+class LinePrice(NamedTuple):
+    food_price: Decimal
+    food_option_price: Optional[Decimal]
+    price_version: int
+
+    @property
+    def unit_price(self):
+        return self.food_price + (self.food_option_price or Decimal('0'))
+
+
+def line_price(food, size=None):
+    """Snapshot of the current price of ``food`` (and ``size``) for a cart line."""
+    return LinePrice(food.price, size.price if size is not None else None, food.price_version)
+
+
+def current_prices(keys):
+    """``{(food_id, food_option_id): LinePrice}`` at current prices, one query per table."""
+    from apps.menu.models import Food, FoodSize
+
+    keys = list(keys)
+    foods = Food.objects.in_bulk({food_id for food_id, _ in keys})
+    size_ids = {food_option_id for _, food_option_id in keys if food_option_id}
+    sizes = FoodSize.objects.in_bulk(size_ids) if size_ids else {}
+    return {
+        (food_id, food_option_id): line_price(foods[food_id], sizes.get(food_option_id))
+        for food_id, food_option_id in keys
+        if food_id in foods and (not food_option_id or food_option_id in sizes)
+    }
+
+
+def unit_price():
+    """Expression for one unit of an ``Item``: food price plus size price."""
+    return F('food__price') + Coalesce(F('food_option__price'), Value(Decimal('0')))
+
+
+def locked_lines(cart_id, **filters):
+    """Lines of the cart matching ``filters`` with their ``unit_price``, locked until commit."""
+    return list(
+        Item.objects.select_for_update(of=('self',))
+        .filter(cart_id=cart_id, **filters)
+        .annotate(unit_price=unit_price())
+        .order_by('id')
+    )
+
+
+def lines_total(lines):
+    """Sum of ``quantity * unit_price`` over lines from ``locked_lines``."""
+    return sum((line.unit_price * line.quantity for line in lines), Decimal('0'))
+
+
+def _to_money(value):
+    return Cart._meta.get_field('total_money').to_python(value)
+
+
+def _apply(cart_id, statements, delta=Decimal('0'), total=None):
+    """Run the line ``statements`` and move the cart total by ``delta`` (or set it to ``total``).
+
+    ``statements`` are ``(sql, params)`` ending in ``_RETURNING``. Returns the
+    returned rows as dicts and the new cart total.
+    """
+    columns = ['id', 'food_id', 'food_option_id', 'quantity', 'item_note']
+    if total is None:
+        assignment, value = 'total_money = total_money + %s', delta
+    else:
+        assignment, value = 'total_money = %s', total
+    update_cart = f'UPDATE cart SET {assignment} WHERE id = %s RETURNING total_money'
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql' and statements:
+            ctes = ', '.join(f'line{i} AS ({sql})' for i, (sql, _) in enumerate(statements))
+            lines = ' UNION ALL '.join(f'SELECT * FROM line{i}' for i in range(len(statements)))
+            params = [param for _, statement_params in statements for param in statement_params]
+            cursor.execute(
+                f'WITH {ctes}, total AS ({update_cart}) '
+                f'SELECT total.total_money, line.* FROM total LEFT JOIN ({lines}) AS line ON true',
+                params + [value, cart_id],
+            )
+            result = cursor.fetchall()
+            new_total = result[0][0] if result else None
+            rows = [row[1:] for row in result if row[1] is not None]
+        else:
+            rows = []
+            for sql, params in statements:
+                cursor.execute(sql, params)
+                rows += cursor.fetchall()
+            cursor.execute(update_cart, [value, cart_id])
+            result = cursor.fetchone()
+            new_total = result[0] if result else None
+    return [dict(zip(columns, row)) for row in rows], _to_money(new_total)
+
+
+def merge_lines(lines):
+    """Collapse ``(food_id, food_option_id, quantity, item_note)`` tuples with the same key.
+
+    Quantities are added and the last non-empty note wins. One INSERT may not
+    touch the same row twice, so lines are merged before they are written.
+    """
+    merged = {}
+    for food_id, food_option_id, quantity, item_note in lines:
+        key = (int(food_id), int(food_option_id) if food_option_id else None)
+        if key in merged:
+            _, _, current, note = merged[key]
+            merged[key] = (*key, current + quantity, item_note or note)
+        else:
+            merged[key] = (*key, quantity, item_note or None)
+    return list(merged.values())
+
+
+def _upsert_statements(cart_id, lines, absolute=False):
+    """One ``INSERT ... ON CONFLICT`` per conflict target for ``lines``.
+
+    ``lines`` are ``(food_id, food_option_id, quantity, item_note, LinePrice)``.
+    Conflicting rows take the new pricing snapshot and get the quantity added,
+    or with ``absolute`` replaced together with the note.
+    """
+    snapshot = (
+        'food_price = EXCLUDED.food_price, food_option_price = EXCLUDED.food_option_price, '
+        'price_version = EXCLUDED.price_version'
+    )
+    if absolute:
+        assignments = f'quantity = EXCLUDED.quantity, item_note = EXCLUDED.item_note, {snapshot}'
+    else:
+        assignments = (
+            'quantity = item.quantity + EXCLUDED.quantity, '
+            f'item_note = COALESCE(EXCLUDED.item_note, item.item_note), {snapshot}'
+        )
+    statements = []
+    for target, group in (
+        (_SIZED, [line for line in lines if line[1] is not None]),
+        (_UNSIZED, [line for line in lines if line[1] is None]),
+    ):
+        if not group:
+            continue
+        values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s)'] * len(group))
+        statements.append((
+            'INSERT INTO item (cart_id, food_id, food_option_id, quantity, item_note, '
+            f'food_price, food_option_price, price_version) VALUES {values} '
+            f'ON CONFLICT {target} DO UPDATE SET {assignments} {_RETURNING}',
+            [value for *line, price in group for value in (cart_id, *line, *price)],
+        ))
+    return statements
+
+
+def upsert_lines(cart_id, lines, prices):
+    """Add ``lines`` to the cart: one upsert per conflict target, plus the total.
+
+    ``lines`` are ``(food_id, food_option_id, quantity, item_note)`` and
+    ``prices`` maps ``(food_id, food_option_id)`` to its ``LinePrice``.
+    Existing lines get the quantity added, the new pricing snapshot, and keep
+    their note unless a new one is given. Returns ``{(food_id,
+    food_option_id): quantity}`` with the stored quantities, and the new cart
+    total.
+    """
+    lines = [(*line, prices[(line[0], line[1])]) for line in merge_lines(lines)]
+    delta = sum((price.unit_price * quantity for _, _, quantity, _, price in lines), Decimal('0'))
+    rows, total = _apply(cart_id, _upsert_statements(cart_id, lines), delta)
+    return {(row['food_id'], row['food_option_id']): row['quantity'] for row in rows}, total
+
+
+def replace_lines(cart_id, remove_ids, lines, delta):
+    """Delete ``remove_ids`` and write ``lines`` with absolute quantities, notes and prices, in one go.
+
+    ``lines`` are ``(food_id, food_option_id, quantity, item_note, LinePrice)``
+    for keys not being deleted. Returns the written rows and the new cart total.
+    """
+    statements = []
+    if remove_ids:
+        placeholders = ', '.join(['%s'] * len(remove_ids))
+        statements.append((
+            f'DELETE FROM item WHERE cart_id = %s AND id IN ({placeholders}) {_RETURNING}',
+            [cart_id, *remove_ids],
+        ))
+    statements += _upsert_statements(cart_id, lines, absolute=True)
+    rows, total = _apply(cart_id, statements, delta)
+    removed = set(remove_ids)
+    return [row for row in rows if row['id'] not in removed], total
+
+
+def update_lines(cart_id, lines, quantity=None, item_note=None):
+    """Set ``quantity`` and/or ``item_note`` on ``lines`` (from ``locked_lines``).
+
+    Returns the updated rows and the new cart total.
+    """
+    assignments, params = [], []
+    delta = Decimal('0')
+    if quantity is not None:
+        assignments.append('quantity = %s')
+        params.append(quantity)
+        delta = sum((line.unit_price * (quantity - line.quantity) for line in lines), Decimal('0'))
+    if item_note is not None:
+        assignments.append('item_note = %s')
+        params.append(item_note)
+    ids = [line.id for line in lines]
+    placeholders = ', '.join(['%s'] * len(ids))
+    return _apply(cart_id, [(
+        f"UPDATE item SET {', '.join(assignments)} WHERE cart_id = %s AND id IN ({placeholders}) {_RETURNING}",
+        params + [cart_id, *ids],
+    )], delta)
+
+
+def remove_lines(cart_id, item_ids, delta):
+    """Delete the lines ``item_ids`` and take their value (``delta`` <= 0) off the total."""
+    ids = list(item_ids)
+    placeholders = ', '.join(['%s'] * len(ids))
+    rows, total = _apply(cart_id, [(
+        f'DELETE FROM item WHERE cart_id = %s AND id IN ({placeholders}) {_RETURNING}',
+        [cart_id, *ids],
+    )], delta)
+    return total
+
+
+def clear_lines(cart_id):
+    """Delete every line of the cart and reset its total to zero."""
+    rows, total = _apply(cart_id, [(f'DELETE FROM item WHERE cart_id = %s {_RETURNING}', [cart_id])], total=0)
+    return total
+
+
+def expected_total():
+    """Subquery of the total recomputed from the items of ``OuterRef('pk')`` at current prices."""
+    return Coalesce(
+        Subquery(
+            Item.objects.filter(cart=OuterRef('pk')).values('cart')
+            .annotate(total=Sum(F('quantity') * unit_price(), output_field=_money))
+            .values('total'),
+            output_field=_money,
+        ),
+        Value(Decimal('0')),
+        output_field=_money,
+    )
+
+
+def drifted_carts(carts=None):
+    """Carts of ``carts`` (default all) whose stored total differs from their items."""
+    carts = Cart.objects.all() if carts is None else carts
+    return carts.annotate(expected=expected_total()).exclude(total_money=F('expected'))
+
+
+def repair_totals(carts=None):
+    """Recompute the total of every drifted cart of ``carts``; return how many changed."""
+    ids = list(drifted_carts(carts).values_list('id', flat=True))
+    if not ids:
+        return 0
+    return Cart.objects.filter(id__in=ids).update(total_money=expected_total())
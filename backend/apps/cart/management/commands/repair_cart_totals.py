@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.cart.lines import drifted_carts, repair_totals
+
+
+class Command(BaseCommand):
+    help = 'Recompute Cart.total_money for carts whose stored total no longer matches their items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list the carts that drifted')
+        parser.add_argument('--show', type=int, default=20, help='Number of drifted carts to print')
+
+    def handle(self, *args, **options):
+        drifted = drifted_carts().order_by('id')
+        for cart in drifted[:options['show']]:
+            self.stdout.write(f'cart {cart.id} (user {cart.user_id}): stored {cart.total_money}, items {cart.expected}')
+        if options['dry_run']:
+            self.stdout.write(f'{drifted.count()} carts have drifted')
+            return
+        repaired = repair_totals()
+        self.stdout.write(self.style.SUCCESS(f'Repaired {repaired} cart totals'))
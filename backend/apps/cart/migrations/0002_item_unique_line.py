@@ -0,0 +1,40 @@
+# Generated by Django 5.1.15 on 2026-10-16 23:49
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """Fold duplicate (cart, food, size) lines into the oldest one before the unique indexes."""
+    Item = apps.get_model('cart', 'Item')
+    duplicates = (
+        Item.objects.values('cart_id', 'food_id', 'food_option_id')
+        .annotate(lines=Count('id'), keep_id=Min('id'), total=Sum('quantity'))
+        .filter(lines__gt=1)
+    )
+    for line in duplicates:
+        same = Item.objects.filter(
+            cart_id=line['cart_id'], food_id=line['food_id'], food_option_id=line['food_option_id'],
+        )
+        same.filter(id=line['keep_id']).update(quantity=line['total'])
+        same.exclude(id=line['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+        ('menu', '0002_remove_food_is_topping'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='item',
+            constraint=models.UniqueConstraint(condition=models.Q(('food_option__isnull', False)), fields=('cart', 'food', 'food_option'), name='item_cart_food_option_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='item',
+            constraint=models.UniqueConstraint(condition=models.Q(('food_option__isnull', True)), fields=('cart', 'food'), name='item_cart_food_uniq'),
+        ),
+    ]
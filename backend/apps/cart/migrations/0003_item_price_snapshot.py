@@ -0,0 +1,44 @@
+# Generated by Django 5.1.15 on 2026-10-17 00:01
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def snapshot_prices(apps, schema_editor):
+    """Price existing lines at the current food and size prices."""
+    Item = apps.get_model('cart', 'Item')
+    Food = apps.get_model('menu', 'Food')
+    FoodSize = apps.get_model('menu', 'FoodSize')
+    food = Food.objects.filter(pk=OuterRef('food_id'))
+    Item.objects.update(
+        food_price=Subquery(food.values('price')[:1]),
+        price_version=Subquery(food.values('price_version')[:1]),
+        food_option_price=Subquery(FoodSize.objects.filter(pk=OuterRef('food_option_id')).values('price')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_item_unique_line'),
+        ('menu', '0003_food_price_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='food_option_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='food_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='price_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(snapshot_prices, migrations.RunPython.noop),
+    ]
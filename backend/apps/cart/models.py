@@ -20,20 +20,28 @@ class Cart(models.Model):
         return Item.objects.filter(cart=self)
      
     def update_total(self):
-        """Update cart total based on items"""
+        """Recompute the total from the items at current prices, in one statement.
+
+        Writes keep the total current by deltas (``apps/cart/lines.py``); this is
+        for repairing a single cart.
+        """
         with connection.cursor() as cursor:
             cursor.execute("""
-                SELECT COALESCE(SUM(
-                    i.quantity * (f.price + COALESCE(fs.price, 0))
-                ), 0) 
-                FROM item i 
-                JOIN food f ON i.food_id = f.id 
-                LEFT JOIN food_size fs ON i.food_option_id = fs.id
-                WHERE i.cart_id = %s
+                UPDATE cart SET total_money = (
+                    SELECT COALESCE(SUM(
+                        i.quantity * (f.price + COALESCE(fs.price, 0))
+                    ), 0)
+                    FROM item i
+                    JOIN food f ON i.food_id = f.id
+                    LEFT JOIN food_size fs ON i.food_option_id = fs.id
+                    WHERE i.cart_id = cart.id
+                )
+                WHERE id = %s
+                RETURNING total_money
             """, [self.id])
-            total = cursor.fetchone()[0]
-            self.total_money = total
-            self.save()
+            row = cursor.fetchone()
+            if row:
+                self.total_money = self._meta.get_field('total_money').to_python(row[0])
 
 
 class Item(models.Model):
@@ -42,9 +50,29 @@ class Item(models.Model):
     food_option = models.ForeignKey('menu.FoodSize', on_delete=models.CASCADE, db_column='food_option_id', null=True, blank=True)
     quantity = models.IntegerField(default=1)
     item_note = models.CharField(max_length=255, blank=True, null=True)
+    # Pricing snapshot taken when the line was last added to: the prices the
+    # order details are written with, valid while ``price_version`` still
+    # matches the food's (see ``apps/cart/lines.py``)
+    food_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    food_option_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    price_version = models.PositiveIntegerField(default=0)
 
     class Meta:
         db_table = 'item'
+        # One line per (cart, food, size); NULL sizes need their own index to
+        # conflict with each other. ``apps/cart/lines.py`` upserts against these.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['cart', 'food', 'food_option'],
+                condition=models.Q(food_option__isnull=False),
+                name='item_cart_food_option_uniq',
+            ),
+            models.UniqueConstraint(
+                fields=['cart', 'food'],
+                condition=models.Q(food_option__isnull=True),
+                name='item_cart_food_uniq',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.quantity}x {self.food.title}"
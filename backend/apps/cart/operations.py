@@ -0,0 +1,152 @@
+"""Batches of cart changes, applied together by ``POST /api/cart/batch/``.
+
+A batch is a list of operations, applied in order:
+
+    {"op": "add", "food_id": 3, "food_option_id": 7, "quantity": 2, "item_note": "...", "toppings": {"9": 1}}
+    {"op": "set", "food_id": 3, "quantity": 4, "item_note": "..."}
+    {"op": "remove", "food_id": 3}
+
+``add`` works like ``POST /add/``; ``set`` and ``remove`` act on every line of
+the food, like ``PUT``/``DELETE /items/{food_id}/``. The operations are
+applied to the cart lines in memory (``apply_operations``); the store then
+writes only the difference and moves the total once. Any invalid operation
+rejects the whole batch.
+"""
+from decimal import Decimal
+
+ADD = 'add'
+SET = 'set'
+REMOVE = 'remove'
+
+MAX_OPERATIONS = 100
+
+
+class CartOperationError(Exception):
+    """An operation of the batch is invalid; nothing was written."""
+
+    def __init__(self, message, index=None, status_code=400):
+        super().__init__(message)
+        self.index = index
+        self.status_code = status_code
+
+
+def _int(value, name, index, minimum=None):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise CartOperationError(f'{name} must be a number', index)
+    if minimum is not None and number < minimum:
+        raise CartOperationError(f'{name} must be at least {minimum}', index)
+    return number
+
+
+def parse_operations(data):
+    """Validate the request body into ``(op, food_id, food_option_id, quantity, item_note, index)``.
+
+    ``index`` is the position in the request. An ``add`` with toppings expands
+    into one ``add`` per topping line.
+    """
+    if not isinstance(data, (list, tuple)) or not data:
+        raise CartOperationError('operations must be a non-empty list')
+    if len(data) > MAX_OPERATIONS:
+        raise CartOperationError(f'At most {MAX_OPERATIONS} operations per batch')
+
+    operations = []
+    for index, raw in enumerate(data):
+        if not isinstance(raw, dict):
+            raise CartOperationError('Each operation must be an object', index)
+        op = raw.get('op')
+        food_id = _int(raw.get('food_id'), 'food_id', index)
+        item_note = raw.get('item_note')
+        if op == ADD:
+            food_option_id = raw.get('food_option_id')
+            food_option_id = _int(food_option_id, 'food_option_id', index) if food_option_id else None
+            quantity = _int(raw.get('quantity', 1), 'quantity', index, 1)
+            operations.append((ADD, food_id, food_option_id, quantity, item_note, index))
+            toppings = raw.get('toppings') or {}
+            if not isinstance(toppings, dict):
+                raise CartOperationError('toppings must be an object', index)
+            for topping_id, topping_quantity in toppings.items():
+                topping_quantity = _int(topping_quantity, 'topping quantity', index)
+                if topping_quantity > 0:
+                    operations.append((ADD, _int(topping_id, 'topping id', index), None, topping_quantity, None, index))
+        elif op == SET:
+            quantity = raw.get('quantity')
+            if quantity is not None:
+                quantity = _int(quantity, 'quantity', index, 1)
+            if quantity is None and item_note is None:
+                raise CartOperationError('No fields to update', index)
+            operations.append((SET, food_id, None, quantity, item_note, index))
+        elif op == REMOVE:
+            operations.append((REMOVE, food_id, None, None, None, index))
+        else:
+            raise CartOperationError('op must be one of add, set, remove', index)
+    return operations
+
+
+def added_keys(operations):
+    """``(food_id, food_option_id)`` of every line the batch may add."""
+    return {(food_id, food_option_id) for op, food_id, food_option_id, *_ in operations if op == ADD}
+
+
+def apply_operations(lines, operations, prices, new_line):
+    """Apply ``operations`` to ``lines`` (``CartLine`` objects, changed in place) and return them.
+
+    ``prices`` maps every added key to its ``LinePrice``; ``new_line(food_id,
+    food_option_id, price)`` creates a line for a key not in the cart. Lines
+    added to take the new price, as with ``POST /add/``.
+    Raises ``CartOperationError`` (404) for ``set``/``remove`` on a food that
+    is not in the cart at that point of the batch.
+    """
+    lines = list(lines)
+    for op, food_id, food_option_id, quantity, item_note, index in operations:
+        if op == ADD:
+            price = prices[(food_id, food_option_id)]
+            line = next((line for line in lines if line.key == (food_id, food_option_id)), None)
+            if line is None:
+                line = new_line(food_id, food_option_id, price)
+                lines.append(line)
+            line.price, line.unit_price = price, price.unit_price
+            line.quantity += quantity
+            line.item_note = item_note or line.item_note
+            continue
+
+        matching = [line for line in lines if line.food_id == food_id]
+        if not matching:
+            raise CartOperationError('Item not found in cart', index, status_code=404)
+        if op == REMOVE:
+            lines = [line for line in lines if line.food_id != food_id]
+        else:
+            for line in matching:
+                if quantity is not None:
+                    line.quantity = quantity
+                if item_note is not None:
+                    line.item_note = item_note
+    return lines
+
+
+def lines_value(lines):
+    return sum((line.unit_price * line.quantity for line in lines), Decimal('0'))
+
+
+def diff_lines(before, after):
+    """What to write to turn ``before`` into ``after``, compared by (food, size).
+
+    Returns the ids of the lines to delete, ``(food_id, food_option_id,
+    quantity, item_note, price)`` for lines to insert or overwrite, and the
+    change of the cart total. A line removed and added again within the batch gets its
+    old id back.
+    """
+    old = {line.key: line for line in before}
+    new = {line.key: line for line in after}
+    for key, line in new.items():
+        if key in old:
+            line.id = old[key].id
+    remove_ids = [line.id for key, line in old.items() if key not in new]
+    writes = [
+        (line.food_id, line.food_option_id, line.quantity, line.item_note, line.price)
+        for key, line in new.items()
+        if key not in old
+        or (old[key].quantity, old[key].item_note, old[key].price) != (line.quantity, line.item_note, line.price)
+    ]
+    return remove_ids, writes, lines_value(after) - lines_value(before)
@@ -0,0 +1,21 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from apps.menu.models import Food, FoodSize
+from .lines import repair_totals
+from .models import Cart, Item
+from .store import get_cart_store
+
+
+@receiver(post_save, sender=Food)
+@receiver(post_save, sender=FoodSize)
+def reprice_carts(sender, instance, created, **kwargs):
+    """Recompute the totals of carts holding a food or size whose price changed."""
+    # Availability, title or image edits leave every cart total as it was
+    if created or not getattr(instance, '_price_changed', False):
+        return
+    field = 'food_option' if sender is FoodSize else 'food'
+    repair_totals(Cart.objects.filter(id__in=Item.objects.filter(**{field: instance}).values('cart_id')))
+    # Carts held by the cart store are repriced on their next load
+    transaction.on_commit(get_cart_store().prices_changed)
@@ -0,0 +1,445 @@
+"""Pluggable storage for the active cart.
+
+``CART_STORE`` names the backend used by the cart views and checkout:
+
+* ``DatabaseCartStore`` (default) writes every change to the ``cart``/``item``
+  tables through ``apps/cart/lines.py``.
+* ``CacheCartStore`` keeps each cart in the ``CART_STORE_CACHE`` cache alias
+  (Redis in production; locmem or file-based caches stand in for development)
+  and writes it to the tables only when an order is placed or
+  ``CART_STORE_FLUSH_SECONDS`` after its first unsaved change, so browsing and
+  editing a cart costs cache round trips instead of database writes.
+
+Lines the cache store has not written yet carry negative ids; ``flush`` returns
+the ids they were given in the database so checkout can resolve
+``selected_item_ids`` sent by a client that read the cart before the flush.
+
+A food or size price change bumps a price epoch in the cache
+(``prices_changed``); a cached cart priced under an older epoch is repriced
+when it is next loaded, so carts never flushed to the tables are covered too.
+"""
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+from .lines import (
+    LinePrice, clear_lines, current_prices, lines_total, locked_lines, merge_lines, remove_lines, replace_lines,
+    unit_price, update_lines, upsert_lines,
+)
+from .models import Cart, Item
+from .operations import apply_operations, diff_lines
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CartLine:
+    id: int
+    food_id: int
+    food_option_id: Optional[int]
+    quantity: int
+    item_note: Optional[str]
+    unit_price: Decimal
+    # Pricing snapshot written with the line (``apps/cart/lines.py``)
+    price: Optional[LinePrice] = None
+
+    @property
+    def key(self):
+        return (self.food_id, self.food_option_id)
+
+
+@dataclass
+class CartState:
+    id: Optional[int]
+    total_money: Decimal
+    lines: List[CartLine] = field(default_factory=list)
+    # Cache store bookkeeping
+    dirty: bool = False
+    next_id: int = -1
+    id_map: Dict[int, int] = field(default_factory=dict)
+    prices_epoch: int = 0
+
+
+def _line(item):
+    return CartLine(
+        id=item.id, food_id=item.food_id, food_option_id=item.food_option_id,
+        quantity=item.quantity, item_note=item.item_note, unit_price=item.unit_price,
+        price=LinePrice(item.food_price, item.food_option_price, item.price_version),
+    )
+
+
+def _item(cart, line, **fields):
+    """Unsaved ``Item`` for a cached line, with its pricing snapshot."""
+    if line.price is not None:
+        fields.update(line.price._asdict())
+    return Item(
+        cart=cart, food_id=line.food_id, food_option_id=line.food_option_id,
+        quantity=line.quantity, item_note=line.item_note, **fields,
+    )
+
+
+def read_state(user_id):
+    """The cart of ``user_id`` as stored in the database, or None."""
+    cart = Cart.objects.filter(user_id=user_id).first()
+    if cart is None:
+        return None
+    items = Item.objects.filter(cart=cart).annotate(unit_price=unit_price()).order_by('id')
+    return CartState(id=cart.id, total_money=cart.total_money, lines=[_line(item) for item in items])
+
+
+class DatabaseCartStore:
+    """Every change is written to the ``cart``/``item`` tables."""
+
+    def load(self, user):
+        return read_state(user.id)
+
+    def add(self, user, lines, prices):
+        """Add ``(food_id, food_option_id, quantity, item_note)`` lines priced by ``prices`` (``LinePrice`` per key).
+
+        Returns ``{(food_id, food_option_id): stored quantity}`` and the new total.
+        """
+        cart, _ = Cart.objects.get_or_create(user=user)
+        with transaction.atomic():
+            return upsert_lines(cart.id, lines, prices)
+
+    def update(self, user, food_id, quantity=None, item_note=None):
+        """Set quantity and/or note on the lines of ``food_id``; return them and the total.
+
+        Raises ``Cart.DoesNotExist`` without a cart; no lines means ``([], total)``.
+        """
+        cart = Cart.objects.get(user=user)
+        with transaction.atomic():
+            # Lock the lines so the total delta is computed from their current quantity
+            locked = locked_lines(cart.id, food_id=food_id)
+            if not locked:
+                return [], cart.total_money
+            rows, total = update_lines(cart.id, locked, quantity=quantity, item_note=item_note)
+        locked = {item.id: _line(item) for item in locked}
+        return [
+            CartLine(unit_price=locked[row['id']].unit_price, price=locked[row['id']].price, **row) for row in rows
+        ], total
+
+    def remove(self, user, food_id):
+        """Remove the lines of ``food_id``; return how many there were."""
+        cart = Cart.objects.get(user=user)
+        with transaction.atomic():
+            locked = locked_lines(cart.id, food_id=food_id)
+            if locked:
+                remove_lines(cart.id, [item.id for item in locked], -lines_total(locked))
+        return len(locked)
+
+    def clear(self, user):
+        cart = Cart.objects.get(user=user)
+        with transaction.atomic():
+            clear_lines(cart.id)
+
+    def apply(self, user, operations, prices):
+        """Apply a batch of operations (``apps/cart/operations.py``); return the new cart state.
+
+        The lines are locked and changed in memory, then the difference is
+        written with one DELETE and one upsert per index, and the total moved once.
+        """
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user=user)
+            before = [_line(item) for item in locked_lines(cart.id)]
+            provisional = itertools.count(-1, -1)
+            after = apply_operations(
+                [replace(line) for line in before], operations, prices,
+                lambda food_id, food_option_id, price: CartLine(
+                    next(provisional), food_id, food_option_id, 0, None, price.unit_price, price,
+                ),
+            )
+            remove_ids, writes, delta = diff_lines(before, after)
+            total = cart.total_money
+            if remove_ids or writes:
+                rows, total = replace_lines(cart.id, remove_ids, writes, delta)
+                ids = {(row['food_id'], row['food_option_id']): row['id'] for row in rows}
+                for line in after:
+                    line.id = ids.get(line.key, line.id)
+        return CartState(id=cart.id, total_money=total, lines=after)
+
+    def flush(self, user):
+        """Write pending changes to the database; return ``{provisional id: item id}``."""
+        return {}
+
+    def discard_ordered(self, user, cart_id, item_ids=None, delta=Decimal('0')):
+        """Remove ordered lines (all when ``item_ids`` is None) inside the checkout transaction."""
+        if item_ids is None:
+            clear_lines(cart_id)
+        else:
+            remove_lines(cart_id, item_ids, delta)
+
+    def prices_changed(self):
+        """A food or size price changed; the tables are repriced by ``signals.reprice_carts``."""
+
+
+class CacheCartStore(DatabaseCartStore):
+    """Carts live in a cache and are written to the database at checkout or after a delay."""
+
+    lock_timeout = 5
+    lock_wait = 2.0
+
+    _timers = {}
+    _timers_lock = threading.Lock()
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'CART_STORE_CACHE', 'default')]
+        self.flush_after = float(getattr(settings, 'CART_STORE_FLUSH_SECONDS', 30))
+        self.ttl = int(getattr(settings, 'CART_STORE_TTL_SECONDS', 7 * 24 * 3600))
+
+    epoch_key = 'cart-prices-epoch'
+
+    def _key(self, user_id):
+        return f'cart:{user_id}'
+
+    @contextmanager
+    def _lock(self, user_id):
+        """Serialize changes to one cart across processes with an ``add``-based lock."""
+        key, token = f'cart-lock:{user_id}', uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_wait
+        while not self.cache.add(key, token, self.lock_timeout):
+            if time.monotonic() > deadline:
+                raise TimeoutError('Giỏ hàng đang được cập nhật, vui lòng thử lại')
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            if self.cache.get(key) == token:
+                self.cache.delete(key)
+
+    def _get(self, user_id):
+        """The cached cart, loaded from the tables on a miss and repriced after a price change."""
+        cached = self.cache.get_many([self._key(user_id), self.epoch_key])
+        state, epoch = cached.get(self._key(user_id)), cached.get(self.epoch_key, 0)
+        if state is None:
+            state = read_state(user_id)
+            if state is not None:
+                state.prices_epoch = epoch
+                self.cache.set(self._key(user_id), state, self.ttl)
+        elif getattr(state, 'prices_epoch', 0) != epoch:
+            self._reprice(state)
+            state.prices_epoch = epoch
+            self.cache.set(self._key(user_id), state, self.ttl)
+        elif self._snapshot_prices(state):
+            self.cache.set(self._key(user_id), state, self.ttl)
+        return state
+
+    def _reprice(self, state):
+        """Recompute line unit prices and the total at current prices, like ``repair_totals``.
+
+        Snapshots are kept so the cart still reports the lines whose price changed.
+        """
+        prices = current_prices(line.key for line in state.lines)
+        for line in state.lines:
+            price = prices.get(line.key)
+            if price is None:
+                continue
+            line.unit_price = price.unit_price
+            if line.price is None:
+                line.price = price
+        state.total_money = sum((line.unit_price * line.quantity for line in state.lines), Decimal('0'))
+
+    def prices_changed(self):
+        self.cache.add(self.epoch_key, 0, None)
+        self.cache.incr(self.epoch_key)
+
+    def _snapshot_prices(self, state):
+        """Price lines cached before lines carried a pricing snapshot; return whether any changed."""
+        missing = [line for line in state.lines if line.price is None]
+        if not missing:
+            return False
+        prices = current_prices(line.key for line in missing)
+        for line in missing:
+            line.price = prices.get(line.key)
+        return True
+
+    def _save(self, user_id, state):
+        self.cache.set(self._key(user_id), state, self.ttl)
+        if state.dirty:
+            self._schedule_flush(user_id)
+
+    def load(self, user):
+        return self._get(user.id)
+
+    def add(self, user, lines, prices):
+        with self._lock(user.id):
+            state = self._get(user.id) or CartState(id=None, total_money=Decimal('0'))
+            by_key = {line.key: line for line in state.lines}
+            delta = Decimal('0')
+            for food_id, food_option_id, quantity, item_note in merge_lines(lines):
+                price = prices[(food_id, food_option_id)]
+                delta += price.unit_price * quantity
+                line = by_key.get((food_id, food_option_id))
+                if line is None:
+                    line = CartLine(state.next_id, food_id, food_option_id, 0, None, price.unit_price)
+                    state.next_id -= 1
+                    state.lines.append(line)
+                    by_key[line.key] = line
+                line.price, line.unit_price = price, price.unit_price
+                line.quantity += quantity
+                line.item_note = item_note or line.item_note
+            state.total_money += delta
+            state.dirty = True
+            self._save(user.id, state)
+        return {key: line.quantity for key, line in by_key.items()}, state.total_money
+
+    def update(self, user, food_id, quantity=None, item_note=None):
+        with self._lock(user.id):
+            state = self._get(user.id)
+            if state is None:
+                raise Cart.DoesNotExist
+            lines = [line for line in state.lines if line.food_id == int(food_id)]
+            for line in lines:
+                if quantity is not None:
+                    state.total_money += line.unit_price * (quantity - line.quantity)
+                    line.quantity = quantity
+                if item_note is not None:
+                    line.item_note = item_note
+            if lines:
+                state.dirty = True
+                self._save(user.id, state)
+        return lines, state.total_money
+
+    def remove(self, user, food_id):
+        with self._lock(user.id):
+            state = self._get(user.id)
+            if state is None:
+                raise Cart.DoesNotExist
+            removed = [line for line in state.lines if line.food_id == int(food_id)]
+            if removed:
+                state.lines = [line for line in state.lines if line.food_id != int(food_id)]
+                state.total_money -= sum((line.unit_price * line.quantity for line in removed), Decimal('0'))
+                state.dirty = True
+                self._save(user.id, state)
+        return len(removed)
+
+    def clear(self, user):
+        with self._lock(user.id):
+            state = self._get(user.id)
+            if state is None:
+                raise Cart.DoesNotExist
+            state.lines = []
+            state.total_money = Decimal('0')
+            state.dirty = True
+            self._save(user.id, state)
+
+    def apply(self, user, operations, prices):
+        with self._lock(user.id):
+            state = self._get(user.id) or CartState(id=None, total_money=Decimal('0'))
+            before = [replace(line) for line in state.lines]
+
+            def new_line(food_id, food_option_id, price):
+                line = CartLine(state.next_id, food_id, food_option_id, 0, None, price.unit_price, price)
+                state.next_id -= 1
+                return line
+
+            state.lines = apply_operations(state.lines, operations, prices, new_line)
+            remove_ids, writes, delta = diff_lines(before, state.lines)
+            if remove_ids or writes:
+                state.total_money += delta
+                state.dirty = True
+                self._save(user.id, state)
+        return state
+
+    def flush(self, user):
+        return self.flush_user(user.id)
+
+    def flush_user(self, user_id):
+        """Write the cached cart to the tables in one transaction, if it has unsaved changes."""
+        with self._lock(user_id):
+            state = self.cache.get(self._key(user_id))
+            if state is None or not state.dirty:
+                return state.id_map if state else {}
+            self._snapshot_prices(state)
+            with transaction.atomic():
+                cart, _ = Cart.objects.get_or_create(user_id=user_id)
+                kept = [line for line in state.lines if line.id > 0]
+                Item.objects.filter(cart=cart).exclude(id__in=[line.id for line in kept]).delete()
+                existing = set(Item.objects.filter(cart=cart).values_list('id', flat=True))
+                Item.objects.bulk_update(
+                    [_item(cart, line, id=line.id) for line in kept if line.id in existing],
+                    ['quantity', 'item_note', 'food_price', 'food_option_price', 'price_version'],
+                )
+                # Lines added since the last flush, or deleted from the tables meanwhile
+                new_lines = [line for line in state.lines if line.id not in existing]
+                created = Item.objects.bulk_create([_item(cart, line) for line in new_lines])
+                for line, item in zip(new_lines, created):
+                    if item.pk is None:
+                        item.pk = Item.objects.filter(
+                            cart=cart, food_id=line.food_id, food_option_id=line.food_option_id,
+                        ).values_list('id', flat=True).get()
+                    state.id_map[line.id] = item.pk
+                    line.id = item.pk
+                # Exact total at current prices; deltas may have drifted in the cache
+                cart.update_total()
+            state.id = cart.id
+            state.total_money = cart.total_money
+            state.dirty = False
+            self.cache.set(self._key(user_id), state, self.ttl)
+            return state.id_map
+
+    def discard_ordered(self, user, cart_id, item_ids=None, delta=Decimal('0')):
+        super().discard_ordered(user, cart_id, item_ids, delta)
+        transaction.on_commit(lambda: self._discard_cached(user.id, item_ids))
+
+    def _discard_cached(self, user_id, item_ids):
+        """Drop the ordered lines from the cached cart, keeping lines added since checkout flushed it."""
+        try:
+            with self._lock(user_id):
+                state = self.cache.get(self._key(user_id))
+                if state is None:
+                    return
+                # Without ``item_ids`` every flushed line was ordered
+                ordered_ids = {line.id for line in state.lines if line.id > 0} if item_ids is None else set(item_ids)
+                ordered = [line for line in state.lines if line.id in ordered_ids]
+                if ordered:
+                    state.lines = [line for line in state.lines if line.id not in ordered_ids]
+                    state.total_money -= sum((line.unit_price * line.quantity for line in ordered), Decimal('0'))
+                    self._save(user_id, state)
+        except TimeoutError:
+            # Reloading from the tables is still correct, it only loses unsaved changes
+            logger.warning('Cart of user %s locked after checkout, dropping the cached copy', user_id)
+            self.cache.delete(self._key(user_id))
+
+    def _schedule_flush(self, user_id):
+        """Flush ``flush_after`` seconds after the first unsaved change (per process)."""
+        with self._timers_lock:
+            if user_id in self._timers:
+                return
+            timer = threading.Timer(self.flush_after, self._timed_flush, args=(user_id,))
+            timer.daemon = True
+            self._timers[user_id] = timer
+        timer.start()
+
+    def _timed_flush(self, user_id):
+        with self._timers_lock:
+            self._timers.pop(user_id, None)
+        try:
+            self.flush_user(user_id)
+        except Exception:
+            logger.warning('Could not flush cart of user %s', user_id, exc_info=True)
+        finally:
+            connection.close()
+
+
+_store = None
+
+
+def get_cart_store():
+    global _store
+    if _store is None:
+        _store = import_string(getattr(settings, 'CART_STORE', None) or 'apps.cart.store.DatabaseCartStore')()
+    return _store
@@ -7,4 +7,5 @@ urlpatterns = [
     path('items/<int:food_id>/', views.update_cart_item, name='update_cart_item'),
     path('items/<int:food_id>/remove/', views.remove_from_cart, name='remove_from_cart'),
     path('clear/', views.clear_cart, name='clear_cart'),
+    path('batch/', views.batch_update_cart, name='batch_update_cart'),
 ]
@@ -3,10 +3,13 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from decimal import Decimal
 from django.db import connection
+from .lines import line_price
 from .models import Cart
-from apps.menu.models import Food
-import json
+from .operations import CartOperationError, added_keys, parse_operations
+from .store import get_cart_store
+from apps.menu.models import Food, FoodSize
 
 
 def dict_fetchall(cursor):
@@ -15,112 +18,129 @@ def dict_fetchall(cursor):
     return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def get_cart(request):
-    """Get user's cart with all items"""
-    print("get_cart view called!")  # Debug log
-    try:
-        # Use authenticated user
-        print(f"Using authenticated user: {request.user.username}")  # Debug log
-        
-        # Get or create cart
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        
-        # Get cart items using raw SQL with store and size information
-        with connection.cursor() as cursor:
-            cursor.execute("""
+def cart_data(cart):
+    """Response body for a ``CartState``: lines with food, store and size details"""
+    # Food, store and size details of the cart lines using raw SQL
+    food_ids = sorted({line.food_id for line in cart.lines})
+    size_ids = sorted({line.food_option_id for line in cart.lines if line.food_option_id})
+    foods, sizes = {}, {}
+    with connection.cursor() as cursor:
+        if food_ids:
+            cursor.execute(f"""
                 SELECT 
-                    i.id as item_id,
-                    i.cart_id,
-                    i.food_id,
-                    i.food_option_id,
-                    i.quantity,
-                    i.item_note,
                     f.id as food_id,
                     f.title,
                     f.description,
                     f.price,
+                    f.price_version,
                     f.image,
                     f.availability,
-                    f.store_id,
                     s.id as store_id,
                     s.store_name,
                     s.address as store_address,
                     s.latitude as store_latitude,
                     s.longitude as store_longitude,
                     s.description as store_description,
-                    s.image as store_image,
-                    fs.id as size_id,
-                    fs.size_name,
-                    fs.price as size_price
-                FROM item i
-                JOIN food f ON i.food_id = f.id
+                    s.image as store_image
+                FROM food f
                 JOIN stores s ON f.store_id = s.id
-                LEFT JOIN food_size fs ON i.food_option_id = fs.id
-                WHERE i.cart_id = %s
-                ORDER BY s.store_name, f.title
-            """, [cart.id])
-            
-            items_data = dict_fetchall(cursor)
-        
-        # Calculate totals with simplified calculation
-        total_money = 0
-        items_count = sum(item['quantity'] for item in items_data)
-        
-        # Process each item to calculate subtotal
-        for item in items_data:
-            # Calculate subtotal using simple logic
-            base_price = float(item['price'])
-            size_price = float(item['size_price']) if item['size_price'] else 0.0
-            quantity = item['quantity']
-            
-            # Subtotal = (base_price + size_price) * quantity
-            item['subtotal'] = (base_price + size_price) * quantity
-            total_money += item['subtotal']
-        
-        # Round to 3 decimal places and update cart total in database
-        cart.total_money = round(total_money, 3)
-        cart.save()
-        
-        # Format response
-        response_data = {
-            'id': cart.id,
-            'total_money': total_money,
-            'items_count': items_count,
-            'items': [{
-                'id': item['item_id'],
-                'food': {
-                    'id': item['food_id'],
-                    'title': item['title'],
-                    'description': item['description'],
-                    'price': item['price'],
-                    'image': item['image'],
-                    'availability': item['availability'],
-                    'store': {
-                        'id': item['store_id'],
-                        'store_name': item['store_name'],
-                        'address': item.get('store_address'),
-                        'latitude': item.get('store_latitude'),
-                        'longitude': item.get('store_longitude'),
-                        'description': item['store_description'],
-                        'image': item['store_image']
-                    }
-                },
-                'food_id': item['food_id'],
-                'food_option_id': item['food_option_id'],
-                'size': {
-                    'id': item['size_id'],
-                    'size_name': item['size_name'],
-                    'price': item['size_price']
-                } if item['size_id'] else None,
-                'quantity': item['quantity'],
-                'item_note': item['item_note'],
-                'subtotal': item['subtotal']
-            } for item in items_data]
-        }
+                WHERE f.id IN ({', '.join(['%s'] * len(food_ids))})
+            """, food_ids)
+            foods = {row['food_id']: row for row in dict_fetchall(cursor)}
+        if size_ids:
+            cursor.execute(
+                f"SELECT id as size_id, size_name, price as size_price FROM food_size "
+                f"WHERE id IN ({', '.join(['%s'] * len(size_ids))})",
+                size_ids
+            )
+            sizes = {row['size_id']: row for row in dict_fetchall(cursor)}
+    
+    items_data = []
+    for line in cart.lines:
+        if line.food_id not in foods:
+            continue
+        size = sizes.get(line.food_option_id, {'size_id': None, 'size_name': None, 'size_price': None})
+        items_data.append({
+            'item_id': line.id,
+            'food_option_id': line.food_option_id,
+            'quantity': line.quantity,
+            'item_note': line.item_note,
+            'snapshot': line.price,
+            **foods[line.food_id],
+            **size,
+        })
+    items_data.sort(key=lambda item: (item['store_name'] or '', item['title'] or ''))
+    
+    items_count = sum(item['quantity'] for item in items_data)
+    
+    # Subtotal = unit price * quantity, in Decimal: the line's pricing snapshot
+    # while its food's price_version still matches, else the current prices
+    for item in items_data:
+        snapshot = item['snapshot']
+        item['price_changed'] = snapshot is not None and snapshot.price_version != item['price_version']
+        if snapshot is not None and not item['price_changed']:
+            unit_price = snapshot.unit_price
+        else:
+            base_price = Decimal(str(item['price']))
+            size_price = Decimal(str(item['size_price'])) if item['size_price'] else Decimal('0')
+            unit_price = base_price + size_price
+        item['subtotal'] = unit_price * item['quantity']
+    
+    # The stored total is kept current by every cart write (apps/cart/store.py)
+    total_money = cart.total_money
+    
+    # Format response
+    response_data = {
+        'id': cart.id,
+        'total_money': total_money,
+        'items_count': items_count,
+        'items': [{
+            'id': item['item_id'],
+            'food': {
+                'id': item['food_id'],
+                'title': item['title'],
+                'description': item['description'],
+                'price': item['price'],
+                'image': item['image'],
+                'availability': item['availability'],
+                'store': {
+                    'id': item['store_id'],
+                    'store_name': item['store_name'],
+                    'address': item.get('store_address'),
+                    'latitude': item.get('store_latitude'),
+                    'longitude': item.get('store_longitude'),
+                    'description': item['store_description'],
+                    'image': item['store_image']
+                }
+            },
+            'food_id': item['food_id'],
+            'food_option_id': item['food_option_id'],
+            'size': {
+                'id': item['size_id'],
+                'size_name': item['size_name'],
+                'price': item['size_price']
+            } if item['size_id'] else None,
+            'quantity': item['quantity'],
+            'item_note': item['item_note'],
+            'subtotal': item['subtotal'],
+            'price_changed': item['price_changed']
+        } for item in items_data]
+    }
+    
+    return response_data
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_cart(request):
+    """Get user's cart with all items"""
+    try:
+        # Pure read: a user without a cart sees an empty one, nothing is written
+        cart = get_cart_store().load(request.user)
+        if cart is None:
+            return Response({'id': None, 'total_money': Decimal('0'), 'items_count': 0, 'items': []})
         
-        return Response(response_data)
+        return Response(cart_data(cart))
         
     except Exception as e:
         return Response(
@@ -146,103 +166,64 @@ def add_to_cart(request):
         )
     
     try:
-        food = get_object_or_404(Food, id=food_id)
-        
-        # Use authenticated user
-        cart, created = Cart.objects.get_or_create(user=request.user)
+        food_id = int(food_id)
+        food_option_id = int(food_option_id) if food_option_id else None
+        quantity = int(quantity)
+        toppings = {
+            int(topping_id): int(topping_quantity)
+            for topping_id, topping_quantity in (toppings or {}).items()
+            if int(topping_quantity) > 0
+        }
+    except (TypeError, ValueError, AttributeError):
+        return Response(
+            {'error': 'food_id, food_option_id, quantity and toppings must be numbers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        # Main food and every topping in one lookup
+        foods = Food.objects.in_bulk([food_id, *toppings])
+        food = foods.get(food_id)
+        if food is None:
+            raise Food.DoesNotExist
+        missing = [topping_id for topping_id in toppings if topping_id not in foods]
+        if missing:
+            return Response(
+                {'error': f'Topping not found: {missing}'},
+                status=status.HTTP_404_NOT_FOUND
+            )
         
-        # Add main food item
-        with connection.cursor() as cursor:
-            # Check if exact item exists (same food_id and food_option_id)
-            if food_option_id:
-                cursor.execute("""
-                    SELECT id, quantity FROM item 
-                    WHERE cart_id = %s AND food_id = %s AND food_option_id = %s
-                """, [cart.id, food_id, food_option_id])
-            else:
-                cursor.execute("""
-                    SELECT id, quantity FROM item 
-                    WHERE cart_id = %s AND food_id = %s AND food_option_id IS NULL
-                """, [cart.id, food_id])
-            
-            result = cursor.fetchone()
-            
-            if result:
-                # Update existing main item
-                item_id, current_quantity = result
-                new_quantity = current_quantity + quantity
-                
-                if item_note:
-                    cursor.execute(
-                        "UPDATE item SET quantity = %s, item_note = %s WHERE id = %s",
-                        [new_quantity, item_note, item_id]
-                    )
-                else:
-                    cursor.execute(
-                        "UPDATE item SET quantity = %s WHERE id = %s",
-                        [new_quantity, item_id]
-                    )
-                
-                message = f'Updated {food.title} quantity in cart'
-                main_quantity = new_quantity
-            else:
-                # Insert new main item
-                if food_option_id:
-                    cursor.execute("""
-                        INSERT INTO item (cart_id, food_id, food_option_id, quantity, item_note) 
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, [cart.id, food_id, food_option_id, quantity, item_note])
-                else:
-                    cursor.execute("""
-                        INSERT INTO item (cart_id, food_id, quantity, item_note) 
-                        VALUES (%s, %s, %s, %s)
-                    """, [cart.id, food_id, quantity, item_note])
-                
-                main_quantity = quantity
-                message = f'Added {food.title} to cart'
+        prices = {(topping_id, None): line_price(foods[topping_id]) for topping_id in toppings}
+        prices[(food.id, None)] = line_price(food)
+        if food_option_id:
+            size = FoodSize.objects.filter(id=food_option_id, food_id=food.id).first()
+            if size is None:
+                return Response(
+                    {'error': 'Food size not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            prices[(food.id, food_option_id)] = line_price(food, size)
         
-        # Add each topping as a separate item
-        topping_items = []
-        if toppings:
-            for topping_id, topping_quantity in toppings.items():
-                if topping_quantity > 0:
-                    topping_food = get_object_or_404(Food, id=int(topping_id))
-                    
-                    with connection.cursor() as cursor:
-                        # Check if topping already exists in cart
-                        cursor.execute("""
-                            SELECT id, quantity FROM item 
-                            WHERE cart_id = %s AND food_id = %s AND food_option_id IS NULL
-                        """, [cart.id, topping_id])
-                        
-                        topping_result = cursor.fetchone()
-                        
-                        if topping_result:
-                            # Update existing topping
-                            topping_item_id, current_topping_qty = topping_result
-                            new_topping_qty = current_topping_qty + topping_quantity
-                            cursor.execute(
-                                "UPDATE item SET quantity = %s WHERE id = %s",
-                                [new_topping_qty, topping_item_id]
-                            )
-                        else:
-                            # Insert new topping
-                            cursor.execute("""
-                                INSERT INTO item (cart_id, food_id, quantity) 
-                                VALUES (%s, %s, %s)
-                            """, [cart.id, topping_id, topping_quantity])
-                    
-                    topping_items.append({
-                        'food_id': int(topping_id),
-                        'title': topping_food.title,
-                        'quantity': topping_quantity
-                    })
+        # Main item and toppings (each a separate line), with the cart total
+        # moved by the added value
+        lines = [(food.id, food_option_id, quantity, item_note)]
+        lines += [(topping_id, None, topping_quantity, None) for topping_id, topping_quantity in toppings.items()]
+        stored, total_money = get_cart_store().add(request.user, lines, prices)
         
-        # Update cart total
-        cart.update_total()
+        main_quantity = stored[(food.id, food_option_id)]
+        if main_quantity > quantity:
+            message = f'Updated {food.title} quantity in cart'
+        else:
+            message = f'Added {food.title} to cart'
+        topping_items = [{
+            'food_id': topping_id,
+            'title': foods[topping_id].title,
+            'quantity': topping_quantity
+        } for topping_id, topping_quantity in toppings.items()]
         
         return Response({
             'message': message,
+            'total_money': total_money,
             'item': {
                 'food': {
                     'id': food.id,
@@ -275,96 +256,57 @@ def add_to_cart(request):
 def update_cart_item(request, food_id):
     """Update or delete a cart item"""
     try:
-        # Use authenticated user instead of hardcoded user
-        cart = Cart.objects.get(user=request.user)
+        store = get_cart_store()
         
-        # Check if item exists
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT quantity FROM item WHERE cart_id = %s AND food_id = %s",
-                [cart.id, food_id]
-            )
-            result = cursor.fetchone()
-            
-            if not result:
+        if request.method == 'DELETE':
+            if not store.remove(request.user, food_id):
                 return Response(
                     {'error': 'Item not found in cart'}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
-        
-        if request.method == 'DELETE':
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    "DELETE FROM item WHERE cart_id = %s AND food_id = %s",
-                    [cart.id, food_id]
-                )
-            cart.update_total()
             return Response({'message': 'Item removed from cart'})
         
-        elif request.method == 'PUT':
-            new_quantity = request.data.get('quantity')
-            item_note = request.data.get('item_note')
-            
-            # Build update query dynamically based on provided fields
-            update_fields = []
-            update_values = []
-            
-            if new_quantity is not None:
-                if new_quantity < 1:
-                    return Response(
-                        {'error': 'Quantity must be at least 1'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                update_fields.append('quantity = %s')
-                update_values.append(new_quantity)
-            
-            if item_note is not None:
-                update_fields.append('item_note = %s')
-                update_values.append(item_note)
-            
-            if not update_fields:
-                return Response(
-                    {'error': 'No fields to update'}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Add WHERE clause values
-            update_values.extend([cart.id, food_id])
-            
-            with connection.cursor() as cursor:
-                query = f"UPDATE item SET {', '.join(update_fields)} WHERE cart_id = %s AND food_id = %s"
-                cursor.execute(query, update_values)
-            
-            # Only update total if quantity changed
-            if new_quantity is not None:
-                cart.update_total()
-            
-            # Get updated item data
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    "SELECT quantity, item_note FROM item WHERE cart_id = %s AND food_id = %s",
-                    [cart.id, food_id]
-                )
-                updated_item = cursor.fetchone()
-            
-            # Get food details
-            food = get_object_or_404(Food, id=food_id)
-            
-            return Response({
-                'message': 'Cart item updated',
-                'item': {
-                    'food': {
-                        'id': food.id,
-                        'title': food.title,
-                        'price': food.price,
-                        'image': food.image
-                    },
-                    'food_id': food.id,
-                    'quantity': updated_item[0],
-                    'item_note': updated_item[1],
-                    'subtotal': food.price * updated_item[0]
-                }
-            })
+        new_quantity = request.data.get('quantity')
+        item_note = request.data.get('item_note')
+        
+        if new_quantity is not None and new_quantity < 1:
+            return Response(
+                {'error': 'Quantity must be at least 1'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if new_quantity is None and item_note is None:
+            return Response(
+                {'error': 'No fields to update'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        updated, total_money = store.update(request.user, food_id, quantity=new_quantity, item_note=item_note)
+        if not updated:
+            return Response(
+                {'error': 'Item not found in cart'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        # Get food details
+        food = get_object_or_404(Food, id=food_id)
+        updated_item = updated[0]
+        
+        return Response({
+            'message': 'Cart item updated',
+            'total_money': total_money,
+            'item': {
+                'food': {
+                    'id': food.id,
+                    'title': food.title,
+                    'price': food.price,
+                    'image': food.image
+                },
+                'food_id': food.id,
+                'quantity': updated_item.quantity,
+                'item_note': updated_item.item_note,
+                'subtotal': updated_item.unit_price * updated_item.quantity
+            }
+        })
             
     except Cart.DoesNotExist:
         return Response(
@@ -383,30 +325,13 @@ def update_cart_item(request, food_id):
 def remove_from_cart(request, food_id):
     """Remove item from cart"""
     try:
-        # Use authenticated user
-        cart = Cart.objects.get(user=request.user)
-        
-        with connection.cursor() as cursor:
-            # Check if item exists
-            cursor.execute(
-                "SELECT quantity FROM item WHERE cart_id = %s AND food_id = %s",
-                [cart.id, food_id]
-            )
-            result = cursor.fetchone()
-            
-            if not result:
-                return Response(
-                    {'error': 'Item not found in cart'}, 
-                    status=status.HTTP_404_NOT_FOUND
-                )
-            
-            # Delete item
-            cursor.execute(
-                "DELETE FROM item WHERE cart_id = %s AND food_id = %s",
-                [cart.id, food_id]
+        # Delete item and take its value off the total
+        if not get_cart_store().remove(request.user, food_id):
+            return Response(
+                {'error': 'Item not found in cart'}, 
+                status=status.HTTP_404_NOT_FOUND
             )
         
-        cart.update_total()
         return Response({'message': 'Item removed from cart'})
         
     except Cart.DoesNotExist:
@@ -426,16 +351,7 @@ def remove_from_cart(request, food_id):
 def clear_cart(request):
     """Clear all items from cart"""
     try:
-        # Use authenticated user
-        cart = Cart.objects.get(user=request.user)
-        
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "DELETE FROM item WHERE cart_id = %s",
-                [cart.id]
-            )
-        
-        cart.update_total()
+        get_cart_store().clear(request.user)
         return Response({'message': 'Cart cleared'})
         
     except Cart.DoesNotExist:
@@ -443,3 +359,49 @@ def clear_cart(request):
             {'error': 'Cart not found'}, 
             status=status.HTTP_404_NOT_FOUND
         )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_update_cart(request):
+    """Apply a list of add/set/remove operations in one transaction and return the cart"""
+    try:
+        operations = parse_operations(request.data.get('operations'))
+        
+        # Prices of every line the batch may add: foods and sizes in one lookup each
+        keys = added_keys(operations)
+        food_ids = {food_id for food_id, _ in keys}
+        foods = Food.objects.in_bulk(food_ids) if food_ids else {}
+        missing = sorted(food_ids - set(foods))
+        if missing:
+            return Response(
+                {'error': f'Food item not found: {missing}'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        size_ids = {food_option_id for _, food_option_id in keys if food_option_id}
+        sizes = FoodSize.objects.in_bulk(size_ids) if size_ids else {}
+        prices = {}
+        for food_id, food_option_id in keys:
+            size = None
+            if food_option_id:
+                size = sizes.get(food_option_id)
+                if size is None or size.food_id != food_id:
+                    return Response(
+                        {'error': 'Food size not found'},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+            prices[(food_id, food_option_id)] = line_price(foods[food_id], size)
+        
+        cart = get_cart_store().apply(request.user, operations, prices)
+        return Response(cart_data(cart))
+        
+    except CartOperationError as e:
+        error = {'error': str(e)}
+        if e.index is not None:
+            error['operation'] = e.index
+        return Response(error, status=e.status_code)
+    except Exception as e:
+        return Response(
+            {'error': str(e)}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
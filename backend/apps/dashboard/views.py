@@ -1,7 +1,7 @@
 from datetime import timedelta, datetime, date
 from decimal import Decimal
 
-from django.db.models import Avg, Count, DecimalField, F, OuterRef, Subquery, Sum, Value, ExpressionWrapper
+from django.db.models import Avg, Count, DecimalField, F, OuterRef, Prefetch, Q, Subquery, Sum, Value, ExpressionWrapper
 from django.db.models.functions import Coalesce, TruncDay, TruncMonth, ExtractHour
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
@@ -14,11 +14,10 @@ from rest_framework.views import APIView
 
 from apps.authentication.models import User
 from apps.menu.models import Food
-from apps.orders.models import Order, OrderDetail
+from apps.orders.models import CANCELLED_STATUSES, Order, OrderDetail
 from apps.ratings.models import RatingFood
 from apps.stores.models import Store
 
-CANCELLED_STATUSES = ['Đã hủy', 'Đã huỷ']
 DELIVERY_CANCELLED_STATUSES = ['Đã huỷ', 'Đã hủy']
 PROCESSING_STATUSES = ['Chờ xác nhận', 'Đã xác nhận', 'Đang chuẩn bị', 'Sẵn sàng', 'Đang giao']
 SUCCESS_STATUSES = ['Đã giao', 'DELIVERED']
@@ -241,8 +240,12 @@ def store_dashboard_metrics(request, store_id):
         )
     )['total'] or Decimal('0')
 
-    total_foods = Food.objects.filter(store=store).count()
-    available_foods = Food.objects.filter(store=store, availability='Còn hàng').count()
+    food_counts = Food.objects.filter(store=store).aggregate(
+        total=Count('id'),
+        available=Count('id', filter=Q(availability='Còn hàng')),
+    )
+    total_foods = food_counts['total']
+    available_foods = food_counts['available']
 
     yesterday_start = start_of_day - timedelta(days=1)
     yesterday_end = start_of_day - timedelta(microseconds=1)
@@ -265,6 +268,9 @@ def store_dashboard_metrics(request, store_id):
     )
     average_rating = round(rating_stats['average'] or 0, 1) if rating_stats.get('average') else 0
     total_ratings = rating_stats.get('total') or 0
+    rating_counts = dict(
+        store_ratings.filter(rating__in=range(1, 6)).values('rating').annotate(count=Count('id')).values_list('rating', 'count')
+    )
 
     labels, weekly_totals = _build_weekly_series(active_orders, start_of_day)
 
@@ -340,10 +346,14 @@ def store_dashboard_metrics(request, store_id):
     ]
 
     recent_orders = []
-    for order in active_orders.order_by('-created_date')[:5]:
-        details = list(order.details.all()[:3])
+    recent = active_orders.select_related('user').prefetch_related(
+        Prefetch('details', queryset=OrderDetail.objects.select_related('food').order_by('id'))
+    ).order_by('-created_date')[:5]
+    for order in recent:
+        all_details = list(order.details.all())
+        details = all_details[:3]
         items_summary = ', '.join(f"{detail.food.title} x{detail.quantity}" for detail in details)
-        if order.details.count() > len(details):
+        if len(all_details) > len(details):
             items_summary += '...'
         recent_orders.append({
             'order_id': order.id,
@@ -423,15 +433,15 @@ def store_dashboard_metrics(request, store_id):
                 'food': rating.food.title,
                 'id': rating.id,
             }
-            for rating in RatingFood.objects.filter(food__store=store).order_by('-id')[:5]
+            for rating in store_ratings.select_related('user', 'food').order_by('-id')[:5]
         ],
         'rating_radar': [
-            {'score': score, 'count': RatingFood.objects.filter(food__store=store, rating=score).count()}
+            {'score': score, 'count': rating_counts.get(score, 0)}
             for score in range(1, 6)
         ],
         'availability': {
-            'in_stock': Food.objects.filter(store=store, availability='Còn hàng').count(),
-            'total': Food.objects.filter(store=store).count(),
+            'in_stock': available_foods,
+            'total': total_foods,
         },
     }
 
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-17 00:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_remove_food_is_topping'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='food',
+            name='price_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -22,6 +22,9 @@ class Food(models.Model):
     availability = models.CharField(max_length=50, default='Còn hàng')
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='foods', db_column='cate_id')
     store = models.ForeignKey('stores.Store', on_delete=models.CASCADE, related_name='foods', db_column='store_id', null=True, blank=True)
+    # Bumped whenever the price of the food or one of its sizes changes; cart
+    # lines store the version they were priced at (apps/cart/lines.py)
+    price_version = models.PositiveIntegerField(default=1)
     # created_date = models.DateTimeField(default=timezone.now)  # Temporarily commented out
     
     class Meta:
@@ -29,6 +32,40 @@ class Food(models.Model):
     
     def __str__(self):
         return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_price = getattr(instance, 'price', None) if 'price' in field_names else None
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            self._loaded_price = self.price
+            return
+        # Written as an expression so a save never puts back a version that a
+        # concurrent size price change has bumped meanwhile
+        loaded_version = self.price_version
+        price_changed = getattr(self, '_loaded_price', None) is not None and self.price != self._loaded_price
+        # Read by post_save receivers (apps/cart/signals.py)
+        self._price_changed = price_changed
+        self.price_version = models.F('price_version') + (1 if price_changed else 0)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and price_changed:
+            kwargs['update_fields'] = {*update_fields, 'price_version'}
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            self.price_version = loaded_version
+        if price_changed:
+            self.refresh_from_db(fields=['price_version'])
+        self._loaded_price = self.price
+
+    @classmethod
+    def bump_price_version(cls, food_id):
+        """Mark the cart lines priced from ``food_id`` stale, e.g. after a size price change"""
+        cls.objects.filter(pk=food_id).update(price_version=models.F('price_version') + 1)
     
     @property
     def average_rating(self):
@@ -63,3 +100,18 @@ class FoodSize(models.Model):
     
     def __str__(self):
         return f"{self.food.title} - {self.size_name}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_price = getattr(instance, 'price', None) if 'price' in field_names else None
+        return instance
+
+    def save(self, *args, **kwargs):
+        loaded_price = getattr(self, '_loaded_price', None)
+        # Read by post_save receivers (apps/cart/signals.py)
+        self._price_changed = loaded_price is not None and self.price != loaded_price
+        super().save(*args, **kwargs)
+        if self._price_changed:
+            Food.bump_price_version(self.food_id)
+        self._loaded_price = self.price
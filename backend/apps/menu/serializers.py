@@ -1,9 +1,69 @@
 from rest_framework import serializers
+from django.db import models
+from django.db.models import prefetch_related_objects
 from .models import Category, Food, FoodSize
 from apps.stores.serializers import StoreSerializer
 from django.conf import settings
 
 
+def annotate_category_food_counts(foods):
+    """Preload ``foods_count`` for the categories of ``foods`` with one grouped query."""
+    from django.db.models import Count
+
+    categories = [food.category for food in foods if food.category_id is not None]
+    if not categories:
+        return
+    counts = dict(
+        Food.objects.filter(category_id__in={category.id for category in categories})
+        .values_list('category_id')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    for category in categories:
+        category.foods_count_preloaded = counts.get(category.id, 0)
+
+
+def attach_rating_stats(foods):
+    """Set ``avg_rating``/``rating_count_annotated`` on ``foods`` with one grouped query.
+
+    Foods that already carry the annotation (e.g. from ``food_detail``) are left alone.
+    """
+    from django.db.models import Avg, Count
+    from apps.ratings.models import RatingFood
+
+    pending = [food for food in foods if not hasattr(food, 'avg_rating')]
+    if not pending:
+        return
+    stats = {
+        food_id: (avg, count)
+        for food_id, avg, count in RatingFood.objects.filter(food_id__in={food.id for food in pending})
+        .values_list('food_id')
+        .annotate(avg=Avg('rating'), count=Count('id'))
+        .order_by()
+    }
+    for food in pending:
+        avg, count = stats.get(food.id, (None, 0))
+        food.avg_rating = avg if avg is not None else 0.0
+        food.rating_count_annotated = count
+
+
+def prepare_food_page(foods):
+    """Load what the food serializers read for a page of foods in a fixed number of queries."""
+    foods = list(foods)
+    prefetch_related_objects(foods, 'category', 'store__manager', 'sizes')
+    attach_rating_stats(foods)
+    annotate_category_food_counts(foods)
+    return foods
+
+
+class FoodPageSerializer(serializers.ListSerializer):
+    """``FoodSerializer``/``FoodListSerializer`` with ``many=True``: ratings and relations loaded per page."""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        return [self.child.to_representation(food) for food in prepare_food_page(iterable)]
+
+
 class CategorySerializer(serializers.ModelSerializer):
     name = serializers.CharField(source='cate_name')  # Map cate_name to name for frontend
     foods_count = serializers.SerializerMethodField()
@@ -14,6 +74,10 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'cate_name', 'image', 'image_url', 'foods_count']
     
     def get_foods_count(self, obj):
+        # Use the count preloaded for a whole page when available (see annotate_category_food_counts)
+        preloaded = getattr(obj, 'foods_count_preloaded', None)
+        if preloaded is not None:
+            return preloaded
         return obj.foods.count()  # Count all foods regardless of availability
     
     def get_image_url(self, obj):
@@ -58,6 +122,7 @@ class FoodSerializer(serializers.ModelSerializer):
             'sizes', 'average_rating', 'rating_count'
         ]
         read_only_fields = ['id']
+        list_serializer_class = FoodPageSerializer
         extra_kwargs = {
             'category': {'write_only': True, 'required': False},  # Allow frontend to send 'category' field
         }
@@ -104,6 +169,7 @@ class FoodListSerializer(serializers.ModelSerializer):
             'category', 'category_name', 'store', 'store_name', 'availability',
             'sizes', 'average_rating', 'rating_count'
         ]
+        list_serializer_class = FoodPageSerializer
     
     from django.conf import settings  # ensure settings import for MEDIA_URL
     def get_image_url(self, obj):
@@ -11,6 +11,15 @@ from .models import Category, Food, FoodSize
 from .serializers import CategorySerializer, FoodSerializer, FoodListSerializer, FoodSizeSerializer
 from apps.stores.models import Store
 from apps.stores.serializers import StoreSerializer
+from apps.utils.pagination import InvalidCursor, cursor_page_fields, paginate_keyset, wants_cursor
+
+# Sort options of food_list; each ends with id so cursor pages are stable
+FOOD_SORTS = {
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    'name': ('title', 'id'),
+    'created_date': ('-id',),  # Use id as proxy for creation order
+}
 
 
 def _build_media_url(request, file_field):
@@ -141,14 +150,8 @@ def food_list(request):
     """Get foods with filters and pagination"""
     try:
         # Include all foods regardless of availability; frontend will handle disabled state
-        # Prefetch ratings to compute average_rating and rating_count
-        # Fetch foods without prefetching ratings to avoid missing column errors
-        foods = Food.objects.select_related('category', 'store')\
-            .annotate(
-                avg_rating=Coalesce(Avg('ratings__rating'), Value(0.0)),
-                rating_count_annotated=Count('ratings')
-            )\
-            .all()
+        # average_rating/rating_count are loaded for the page's rows only (FoodPageSerializer)
+        foods = Food.objects.select_related('category', 'store')
 
         # Filter by category
         category_id = request.GET.get('category')
@@ -175,18 +178,9 @@ def food_list(request):
         if max_price:
             foods = foods.filter(price__lte=max_price)
 
-        # Sort
-        sort_by = request.GET.get('sort', 'id')
-        if sort_by == 'price_asc':
-            foods = foods.order_by('price')
-        elif sort_by == 'price_desc':
-            foods = foods.order_by('-price')
-        elif sort_by == 'name':
-            foods = foods.order_by('title')
-        elif sort_by == 'created_date':
-            foods = foods.order_by('-id')  # Use id as proxy for creation order
-        else:
-            foods = foods.order_by('-id')  # Default to newest first by id
+        # Sort (default: newest first by id)
+        ordering = FOOD_SORTS.get(request.GET.get('sort', 'id'), ('-id',))
+        foods = foods.order_by(*ordering)
 
         # Pagination
         try:
@@ -198,9 +192,15 @@ def food_list(request):
         except ValueError:
             page_size = 12
 
-        # Convert to list to preserve annotations before pagination
-        foods_list = list(foods)
-        paginator = Paginator(foods_list, page_size)
+        if wants_cursor(request):
+            try:
+                cursor_page = paginate_keyset(request, foods, ordering, page_size)
+            except InvalidCursor as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            serializer = FoodListSerializer(cursor_page.items, many=True, context={'request': request})
+            return Response({'results': serializer.data, **cursor_page_fields(request, cursor_page, foods)})
+
+        paginator = Paginator(foods, page_size)
         page_obj = paginator.get_page(page)
 
         serializer = FoodListSerializer(page_obj, many=True, context={'request': request})
@@ -245,18 +245,12 @@ def category_foods(request, category_id):
     except Category.DoesNotExist:
         return Response({'error': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
     try:
-        # Include all foods in category regardless of availability, prefetch ratings
-        foods = Food.objects.filter(category=category)\
-            .annotate(
-                avg_rating=Coalesce(Avg('ratings__rating'), Value(0.0)),
-                rating_count_annotated=Count('ratings')
-            )
+        # Include all foods in category regardless of availability
+        foods = Food.objects.filter(category=category).select_related('category', 'store').order_by('id')
         # Pagination
         page = int(request.GET.get('page', 1)) if request.GET.get('page') else 1
         page_size = int(request.GET.get('page_size', 12)) if request.GET.get('page_size') else 12
-        # Convert to list to preserve annotations before pagination
-        foods_list = list(foods)
-        paginator = Paginator(foods_list, page_size)
+        paginator = Paginator(foods, page_size)
         page_obj = paginator.get_page(page)
 
         serializer = FoodListSerializer(page_obj, many=True, context={'request': request})
@@ -288,13 +282,7 @@ def store_foods_list(request):
         return Response({'error': 'Store not found for user'}, status=status.HTTP_404_NOT_FOUND)
     
     # Get all foods for this store
-    foods = Food.objects.filter(store=user_store)\
-        .select_related('category', 'store')\
-        .annotate(
-            avg_rating=Coalesce(Avg('ratings__rating'), Value(0.0)),
-            rating_count_annotated=Count('ratings')
-        )\
-        .order_by('-id')
+    foods = Food.objects.filter(store=user_store).select_related('category', 'store').order_by('-id')
     
     # Search filter
     search = request.GET.get('search')
@@ -317,10 +305,21 @@ def store_foods_list(request):
         page_size = int(request.GET.get('page_size', 12))
     except ValueError:
         page_size = 12
+
+    store_info = {'id': user_store.id, 'name': user_store.store_name}
+    if wants_cursor(request):
+        try:
+            cursor_page = paginate_keyset(request, foods, ('-id',), page_size)
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = FoodListSerializer(cursor_page.items, many=True, context={'request': request})
+        return Response({
+            'results': serializer.data,
+            **cursor_page_fields(request, cursor_page, foods),
+            'store': store_info,
+        })
     
-    # Convert to list to preserve annotations before pagination
-    foods_list = list(foods)
-    paginator = Paginator(foods_list, page_size)
+    paginator = Paginator(foods, page_size)
     page_obj = paginator.get_page(page)
     
     serializer = FoodListSerializer(page_obj, many=True, context={'request': request})
@@ -333,10 +332,7 @@ def store_foods_list(request):
         'next': f"?page={page_obj.next_page_number()}&page_size={page_size}" if page_obj.has_next() else None,
         'previous': f"?page={page_obj.previous_page_number()}&page_size={page_size}" if page_obj.has_previous() else None,
         'results': serializer.data,
-        'store': {
-            'id': user_store.id,
-            'name': user_store.store_name
-        }
+        'store': store_info
     })
 
 
@@ -470,10 +466,21 @@ def admin_foods_list(request):
             page_size = int(request.GET.get('page_size', 10))
         except ValueError:
             page_size = 10
+
+        if wants_cursor(request):
+            try:
+                cursor_page = paginate_keyset(request, foods, ('-id',), page_size)
+            except InvalidCursor as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            serializer = FoodSerializer(cursor_page.items, many=True)
+            return Response({
+                'results': serializer.data,
+                **cursor_page_fields(request, cursor_page, foods),
+                # Legacy key for backward compatibility
+                'foods': serializer.data,
+            })
         
-        # Convert to list to preserve annotations before pagination
-        foods_list = list(foods)
-        paginator = Paginator(foods_list, page_size)
+        paginator = Paginator(foods, page_size)
         page_obj = paginator.get_page(page)
         
         serializer = FoodSerializer(page_obj, many=True)
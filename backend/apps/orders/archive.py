@@ -0,0 +1,146 @@
+"""Hot/cold split of the order tables.
+
+Delivered and cancelled orders older than ``ORDER_ARCHIVE_AFTER_DAYS`` are moved,
+with their details and applied promos, from ``orders``/``order_detail``/
+``order_promo`` into the ``*_archive`` tables by ``manage.py archive_orders``.
+Each batch is one transaction of ``INSERT ... SELECT`` plus ``DELETE``, so the
+rows never exist in both places or in neither.
+
+The live tables then hold only recent and in-flight orders, which is what the
+shipper, store, admin and dashboard queries scan. Customer order history and
+the order detail endpoints fall back to the archive (``find_order``,
+``OrderHistory``); archived orders are read-only.
+"""
+import heapq
+import itertools
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.promotions.order_promo import OrderPromo
+from .models import (
+    CANCELLED_STATUSES, ArchivedOrder, ArchivedOrderDetail, ArchivedOrderPromo, Order, OrderDetail,
+)
+
+# (live model, archive model), parents first
+ARCHIVED_TABLES = [
+    (Order, ArchivedOrder),
+    (OrderDetail, ArchivedOrderDetail),
+    (OrderPromo, ArchivedOrderPromo),
+]
+
+
+def archivable_orders(before=None):
+    """Delivered or cancelled orders created before ``before``, without a pending refund."""
+    if before is None:
+        before = timezone.now() - timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS)
+    return Order.objects.filter(
+        Q(order_status='Đã giao') | Q(order_status__in=CANCELLED_STATUSES),
+        created_date__lt=before,
+    ).exclude(refund_status='Chờ xử lý')
+
+
+def _copy_rows(cursor, live, archive, key, ids):
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in archive._meta.concrete_fields)
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor.execute(
+        f'INSERT INTO {connection.ops.quote_name(archive._meta.db_table)} ({columns}) '
+        f'SELECT {columns} FROM {connection.ops.quote_name(live._meta.db_table)} '
+        f'WHERE {connection.ops.quote_name(key)} IN ({placeholders})',
+        ids,
+    )
+
+
+def archive_batch(queryset, batch_size):
+    """Move up to ``batch_size`` orders of ``queryset`` to the archive; return how many moved."""
+    with transaction.atomic():
+        # Rows a concurrent request holds are left for the next run
+        ids = list(
+            queryset.order_by('id').select_for_update(skip_locked=True).values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        with connection.cursor() as cursor:
+            for live, archive in ARCHIVED_TABLES:
+                _copy_rows(cursor, live, archive, 'id' if live is Order else 'order_id', ids)
+        for live, _ in reversed(ARCHIVED_TABLES):
+            live.objects.filter(**{'id__in' if live is Order else 'order_id__in': ids}).delete()
+    return len(ids)
+
+
+def find_order(**filters):
+    """The live order matching ``filters``, else its archived copy, else None."""
+    order = Order.objects.filter(**filters).first()
+    if order is None:
+        archived = ArchivedOrder.objects.filter(**filters).first()
+        order = archived.as_order() if archived else None
+    return order
+
+
+class OrderHistory:
+    """Live and archived orders merged in one ordering, sliceable for ``Paginator``.
+
+    Both querysets must apply the same filters and the same single-field
+    ordering. Live orders are not always newer than archived ones (refunds still
+    pending, orders stuck in progress), so a page is cut from the merge of the
+    first ``stop`` keys of both sources and only its rows are loaded.
+    """
+
+    def __init__(self, live, archived):
+        self.live = live
+        self.archived = archived
+        self._live_count = None
+        self._archived_count = None
+
+    def live_count(self):
+        if self._live_count is None:
+            self._live_count = self.live.count()
+        return self._live_count
+
+    def archived_count(self):
+        if self._archived_count is None:
+            self._archived_count = self.archived.count()
+        return self._archived_count
+
+    def count(self):
+        return self.live_count() + self.archived_count()
+
+    def __len__(self):
+        return self.count()
+
+    def _ordering(self):
+        (ordering,) = self.live.query.order_by
+        assert tuple(self.archived.query.order_by) == (ordering,), 'Both sources must share one ordering'
+        return ordering.lstrip('-'), ordering.startswith('-')
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        if stop is None:
+            stop = self.count()
+        if stop <= start:
+            return []
+        # Most customers have orders in one table only
+        if not self.archived_count():
+            return list(self.live[start:stop])
+        if not self.live_count():
+            return [archived.as_order() for archived in self.archived[start:stop]]
+        field, descending = self._ordering()
+        merged = heapq.merge(
+            ((key, True, pk) for key, pk in self.live.values_list(field, 'pk')[:stop]),
+            ((key, False, pk) for key, pk in self.archived.values_list(field, 'pk')[:stop]),
+            key=lambda row: row[0], reverse=descending,
+        )
+        page = list(itertools.islice(merged, start, stop))
+        live = self.live.in_bulk([pk for _, is_live, pk in page if is_live])
+        archived = self.archived.in_bulk([pk for _, is_live, pk in page if not is_live])
+        # Rows moved or deleted between the two reads are skipped
+        return [
+            live[pk] if is_live else archived[pk].as_order()
+            for _, is_live, pk in page
+            if pk in (live if is_live else archived)
+        ]
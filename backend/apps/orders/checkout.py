@@ -0,0 +1,172 @@
+"""Batched write pipeline for the multi-store checkout in ``order_list_create``.
+
+Checkout builds every ``Order``, ``OrderDetail`` and ``OrderPromo`` row in memory
+and writes each kind with a single ``bulk_create``, so the number of round trips
+no longer grows with stores, cart lines or applied promotions.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.exceptions import ValidationError
+
+from apps.promotions.models import OrderPromo
+from .events import ORDER_CREATED, publish_orders
+from .models import Order, OrderDetail
+
+
+def build_order_details(order, store_items, prices):
+    """Build unsaved ``OrderDetail`` rows for one store's cart lines.
+
+    ``prices`` maps each cart item id to its ``LinePrice`` (``apps/cart/lines.py``).
+    """
+    details = []
+    for item_id, food_id, quantity, item_note, food_option_id in store_items:
+        price = prices[item_id]
+        details.append(OrderDetail(
+            order=order,
+            food_id=food_id,
+            food_option_id=food_option_id,
+            quantity=quantity,
+            food_price=price.food_price,
+            food_option_price=price.food_option_price if food_option_id else None,
+            food_note=item_note,
+        ))
+    return details
+
+
+def apply_promo_totals(order, allocations):
+    """Set the order's discount totals from its promo allocations, in memory.
+
+    Mirrors ``Order.recompute_aggregates(sync_discount=True)`` so the rows can be
+    bulk-created without each save re-aggregating and re-saving the order.
+    """
+    if not allocations:
+        return
+    total_discount = sum((amount for _, amount in allocations), Decimal('0'))
+    order.promo_discount_total = total_discount
+    order.promo_count = len(allocations)
+    order.total_discount = total_discount
+    order.total_after_discount = max(Decimal('0'), order.total_before_discount - total_discount)
+
+
+def apply_item_totals(order, details):
+    """Set the order's stored item aggregates from its unsaved details."""
+    order.item_count = len(details)
+    order.items_subtotal = sum(
+        ((detail.food_price + (detail.food_option_price or Decimal('0'))) * detail.quantity for detail in details),
+        Decimal('0'),
+    )
+
+
+def _coordinate_decimal(value):
+    """Convert a float coordinate to the 6-decimal precision of the order columns."""
+    if value is None:
+        return None
+    return Decimal(str(value)).quantize(Decimal('0.000001'), rounding=ROUND_HALF_UP)
+
+
+class CheckoutWriter:
+    """Builds one checkout's orders in memory and writes them in a fixed number of statements.
+
+    ``save()`` issues one INSERT for the orders, one UPDATE for ``group_id``, one
+    INSERT for all order details and one for all order promos, regardless of how
+    many stores, lines or promotions the checkout has.
+    """
+
+    def __init__(self, base_fields):
+        self.base_fields = dict(base_fields)
+        for field in ('ship_latitude', 'ship_longitude'):
+            self.base_fields[field] = _coordinate_decimal(self.base_fields.get(field))
+        self.orders = []
+        self.stores = {}
+        self.details = {}
+        self.promos = {}
+        self.group_id = None
+
+    def add_order(self, store_id, store=None, **fields):
+        order = Order(**self.base_fields, store_id=store_id, **fields)
+        self.orders.append(order)
+        self.stores[id(order)] = store
+        self.details[id(order)] = []
+        self.promos[id(order)] = []
+        return order
+
+    def add_details(self, order, store_items, prices):
+        self.details[id(order)].extend(build_order_details(order, store_items, prices))
+        apply_item_totals(order, self.details[id(order)])
+
+    def add_promos(self, order, allocations, note=''):
+        apply_promo_totals(order, allocations)
+        self.promos[id(order)].extend(
+            OrderPromo(order=order, promo=promo, applied_amount=amount, note=note)
+            for promo, amount in allocations
+        )
+
+    def validate(self):
+        """Run model field validation in memory; return an error dict or None."""
+        for order in self.orders:
+            try:
+                order.full_clean(exclude=['user', 'promo', 'shipper', 'store'], validate_unique=False)
+            except ValidationError as exc:
+                return exc.message_dict
+        return None
+
+    def save(self):
+        if not self.orders:
+            return None
+        Order.objects.bulk_create(self.orders)
+        self.group_id = self.orders[0].id
+        Order.objects.filter(id__in=[order.id for order in self.orders]).update(group_id=self.group_id)
+        for order in self.orders:
+            order.group_id = self.group_id
+
+        details = [detail for order in self.orders for detail in self.details[id(order)]]
+        promos = [promo for order in self.orders for promo in self.promos[id(order)]]
+        OrderDetail.objects.bulk_create(details)
+        if promos:
+            OrderPromo.objects.bulk_create(promos)
+        publish_orders(self.orders, ORDER_CREATED)
+        return self.group_id
+
+    def response_data(self):
+        """Compact representation of the created orders, built without further queries."""
+        data = []
+        for order in self.orders:
+            store = self.stores[id(order)]
+            data.append({
+                'id': order.id,
+                'group_id': order.group_id,
+                'store_id': order.store_id,
+                'store_name': store.store_name if store else None,
+                'order_status': order.order_status,
+                'delivery_status': order.delivery_status,
+                'payment_method': order.payment_method,
+                'created_date': order.created_date.strftime('%Y-%m-%d %H:%M:%S') if order.created_date else None,
+                'total_money': order.total_money,
+                'shipping_fee': order.shipping_fee,
+                'total_before_discount': order.total_before_discount,
+                'total_discount': order.total_discount,
+                'total_after_discount': order.total_after_discount,
+                'route_polyline': order.route_polyline,
+                'items': [
+                    {
+                        'food_id': detail.food_id,
+                        'food_option_id': detail.food_option_id,
+                        'quantity': detail.quantity,
+                        'food_price': detail.food_price,
+                        'food_option_price': detail.food_option_price,
+                        'food_note': detail.food_note,
+                        'subtotal': float(detail.subtotal),
+                    }
+                    for detail in self.details[id(order)]
+                ],
+                'applied_promos': [
+                    {
+                        'promo': order_promo.promo_id,
+                        'promo_name': order_promo.promo.name,
+                        'applied_amount': order_promo.applied_amount,
+                        'note': order_promo.note,
+                    }
+                    for order_promo in self.promos[id(order)]
+                ],
+            })
+        return data
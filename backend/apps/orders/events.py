@@ -0,0 +1,240 @@
+"""Order status change events, pushed to clients over Server-Sent Events.
+
+Every status move made through ``apps/orders/status.py`` (and every new order
+from checkout) publishes a compact event once its transaction commits:
+
+    {"type": "order_status", "order_id": 12, "group_id": 11, "store_id": 3,
+     "shipper_id": null, "order_status": "Đã xác nhận", "delivery_status": "Chờ xác nhận",
+     "at": "2026-01-01T12:00:00+07:00"}
+
+Events go to the channels ``order:<id>``, ``group:<id>``, ``store:<id>``,
+``shipper:<id>`` and ``user:<id>``. ``GET /api/orders/events/`` streams the
+channels a client subscribes to, so clients no longer poll the order
+endpoints to notice a change.
+
+``EventSource`` cannot send an ``Authorization`` header. Clients first POST
+to ``/api/orders/events/token/`` for a signed token that only opens the stream
+and expires after ``ORDER_EVENTS_TOKEN_SECONDS``, and pass it as ``?token=``;
+the access JWT never goes into a URL. Each open stream needs an ASGI server
+(``fastfood_api.asgi``): under WSGI it would hold a worker thread for
+``ORDER_EVENTS_STREAM_SECONDS``, so it is refused unless
+``ORDER_EVENTS_WSGI_STREAMING`` is set (default: ``DEBUG``, for runserver).
+
+``LocalBroker`` keeps the last ``ORDER_EVENTS_BUFFER_SIZE`` events in process
+memory. It serves one process: with several workers, point
+``ORDER_EVENTS_BROKER`` at a shared implementation of the same interface
+(``publish``, ``last_id``, ``since``, ``wait``, ``wait_async``).
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import BaseRenderer
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+ORDER_CREATED = 'order_created'
+ORDER_STATUS = 'order_status'
+
+_STREAM_TOKEN_SALT = 'orders.events.stream'
+
+
+class LocalBroker:
+    """In-process ring buffer of events with blocking and async waits."""
+
+    def __init__(self, buffer_size=1000):
+        self._events = deque(maxlen=buffer_size)
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._async_waiters = set()
+
+    def publish(self, channels, event):
+        with self._lock:
+            seq = next(self._seq)
+            self._events.append((seq, frozenset(channels), event))
+            self._changed.notify_all()
+            waiters = list(self._async_waiters)
+        for loop, ready in waiters:
+            loop.call_soon_threadsafe(ready.set)
+        return seq
+
+    def last_id(self):
+        with self._lock:
+            return self._events[-1][0] if self._events else 0
+
+    def since(self, last_id, channels):
+        """``(newest id, [(id, event), ...])`` for events after ``last_id`` on any of ``channels``."""
+        with self._lock:
+            newest = self._events[-1][0] if self._events else 0
+            return max(newest, last_id), [
+                (seq, event) for seq, event_channels, event in self._events
+                if seq > last_id and not event_channels.isdisjoint(channels)
+            ]
+
+    def wait(self, last_id, timeout):
+        """Block until an event newer than ``last_id`` is published or ``timeout`` passes."""
+        with self._lock:
+            if self._events and self._events[-1][0] > last_id:
+                return
+            self._changed.wait(timeout)
+
+    async def wait_async(self, last_id, timeout):
+        ready = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), ready)
+        with self._lock:
+            if self._events and self._events[-1][0] > last_id:
+                return
+            self._async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._async_waiters.discard(waiter)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        path = getattr(settings, 'ORDER_EVENTS_BROKER', None)
+        size = int(getattr(settings, 'ORDER_EVENTS_BUFFER_SIZE', 1000))
+        _broker = import_string(path)(size) if path else LocalBroker(size)
+    return _broker
+
+
+def order_channels(values):
+    channels = [f"order:{values['id']}"]
+    for prefix, key in (('group', 'group_id'), ('store', 'store_id'), ('shipper', 'shipper_id'), ('user', 'user_id')):
+        if values.get(key) is not None:
+            channels.append(f'{prefix}:{values[key]}')
+    return channels
+
+
+def order_event(values, event_type=ORDER_STATUS):
+    return {
+        'type': event_type,
+        'order_id': values['id'],
+        'group_id': values.get('group_id'),
+        'store_id': values.get('store_id'),
+        'shipper_id': values.get('shipper_id'),
+        'order_status': values.get('order_status'),
+        'delivery_status': values.get('delivery_status'),
+        'at': timezone.localtime().isoformat(),
+    }
+
+
+def _values(order):
+    return {
+        'id': order.pk, 'group_id': order.group_id, 'store_id': order.store_id, 'shipper_id': order.shipper_id,
+        'user_id': order.user_id, 'order_status': order.order_status, 'delivery_status': order.delivery_status,
+    }
+
+
+def publish_rows(rows, event_type=ORDER_STATUS):
+    """Publish one event per order once the current transaction commits.
+
+    ``rows`` are ``Order`` instances, dicts of their column values, or a callable
+    returning either (evaluated after the commit).
+    """
+    def send():
+        broker = get_broker()
+        for row in (rows() if callable(rows) else rows):
+            values = row if isinstance(row, dict) else _values(row)
+            broker.publish(order_channels(values), order_event(values, event_type))
+
+    transaction.on_commit(send)
+
+
+def publish_orders(orders, event_type=ORDER_STATUS):
+    """Publish the current state of ``orders`` (instances) after commit."""
+    publish_rows([_values(order) for order in orders], event_type)
+
+
+def format_event(seq, event):
+    data = json.dumps(event, ensure_ascii=False, separators=(',', ':'))
+    return f"id: {seq}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+def event_stream(channels, last_id, duration, heartbeat):
+    """Blocking SSE generator, for WSGI workers."""
+    broker = get_broker()
+    deadline = time.monotonic() + duration
+    yield f'retry: {int(heartbeat * 1000)}\n\n'
+    while True:
+        last_id, events = broker.since(last_id, channels)
+        for seq, event in events:
+            yield format_event(seq, event)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        broker.wait(last_id, min(heartbeat, remaining))
+        if broker.last_id() <= last_id:
+            yield ': keep-alive\n\n'
+
+
+async def async_event_stream(channels, last_id, duration, heartbeat):
+    """Non-blocking SSE generator, for ASGI servers."""
+    broker = get_broker()
+    deadline = time.monotonic() + duration
+    yield f'retry: {int(heartbeat * 1000)}\n\n'
+    while True:
+        last_id, events = broker.since(last_id, channels)
+        for seq, event in events:
+            yield format_event(seq, event)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        await broker.wait_async(last_id, min(heartbeat, remaining))
+        if broker.last_id() <= last_id:
+            yield ': keep-alive\n\n'
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets ``Accept: text/event-stream`` pass content negotiation; errors are sent as JSON."""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def stream_token(user):
+    """Signed token that lets ``user`` open the event stream for ``ORDER_EVENTS_TOKEN_SECONDS``."""
+    return signing.TimestampSigner(salt=_STREAM_TOKEN_SALT).sign(str(user.pk))
+
+
+class StreamTokenAuthentication(JWTAuthentication):
+    """JWT from the ``Authorization`` header, or a ``stream_token`` in ``?token=`` for ``EventSource`` clients."""
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            return result
+        token = request.query_params.get('token')
+        if not token:
+            return None
+        try:
+            user_id = signing.TimestampSigner(salt=_STREAM_TOKEN_SALT).unsign(
+                token, max_age=settings.ORDER_EVENTS_TOKEN_SECONDS,
+            )
+        except signing.BadSignature:
+            raise AuthenticationFailed('Token không hợp lệ hoặc đã hết hạn')
+        user = get_user_model().objects.filter(pk=user_id, is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed('Token không hợp lệ hoặc đã hết hạn')
+        return user, None
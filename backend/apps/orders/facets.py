@@ -0,0 +1,43 @@
+"""Tab badge counts for order lists.
+
+``status_facets`` turns any ``Order`` queryset into per-status counts with one
+``SELECT COUNT(*) FILTER (...)`` query (a ``CASE`` sum on databases without
+``FILTER``). The two cancelled spellings are merged into one count, which is
+reported under both keys so existing clients keep working.
+"""
+from django.db.models import Count, Q
+
+from .models import CANCELLED_STATUSES, Order
+
+CANCELLED_KEY = 'Đã huỷ'
+
+_CANCELLED = Q(delivery_status__in=CANCELLED_STATUSES) | Q(order_status__in=CANCELLED_STATUSES)
+
+
+def _statuses(choices):
+    return [value for value, _ in choices if value not in CANCELLED_STATUSES]
+
+
+def status_facets(queryset):
+    """Count ``queryset`` per delivery status and per order status in one query.
+
+    Returns ``{'total', 'cancelled', 'delivery_status': {...}, 'order_status': {...}}``.
+    An order counts as cancelled when either of its statuses is cancelled, and
+    then only under the cancelled key.
+    """
+    delivery = _statuses(Order.DELIVERY_STATUS_CHOICES)
+    order = _statuses(Order.ORDER_STATUS_CHOICES)
+    aggregates = {
+        'total': Count('id'),
+        'cancelled': Count('id', filter=_CANCELLED),
+        **{f'd{i}': Count('id', filter=Q(delivery_status=value) & ~_CANCELLED) for i, value in enumerate(delivery)},
+        **{f'o{i}': Count('id', filter=Q(order_status=value) & ~_CANCELLED) for i, value in enumerate(order)},
+    }
+    row = queryset.order_by().aggregate(**aggregates)
+    cancelled = {spelling: row['cancelled'] for spelling in CANCELLED_STATUSES}
+    return {
+        'total': row['total'],
+        'cancelled': row['cancelled'],
+        'delivery_status': {**{value: row[f'd{i}'] for i, value in enumerate(delivery)}, **cancelled},
+        'order_status': {**{value: row[f'o{i}'] for i, value in enumerate(order)}, **cancelled},
+    }
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.orders.archive import archivable_orders, archive_batch
+
+
+class Command(BaseCommand):
+    help = 'Move delivered and cancelled orders older than N days to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=500, help='Orders moved per transaction')
+        parser.add_argument('--limit', type=int, help='Stop after moving this many orders')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the orders that would move')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        queryset = archivable_orders(before)
+        if options['dry_run']:
+            self.stdout.write(f'{queryset.count()} orders created before {before:%Y-%m-%d} would be archived')
+            return
+
+        moved = 0
+        limit = options['limit']
+        while limit is None or moved < limit:
+            batch_size = options['batch_size'] if limit is None else min(options['batch_size'], limit - moved)
+            count = archive_batch(queryset, batch_size)
+            if not count:
+                break
+            moved += count
+            self.stdout.write(f'Archived {moved} orders...')
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} orders created before {before:%Y-%m-%d}'))
@@ -0,0 +1,114 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Avg, Count
+from django.utils import timezone
+
+from apps.orders.models import CANCELLED_STATUSES, Order, OrderDetail
+from apps.ratings.models import RatingFood
+
+# Partial indexes; SQLite only matches them against literal WHERE terms, not bound parameters
+PARTIAL_INDEXES = {'ord_active_store_created_idx', 'ord_active_created_idx', 'ord_unassigned_queue_idx'}
+
+
+def plan_checks():
+    """``(label, queryset, accepted index names)`` for the hot order/analytics reads."""
+    since = timezone.now() - timedelta(days=30)
+    return [
+        (
+            'shipper order history',
+            Order.objects.filter(shipper_id=1).order_by('-created_date')[:20],
+            ['ord_shipper_created_idx'],
+        ),
+        (
+            'customer order history',
+            Order.objects.filter(user_id=1).order_by('-id')[:20],
+            ['ord_user_id_idx'],
+        ),
+        (
+            'store orders by status',
+            Order.objects.filter(store_id=1, order_status='Chờ xác nhận').order_by('-created_date')[:20],
+            # A non-cancelled status also matches the partial (store, created_date) index
+            ['ord_store_status_created_idx', 'ord_active_store_created_idx'],
+        ),
+        (
+            'checkout group',
+            Order.objects.filter(group_id=1),
+            ['ord_group_idx'],
+        ),
+        (
+            'orders by delivery status',
+            Order.objects.filter(delivery_status='Đã giao').values('id'),
+            ['ord_delivery_status_idx', 'ord_unassigned_queue_idx'],
+        ),
+        (
+            'unassigned orders for shippers',
+            Order.objects.filter(shipper__isnull=True, delivery_status='Chờ xác nhận')
+            .exclude(order_status__in=CANCELLED_STATUSES).order_by('-created_date')[:20],
+            ['ord_unassigned_queue_idx'],
+        ),
+        (
+            'store dashboard window',
+            Order.objects.filter(store_id=1).exclude(order_status__in=CANCELLED_STATUSES)
+            .filter(created_date__gte=since).values('total_after_discount'),
+            ['ord_active_store_created_idx'],
+        ),
+        (
+            'admin dashboard window',
+            Order.objects.exclude(order_status__in=CANCELLED_STATUSES)
+            .filter(created_date__gte=since).values('total_after_discount'),
+            ['ord_active_created_idx', 'ord_created_idx'],
+        ),
+        (
+            'orders per food',
+            OrderDetail.objects.filter(food_id__in=[1, 2, 3]).values('food_id').annotate(orders=Count('order_id')),
+            ['order_detail_food_order_idx'],
+        ),
+        (
+            'rating stats per food',
+            RatingFood.objects.filter(food_id__in=[1, 2, 3]).values('food_id').annotate(avg=Avg('rating')),
+            ['rating_food_food_point_idx'],
+        ),
+        (
+            'rated orders of a customer',
+            RatingFood.objects.filter(order_id__in=[1, 2, 3], user_id=1).values('order_id'),
+            ['rating_food_order_user_idx'],
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot order/analytics queries and fail if they do not use their indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--show-plans', action='store_true', help='Print the full plan of every query')
+
+    def handle(self, *args, **options):
+        failures = []
+        partial_supported = connection.vendor == 'postgresql'
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Dev/CI databases are tiny and a sequential scan always looks cheapest there
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for label, queryset, expected in plan_checks():
+                if not partial_supported:
+                    expected = [name for name in expected if name not in PARTIAL_INDEXES]
+                    if not expected:
+                        self.stdout.write(self.style.WARNING(f'SKIP  {label}: partial index, needs PostgreSQL'))
+                        continue
+                plan = queryset.explain()
+                used = next((name for name in expected if name in plan), None)
+                if used:
+                    self.stdout.write(self.style.SUCCESS(f'OK    {label}: {used}'))
+                else:
+                    failures.append(label)
+                    self.stdout.write(self.style.ERROR(f'FAIL  {label}: expected {" or ".join(expected)}'))
+                if options['show_plans'] or not used:
+                    self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f'{len(failures)} queries do not use their index: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('All checked queries use their indexes'))
@@ -0,0 +1,113 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from rest_framework.test import APIClient
+
+from apps.orders.models import Order
+from apps.orders.status import PENDING
+from apps.shipper.models import Shipper
+
+LOCK_WAITS_SQL = (
+    "SELECT count(*) FROM pg_stat_activity "
+    "WHERE wait_event_type = 'Lock' AND datname = current_database()"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire concurrent shipper accepts at one unassigned order and fail unless exactly one wins. '
+        'The order is put back to unassigned afterwards unless --keep is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('order_id', type=int)
+        parser.add_argument('--shippers', type=int, default=8, help='Number of existing shippers racing')
+        parser.add_argument('--rounds', type=int, default=1)
+        parser.add_argument('--keep', action='store_true', help='Leave the order with the winning shipper')
+
+    def handle(self, *args, **options):
+        order_id = options['order_id']
+        shippers = list(Shipper.objects.select_related('user').order_by('id')[:options['shippers']])
+        if len(shippers) < 2:
+            raise CommandError('Need at least two shippers in the database')
+
+        failures = 0
+        for round_number in range(1, options['rounds'] + 1):
+            order = Order.objects.filter(pk=order_id).first()
+            if order is None:
+                raise CommandError(f'Order {order_id} not found')
+            if order.shipper_id is not None or order.delivery_status != PENDING:
+                raise CommandError(f'Order {order_id} must be unassigned and "{PENDING}"')
+
+            results, lock_waits = self._race(order_id, shippers)
+            winners = [shipper for shipper, code, _ in results if code == 200]
+            codes = {}
+            for _, code, _ in results:
+                codes[code] = codes.get(code, 0) + 1
+            latencies = sorted(elapsed for _, _, elapsed in results)
+            stored = Order.objects.values_list('shipper_id', flat=True).get(pk=order_id)
+
+            ok = len(winners) == 1 and stored == winners[0].id
+            failures += not ok
+            summary = (
+                f'round {round_number}: {len(shippers)} accepts, responses {dict(sorted(codes.items()))}, '
+                f'winner {winners[0].id if winners else None}, stored shipper {stored}, '
+                f'p50 {latencies[len(latencies) // 2]:.1f}ms max {latencies[-1]:.1f}ms'
+            )
+            if lock_waits is not None:
+                summary += f', peak lock waits {lock_waits}'
+            self.stdout.write(self.style.SUCCESS(summary) if ok else self.style.ERROR(summary))
+
+            if not options['keep']:
+                Order.objects.filter(pk=order_id).update(shipper=None, delivery_status=PENDING)
+
+        if failures:
+            raise CommandError(f'{failures} of {options["rounds"]} rounds did not have exactly one winner')
+
+    def _race(self, order_id, shippers):
+        """Accept ``order_id`` once per shipper, all threads released together."""
+        barrier = threading.Barrier(len(shippers))
+        results = []
+        lock = threading.Lock()
+        done = threading.Event()
+        peak = [None]
+
+        def accept(shipper):
+            client = APIClient(raise_request_exception=False)
+            client.force_authenticate(shipper.user)
+            try:
+                barrier.wait()
+                started = time.perf_counter()
+                response = client.post(f'/api/orders/shipper/{order_id}/accept/')
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    results.append((shipper, response.status_code, elapsed))
+            finally:
+                connections.close_all()
+
+        def sample_lock_waits():
+            # Requests queueing on the order's row lock show up as Lock waits
+            try:
+                with connection.cursor() as cursor:
+                    while not done.is_set():
+                        cursor.execute(LOCK_WAITS_SQL)
+                        peak[0] = max(peak[0] or 0, cursor.fetchone()[0])
+                        time.sleep(0.002)
+            finally:
+                connections.close_all()
+
+        sampler = None
+        if connection.vendor == 'postgresql':
+            sampler = threading.Thread(target=sample_lock_waits)
+            sampler.start()
+        threads = [threading.Thread(target=accept, args=(shipper,)) for shipper in shippers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        done.set()
+        if sampler:
+            sampler.join()
+        return results, peak[0]
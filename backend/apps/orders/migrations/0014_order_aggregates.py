@@ -0,0 +1,71 @@
+# Generated by Django 5.1.15 on 2026-10-16 23:28
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_order_aggregates(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderDetail = apps.get_model('orders', 'OrderDetail')
+    OrderPromo = apps.get_model('promotions', 'OrderPromo')
+    money = DecimalField(max_digits=12, decimal_places=2)
+
+    details = OrderDetail.objects.filter(order_id=OuterRef('pk')).values('order_id')
+    promos = OrderPromo.objects.filter(order_id=OuterRef('pk')).values('order_id')
+    Order.objects.update(
+        item_count=Coalesce(Subquery(details.annotate(n=Count('id')).values('n'), output_field=IntegerField()), 0),
+        items_subtotal=Coalesce(
+            Subquery(
+                details.annotate(
+                    total=Sum(
+                        (F('food_price') + Coalesce('food_option_price', Value(Decimal('0')))) * F('quantity'),
+                        output_field=money,
+                    )
+                ).values('total'),
+                output_field=money,
+            ),
+            Value(Decimal('0')),
+            output_field=money,
+        ),
+        promo_count=Coalesce(Subquery(promos.annotate(n=Count('id')).values('n'), output_field=IntegerField()), 0),
+        promo_discount_total=Coalesce(
+            Subquery(promos.annotate(total=Sum('applied_amount')).values('total'), output_field=money),
+            Value(Decimal('0')),
+            output_field=money,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_idempotency_record'),
+        ('promotions', '0002_orderpromo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='items_subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='promo_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='promo_discount_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_order_aggregates, migrations.RunPython.noop),
+    ]
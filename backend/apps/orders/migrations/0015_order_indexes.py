@@ -0,0 +1,59 @@
+# Generated by Django 5.1.15 on 2026-10-16 23:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_remove_food_is_topping'),
+        ('orders', '0014_order_aggregates'),
+        ('promotions', '0002_orderpromo'),
+        ('shipper', '0001_initial'),
+        ('stores', '0005_route_cache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['shipper', '-created_date'], name='ord_shipper_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-id'], name='ord_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['store', 'order_status', '-created_date'], name='ord_store_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['group_id'], name='ord_group_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['delivery_status'], name='ord_delivery_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_date'], name='ord_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('order_status__in', ['Đã hủy', 'Đã huỷ']), _negated=True), fields=['store', 'created_date'], name='ord_active_store_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('order_status__in', ['Đã hủy', 'Đã huỷ']), _negated=True), fields=['created_date'], name='ord_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('shipper__isnull', True)), fields=['delivery_status', '-created_date'], name='ord_unassigned_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderdetail',
+            index=models.Index(fields=['food', 'order'], name='order_detail_food_order_idx'),
+        ),
+    ]
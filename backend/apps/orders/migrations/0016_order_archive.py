@@ -0,0 +1,97 @@
+# Generated by Django 5.1.15 on 2026-10-16 23:44
+
+import apps.orders.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_remove_food_is_topping'),
+        ('orders', '0015_order_indexes'),
+        ('promotions', '0002_orderpromo'),
+        ('shipper', '0001_initial'),
+        ('stores', '0005_route_cache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('created_date', models.DateTimeField(default=apps.orders.models.get_vietnam_time)),
+                ('total_before_discount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_discount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_after_discount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('shipping_fee', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_money', models.DecimalField(blank=True, decimal_places=3, max_digits=13, null=True)),
+                ('items_subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('promo_discount_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('promo_count', models.PositiveIntegerField(default=0)),
+                ('order_status', models.CharField(choices=[('Chờ xác nhận', 'Chờ xác nhận'), ('Đã xác nhận', 'Đã xác nhận'), ('Đang chuẩn bị', 'Đang chuẩn bị'), ('Sẵn sàng', 'Sẵn sàng'), ('Đã lấy hàng', 'Đã lấy hàng'), ('Đã giao', 'Đã giao'), ('Đã huỷ', 'Đã huỷ')], default='Chờ xác nhận', max_length=30)),
+                ('delivery_status', models.CharField(choices=[('Chờ xác nhận', 'Chờ xác nhận'), ('Đã xác nhận', 'Đã xác nhận'), ('Đã lấy hàng', 'Đã lấy hàng'), ('Đang giao', 'Đang giao'), ('Đã giao', 'Đã giao'), ('Đã huỷ', 'Đã huỷ')], default='Chờ xác nhận', max_length=30)),
+                ('note', models.CharField(blank=True, max_length=50)),
+                ('payment_method', models.CharField(default='COD', max_length=20)),
+                ('receiver_name', models.CharField(max_length=50)),
+                ('ship_address', models.CharField(max_length=100)),
+                ('ship_latitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('ship_longitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('route_polyline', models.TextField(blank=True, null=True)),
+                ('phone_number', models.CharField(max_length=10)),
+                ('cancel_reason', models.CharField(blank=True, max_length=255, null=True)),
+                ('cancelled_date', models.DateTimeField(blank=True, null=True)),
+                ('cancelled_by_role', models.CharField(blank=True, choices=[('Khách hàng', 'Khách hàng'), ('Cửa hàng', 'Cửa hàng'), ('Quản lý', 'Quản lý')], max_length=20, null=True)),
+                ('group_id', models.IntegerField(blank=True, null=True)),
+                ('refund_requested', models.BooleanField(default=False)),
+                ('refund_status', models.CharField(choices=[('Không', 'Không'), ('Chờ xử lý', 'Chờ xử lý'), ('Đã hoàn thành', 'Đã hoàn thành')], default='Không', max_length=20)),
+                ('bank_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('bank_account', models.CharField(blank=True, max_length=50, null=True)),
+                ('proof_image', models.CharField(blank=True, max_length=255, null=True)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('promo', models.ForeignKey(blank=True, db_column='promo_id', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='promotions.promo')),
+                ('shipper', models.ForeignKey(blank=True, db_column='shipper_id', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='shipper.shipper')),
+                ('store', models.ForeignKey(blank=True, db_column='store_id', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='stores.store')),
+                ('user', models.ForeignKey(db_column='user_id', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'orders_archive',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderDetail',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.IntegerField()),
+                ('food_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('food_note', models.CharField(blank=True, max_length=255, null=True)),
+                ('food_option_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('food', models.ForeignKey(db_column='food_id', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='menu.food')),
+                ('food_option', models.ForeignKey(blank=True, db_column='food_option_id', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='menu.foodsize')),
+                ('order', models.ForeignKey(db_column='order_id', on_delete=django.db.models.deletion.CASCADE, related_name='details', to='orders.archivedorder')),
+            ],
+            options={
+                'db_table': 'order_detail_archive',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderPromo',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('applied_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField()),
+                ('order', models.ForeignKey(db_column='order_id', on_delete=django.db.models.deletion.CASCADE, related_name='order_promos', to='orders.archivedorder')),
+                ('promo', models.ForeignKey(db_column='promo_id', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='promotions.promo')),
+            ],
+            options={
+                'db_table': 'order_promo_archive',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['user', '-id'], name='ord_arch_user_id_idx'),
+        ),
+    ]
@@ -1,4 +1,7 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.utils import timezone
 from apps.menu.models import Food
@@ -13,7 +16,13 @@ def get_vietnam_time():
     return now.astimezone(vietnam_tz)
 
 
-class Order(models.Model):
+# Cả hai cách viết "hủy"/"huỷ" đều có trong dữ liệu cũ
+CANCELLED_STATUSES = ['Đã hủy', 'Đã huỷ']
+
+
+class AbstractOrder(models.Model):
+    """Columns shared by the live ``orders`` table and its ``orders_archive`` copy"""
+
     ORDER_STATUS_CHOICES = [
         ('Chờ xác nhận', 'Chờ xác nhận'),
         ('Đã xác nhận', 'Đã xác nhận'),
@@ -55,6 +64,12 @@ class Order(models.Model):
     
     # Legacy field for compatibility - will be removed after migration
     total_money = models.DecimalField(max_digits=13, decimal_places=3, null=True, blank=True)
+
+    # Stored aggregates of order_detail / order_promo, kept current by recompute_aggregates()
+    items_subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    promo_discount_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    promo_count = models.PositiveIntegerField(default=0)
     
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_column='user_id')
     order_status = models.CharField(max_length=30, choices=ORDER_STATUS_CHOICES, default='Chờ xác nhận')
@@ -84,23 +99,87 @@ class Order(models.Model):
     bank_name = models.CharField(max_length=100, null=True, blank=True)
     bank_account = models.CharField(max_length=50, null=True, blank=True)
     proof_image = models.CharField(max_length=255, null=True, blank=True)
-    
+
+    class Meta:
+        abstract = True
+
+
+class Order(AbstractOrder):
     # New many-to-many relationship with promotions
     promotions = models.ManyToManyField('promotions.Promo', through='promotions.OrderPromo', blank=True, related_name='orders')
     # promotions = models.ManyToManyField('promotions.Promo', blank=True, related_name='orders')
 
     class Meta:
         db_table = 'orders'
+        indexes = [
+            # Shipper history, user history and store order lists, newest first
+            models.Index(fields=['shipper', '-created_date'], name='ord_shipper_created_idx'),
+            models.Index(fields=['user', '-id'], name='ord_user_id_idx'),
+            models.Index(fields=['store', 'order_status', '-created_date'], name='ord_store_status_created_idx'),
+            models.Index(fields=['group_id'], name='ord_group_idx'),
+            models.Index(fields=['delivery_status'], name='ord_delivery_status_idx'),
+            models.Index(fields=['created_date'], name='ord_created_idx'),
+            # Dashboards only count orders that were not cancelled
+            models.Index(
+                fields=['store', 'created_date'], name='ord_active_store_created_idx',
+                condition=~models.Q(order_status__in=CANCELLED_STATUSES),
+            ),
+            models.Index(
+                fields=['created_date'], name='ord_active_created_idx',
+                condition=~models.Q(order_status__in=CANCELLED_STATUSES),
+            ),
+            # Orders waiting for a shipper to accept them
+            models.Index(
+                fields=['delivery_status', '-created_date'], name='ord_unassigned_queue_idx',
+                condition=models.Q(shipper__isnull=True),
+            ),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.user.fullname}"
     
+    AGGREGATE_FIELDS = ['items_subtotal', 'item_count', 'promo_discount_total', 'promo_count']
+
+    # True on read-only orders loaded from orders_archive (ArchivedOrder.as_order)
+    is_archived = False
+
     def get_total_discount(self):
-        """Calculate total discount from all applied promotions"""
+        """Total discount from all applied promotions"""
+        return self.promo_discount_total
+
+    def recompute_aggregates(self, sync_discount=False):
+        """Recompute the stored item/promo aggregates and save only those columns.
+
+        The order row is locked for the duration so concurrent detail/promo
+        writes recompute one after another. With ``sync_discount`` the promo
+        total also becomes ``total_discount`` (and ``total_after_discount``).
+        """
         from apps.promotions.models import OrderPromo
-        return OrderPromo.objects.filter(order=self).aggregate(
-            total=models.Sum('applied_amount')
-        )['total'] or 0
+
+        with transaction.atomic():
+            Order.objects.select_for_update().filter(pk=self.pk).values_list('pk', flat=True).first()
+            details = OrderDetail.objects.filter(order_id=self.pk).aggregate(
+                count=models.Count('id'),
+                subtotal=models.Sum(
+                    (models.F('food_price') + Coalesce('food_option_price', models.Value(Decimal('0')))) * models.F('quantity'),
+                    output_field=models.DecimalField(max_digits=12, decimal_places=2),
+                ),
+            )
+            promos = OrderPromo.objects.filter(order_id=self.pk).aggregate(
+                count=models.Count('id'),
+                total=models.Sum('applied_amount'),
+            )
+
+            self.item_count = details['count']
+            self.items_subtotal = details['subtotal'] or Decimal('0')
+            self.promo_count = promos['count']
+            self.promo_discount_total = promos['total'] or Decimal('0')
+            update_fields = list(self.AGGREGATE_FIELDS)
+            if sync_discount:
+                self.total_discount = self.promo_discount_total
+                self.total_after_discount = max(Decimal('0'), self.total_before_discount - self.total_discount)
+                update_fields += ['total_discount', 'total_after_discount']
+            self.save(update_fields=update_fields)
     
     def get_applied_promotions(self):
         """Get all promotions applied to this order"""
@@ -119,10 +198,23 @@ class OrderDetail(models.Model):
 
     class Meta:
         db_table = 'order_detail'
+        indexes = [
+            models.Index(fields=['food', 'order'], name='order_detail_food_order_idx'),
+        ]
 
     def __str__(self):
         return f"{self.quantity}x {self.food.title}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.order.recompute_aggregates()
+
+    def delete(self, *args, **kwargs):
+        order = self.order
+        result = super().delete(*args, **kwargs)
+        order.recompute_aggregates()
+        return result
+
     @property
     def subtotal(self):
         # Use food_price from OrderDetail, but fallback to food.price if food_price is 0
@@ -133,3 +225,79 @@ class OrderDetail(models.Model):
         if self.food_option_price:
             item_price += self.food_option_price
         return item_price * self.quantity
+
+
+# Cold copies of delivered/cancelled orders moved out of the live tables by
+# ``manage.py archive_orders`` (see apps/orders/archive.py). Rows keep their ids;
+# references to users, stores, foods and promos are not enforced so the archive
+# never blocks deleting them.
+_ARCHIVE_REF = dict(on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+
+
+class ArchivedOrder(AbstractOrder):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, db_column='user_id', **_ARCHIVE_REF)
+    promo = models.ForeignKey('promotions.Promo', null=True, blank=True, db_column='promo_id', **_ARCHIVE_REF)
+    shipper = models.ForeignKey('shipper.Shipper', null=True, blank=True, db_column='shipper_id', **_ARCHIVE_REF)
+    store = models.ForeignKey(Store, null=True, blank=True, db_column='store_id', **_ARCHIVE_REF)
+
+    class Meta:
+        db_table = 'orders_archive'
+        indexes = [
+            models.Index(fields=['user', '-id'], name='ord_arch_user_id_idx'),
+        ]
+
+    def as_order(self):
+        """Unsaved ``Order`` with this row's values, for the order serializers."""
+        order = Order(**{field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields})
+        order._state.adding = False
+        order.is_archived = True
+        return order
+
+
+class ArchivedOrderDetail(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, db_column='order_id', related_name='details')
+    food = models.ForeignKey(Food, db_column='food_id', **_ARCHIVE_REF)
+    food_option = models.ForeignKey('menu.FoodSize', null=True, blank=True, db_column='food_option_id', **_ARCHIVE_REF)
+    quantity = models.IntegerField()
+    food_price = models.DecimalField(max_digits=10, decimal_places=2)
+    food_note = models.CharField(max_length=255, blank=True, null=True)
+    food_option_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        db_table = 'order_detail_archive'
+
+
+class ArchivedOrderPromo(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, db_column='order_id', related_name='order_promos')
+    promo = models.ForeignKey('promotions.Promo', db_column='promo_id', **_ARCHIVE_REF)
+    applied_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'order_promo_archive'
+
+
+class IdempotencyRecord(models.Model):
+    """Stored outcome of a POST sent with an ``Idempotency-Key`` header.
+
+    A retry with the same key and payload replays ``response_body`` instead of
+    re-running checkout or payment-link creation (see apps/utils/idempotency.py).
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_column='user_id', null=True, blank=True)
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.IntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'idempotency_record'
+        unique_together = ('scope', 'user', 'key')
+
+    def __str__(self):
+        return f"{self.scope}:{self.key} ({self.status_code or 'pending'})"
@@ -9,6 +9,7 @@ from decimal import Decimal
 
 from .models import Order, OrderDetail
 from apps.promotions.models import Promo, OrderPromo
+from apps.cart.store import get_cart_store
 from apps.cart.models import Cart, Item
 from .serializers import OrderSerializer
 
@@ -18,6 +19,8 @@ from .serializers import OrderSerializer
 def create_order_with_multiple_promos(request):
     """Create order with support for multiple promotions"""
     try:
+        cart_store = get_cart_store()
+        cart_store.flush(request.user)
         with transaction.atomic():
             # Get cart
             cart = Cart.objects.get(user=request.user)
@@ -105,8 +108,7 @@ def create_order_with_multiple_promos(request):
                 created_orders.append(order)
             
             # Clear cart
-            cart.items.all().delete()
-            cart.update_total()
+            cart_store.discard_ordered(request.user, cart.id)
             
             # Return response
             serializer = OrderSerializer(created_orders, many=True)
@@ -1,13 +1,17 @@
 from rest_framework import serializers
-from .models import Order, OrderDetail
-from apps.menu.serializers import FoodListSerializer, FoodSizeSerializer
+from .models import ArchivedOrderDetail, ArchivedOrderPromo, Order, OrderDetail
+from apps.menu.serializers import FoodListSerializer, FoodSizeSerializer, annotate_category_food_counts
 from apps.authentication.serializers import UserSerializer
 from apps.shipper.serializers import ShipperSerializer
 from apps.stores.models import Store
 from apps.ratings.models import RatingFood
-from apps.menu.models import Food, FoodSize  # needed for raw SQL item fetching
+from apps.menu.models import Food, FoodSize
+from django.db import models
+from django.db.models import prefetch_related_objects
 from django.utils import timezone
+from collections import defaultdict
 from apps.utils import VietnamDateTimeField
+from apps.utils.uploads import thumbnail_name
 
 
 class OrderDetailSerializer(serializers.ModelSerializer):
@@ -60,6 +64,68 @@ class OrderDetailSerializer(serializers.ModelSerializer):
         return breakdown
 
 
+class OrderPageData:
+    """Related rows for a page of orders, loaded in a fixed number of queries.
+
+    One query each for order details, foods (with category/store), their sizes,
+    category food counts, the ordered food options, the current user's ratings
+    and the promos of orders whose ``promo_count`` is non-zero, however many
+    orders the page holds (details and promos of archived orders take one more
+    query each).
+    """
+
+    def __init__(self, orders, user=None):
+        from apps.promotions.order_promo import OrderPromo
+
+        self.order_ids = {order.id for order in orders}
+        prefetch_related_objects(orders, 'user__role', 'shipper__user__role', 'store')
+
+        self.details = defaultdict(list)
+        food_ids, food_option_ids = set(), set()
+        archived_ids = {order.id for order in orders if order.is_archived}
+        detail_columns = ('order_id', 'food_id', 'food_option_id', 'quantity', 'food_price', 'food_option_price', 'food_note')
+        rows = list(OrderDetail.objects.filter(order_id__in=self.order_ids - archived_ids).order_by('id').values_list(*detail_columns))
+        if archived_ids:
+            rows += ArchivedOrderDetail.objects.filter(order_id__in=archived_ids).order_by('id').values_list(*detail_columns)
+        for order_id, *row in rows:
+            self.details[order_id].append(row)
+            food_ids.add(row[0])
+            if row[1] is not None:
+                food_option_ids.add(row[1])
+
+        self.foods = Food.objects.select_related('category', 'store__manager').prefetch_related('sizes').in_bulk(food_ids)
+        annotate_category_food_counts(self.foods.values())
+        self.food_options = FoodSize.objects.in_bulk(food_option_ids)
+
+        self.rated_order_ids = set()
+        if user is not None and user.is_authenticated:
+            self.rated_order_ids = set(
+                RatingFood.objects.filter(order_id__in=self.order_ids, user=user).values_list('order_id', flat=True)
+            )
+
+        # Orders without promos (promo_count == 0) need no order_promo lookup
+        self.order_promos = defaultdict(list)
+        promo_order_ids = {order.id for order in orders if order.promo_count}
+        for model, ids in ((OrderPromo, promo_order_ids - archived_ids), (ArchivedOrderPromo, promo_order_ids & archived_ids)):
+            if ids:
+                for order_promo in model.objects.filter(order_id__in=ids).select_related('promo').order_by('id'):
+                    self.order_promos[order_promo.order_id].append(order_promo)
+
+
+class OrderPageSerializer(serializers.ListSerializer):
+    """``OrderSerializer(many=True)``: loads the page's related rows once and shares them."""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        orders = list(iterable)
+        request = self.context.get('request')
+        self.child._page_data = OrderPageData(orders, getattr(request, 'user', None))
+        try:
+            return [self.child.to_representation(order) for order in orders]
+        finally:
+            self.child._page_data = None
+
+
 class OrderSerializer(serializers.ModelSerializer):
     # Flag if current user already rated this order
     is_rated = serializers.SerializerMethodField()
@@ -84,6 +150,7 @@ class OrderSerializer(serializers.ModelSerializer):
     # Thêm thông tin promotion discount
     promo_discount = serializers.SerializerMethodField()
     applied_promos = serializers.SerializerMethodField()
+    proof_thumbnail = serializers.SerializerMethodField()
     
     class Meta:
         model = Order
@@ -95,10 +162,19 @@ class OrderSerializer(serializers.ModelSerializer):
             'store_name', 'store_info_id', 'store_image', 'store_address', 'store_latitude', 'store_longitude', 'items', 'is_rated', 
             'created_date', 'promo_discount', 'applied_promos',
             'total_before_discount', 'total_discount', 'total_after_discount',
-            'refund_requested', 'refund_status', 'bank_name', 'bank_account', 'proof_image'
+            'refund_requested', 'refund_status', 'bank_name', 'bank_account', 'proof_image', 'proof_thumbnail'
         ]
         read_only_fields = ['id', 'created_date']
+        list_serializer_class = OrderPageSerializer
     
+    def _page(self, obj):
+        """Related rows for ``obj``: the shared page data, or a page of one."""
+        page = getattr(self, '_page_data', None)
+        if page is None or obj.id not in page.order_ids:
+            request = self.context.get('request')
+            page = OrderPageData([obj], getattr(request, 'user', None))
+            self._page_data = page
+        return page
     
     def get_created_date_display(self, obj):
         """DEPRECATED: Use created_date field directly (already in Vietnam timezone)"""
@@ -115,23 +191,12 @@ class OrderSerializer(serializers.ModelSerializer):
         return vn_time.strftime("%Y-%m-%d %H:%M:%S")
 
     def get_items(self, obj):
-        from django.db import connection
-        from apps.menu.serializers import FoodListSerializer, FoodSizeSerializer
-        # raw SQL to fetch order items with separate food_price and food_option_price
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT food_id, food_option_id, quantity, food_price, food_option_price, food_note FROM order_detail WHERE order_id = %s", [obj.id]
-            )
-            rows = cursor.fetchall()
-        # Bulk fetch food and food_size objects
-        food_ids = [r[0] for r in rows]
-        food_option_ids = [r[1] for r in rows if r[1] is not None]
-        
-        foods = {f.id: f for f in Food.objects.filter(id__in=food_ids)}
-        food_options = {fs.id: fs for fs in FoodSize.objects.filter(id__in=food_option_ids)}
+        page = self._page(obj)
+        foods = page.foods
+        food_options = page.food_options
         
         items = []
-        for food_id, food_option_id, qty, food_price, food_option_price, food_note in rows:
+        for food_id, food_option_id, qty, food_price, food_option_price, food_note in page.details.get(obj.id, []):
             food = foods.get(food_id)
             if not food:
                 continue
@@ -196,26 +261,19 @@ class OrderSerializer(serializers.ModelSerializer):
         request = self.context.get('request', None)
         if not request or not request.user or not request.user.is_authenticated:
             return False
-        return RatingFood.objects.filter(order_id=obj.id, user=request.user).exists()
+        return obj.id in self._page(obj).rated_order_ids
     
     def get_promo_discount(self, obj):
         """Get total discount amount from applied promos"""
-        from apps.promotions.order_promo import OrderPromo
-        from django.db.models import Sum
-        
-        total = OrderPromo.objects.filter(order=obj).aggregate(
-            total=Sum('applied_amount')
-        )['total']
-        
-        return float(total) if total else 0
+        return float(obj.promo_discount_total) if obj.promo_discount_total else 0
     
     def get_applied_promos(self, obj):
         """Get list of applied promos with details"""
-        from apps.promotions.order_promo import OrderPromo
         from apps.promotions.serializers import OrderPromoSerializer
         
-        order_promos = OrderPromo.objects.filter(order=obj).select_related('promo')
-        return OrderPromoSerializer(order_promos, many=True).data
+        if not obj.promo_count:
+            return []
+        return OrderPromoSerializer(self._page(obj).order_promos.get(obj.id, []), many=True).data
 
     def get_store_latitude(self, obj):
         return float(obj.store.latitude) if obj.store and obj.store.latitude is not None else None
@@ -223,10 +281,15 @@ class OrderSerializer(serializers.ModelSerializer):
     def get_store_longitude(self, obj):
         return float(obj.store.longitude) if obj.store and obj.store.longitude is not None else None
 
+    def get_proof_thumbnail(self, obj):
+        """Thumbnail of the proof image; may not exist yet right after the upload"""
+        return thumbnail_name(obj.proof_image)
+
 
 class OrderListSerializer(serializers.ModelSerializer):
     """Lighter serializer for order list views"""
     items_count = serializers.SerializerMethodField()
+    proof_thumbnail = serializers.SerializerMethodField()
     shipper = ShipperSerializer(read_only=True)
     # Sử dụng VietnamDateTimeField để tự động convert sang múi giờ Việt Nam
     created_date = VietnamDateTimeField(read_only=True)
@@ -238,8 +301,11 @@ class OrderListSerializer(serializers.ModelSerializer):
             'id', 'order_status', 'delivery_status', 'total_money', 'payment_method',
             'receiver_name', 'shipper', 'items_count', 'created_date',
             'cancel_reason', 'cancelled_date', 'cancelled_by_role',
-            'refund_requested', 'refund_status', 'bank_name', 'bank_account', 'proof_image'
+            'refund_requested', 'refund_status', 'bank_name', 'bank_account', 'proof_image', 'proof_thumbnail'
         ]
     
     def get_items_count(self, obj):
-        return obj.details.count()
+        return obj.item_count
+
+    def get_proof_thumbnail(self, obj):
+        return thumbnail_name(obj.proof_image)
@@ -0,0 +1,234 @@
+"""Order status state machine.
+
+The one place that knows the order and delivery statuses, which actor may move
+an order from which status to which, and how a move is written. Both cancelled
+spellings are accepted on input; the canonical ``'Đã huỷ'`` is written.
+
+Moves are applied as a conditional ``UPDATE ... WHERE <status> IN (<allowed
+sources>)``. The database checks the current status and writes the new one in
+a single statement, so two concurrent requests cannot both move the same order,
+and a whole checkout group is cancelled with one statement.
+"""
+from django.db.models import Exists
+
+from .events import publish_orders, publish_rows
+from .models import CANCELLED_STATUSES, Order, get_vietnam_time
+
+PENDING = 'Chờ xác nhận'
+CONFIRMED = 'Đã xác nhận'
+PREPARING = 'Đang chuẩn bị'
+READY = 'Sẵn sàng'
+PICKED_UP = 'Đã lấy hàng'
+SHIPPING = 'Đang giao'  # Legacy order_status written by shipper assignment
+DELIVERED = 'Đã giao'
+CANCELLED = 'Đã huỷ'
+
+ORDER_STATUSES = [value for value, _ in Order.ORDER_STATUS_CHOICES]
+DELIVERY_STATUSES = [value for value, _ in Order.DELIVERY_STATUS_CHOICES]
+TERMINAL_STATUSES = {DELIVERED, CANCELLED}
+
+CUSTOMER = 'customer'
+STORE = 'store'
+ADMIN = 'admin'
+SHIPPER = 'shipper'
+
+CANCELLED_BY = {CUSTOMER: 'Khách hàng', STORE: 'Cửa hàng', ADMIN: 'Quản lý'}
+
+# Statuses an order may be read in. SHIPPING is only ever a source: shipper
+# assignment writes it, status moves never do
+_SOURCE_ORDER_STATUSES = ORDER_STATUSES + [SHIPPING]
+
+# Position of each status along the normal flow; SHIPPING replaced a pending or
+# confirmed status when the shipper was assigned
+_ORDER_RANK = {PENDING: 0, CONFIRMED: 1, SHIPPING: 1, PREPARING: 2, READY: 3, PICKED_UP: 4, DELIVERED: 5}
+
+
+def _store_targets(status):
+    if status in TERMINAL_STATUSES:
+        return {status}
+    later = {target for target in ORDER_STATUSES if _ORDER_RANK.get(target, -1) > _ORDER_RANK[status]}
+    return {status, CANCELLED} | later
+
+
+# order_status moves per actor, {from: {to, ...}}. Moving to the current status
+# is allowed where the actor may also update the order's other fields.
+ORDER_TRANSITIONS = {
+    CUSTOMER: {PENDING: {CANCELLED}},
+    # Stores move orders forward, or cancel them, until delivered or cancelled
+    STORE: {status: _store_targets(status) for status in _SOURCE_ORDER_STATUSES},
+    # Admins may correct any status
+    ADMIN: {status: set(ORDER_STATUSES) | {status} for status in _SOURCE_ORDER_STATUSES},
+}
+
+# delivery_status moves, made by the assigned shipper
+DELIVERY_TRANSITIONS = {
+    PENDING: {CONFIRMED},
+    CONFIRMED: {PICKED_UP},
+    PICKED_UP: {DELIVERED},
+    SHIPPING: {DELIVERED},  # Legacy: still allow from Đang giao
+}
+
+# order_status written together with a delivery_status move
+DELIVERY_ORDER_STATUS = {PICKED_UP: PICKED_UP, SHIPPING: SHIPPING, DELIVERED: DELIVERED}
+
+
+class InvalidTransition(Exception):
+    """The requested status is unknown or not reachable from the current one."""
+
+
+class TransitionConflict(InvalidTransition):
+    """The order changed status between being read and being updated."""
+
+
+def normalize_status(value):
+    """Strip and map either cancelled spelling to ``CANCELLED``."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return CANCELLED if value in CANCELLED_STATUSES else value
+
+
+def is_cancelled(value):
+    return normalize_status(value) == CANCELLED
+
+
+def _spellings(statuses):
+    """Stored values matching ``statuses``; cancelled rows may use either spelling."""
+    values = set(statuses)
+    if CANCELLED in values:
+        values.update(CANCELLED_STATUSES)
+    return sorted(values)
+
+
+def _table(role, field):
+    if field == 'delivery_status':
+        return DELIVERY_TRANSITIONS
+    return ORDER_TRANSITIONS[role]
+
+
+def sources_for(target, role, field='order_status'):
+    """Statuses from which ``role`` may move ``field`` to ``target``."""
+    target = normalize_status(target)
+    return [source for source, targets in _table(role, field).items() if target in targets]
+
+
+def check_transition(current, target, role, field='order_status'):
+    """Validate a move against the in-memory status; return the normalized target."""
+    target = normalize_status(target)
+    known = DELIVERY_STATUSES if field == 'delivery_status' else _SOURCE_ORDER_STATUSES
+    if target not in known:
+        raise InvalidTransition('Trạng thái không hợp lệ')
+    current = normalize_status(current)
+    if target not in _table(role, field).get(current, ()):
+        raise InvalidTransition(f'Không thể chuyển trạng thái từ "{current}" sang "{target}"')
+    return target
+
+
+def cancellation_fields(role, reason=None, when=None):
+    """Column values recorded when ``role`` cancels an order."""
+    fields = {'cancelled_date': when or get_vietnam_time(), 'cancelled_by_role': CANCELLED_BY[role]}
+    if reason:
+        fields['cancel_reason'] = reason
+    return fields
+
+
+def refund_request_fields(order, requested=None, bank_name=None, bank_account=None):
+    """Refund columns for a cancellation; non-cash payments always request a refund."""
+    non_cash_payment = str(order.payment_method).lower() not in ['cash', 'cod']
+    if not (requested is True or non_cash_payment):
+        return {}
+    fields = {'refund_requested': True, 'refund_status': 'Chờ xử lý'}
+    if bank_name:
+        fields['bank_name'] = bank_name
+    if bank_account:
+        fields['bank_account'] = bank_account
+    return fields
+
+
+def bulk_transition(queryset, target, role, field='order_status', **fields):
+    """Move every order of ``queryset`` whose status allows it, with one UPDATE.
+
+    ``fields`` are written in the same statement. Returns the number of orders moved.
+    """
+    target = normalize_status(target)
+    sources = sources_for(target, role, field)
+    if not sources:
+        return 0
+    values = {field: target, **fields}
+    queryset = queryset.filter(**{f'{field}__in': _spellings(sources)})
+    if field == 'delivery_status':
+        # Cancelled orders are never picked up or delivered
+        queryset = queryset.exclude(order_status__in=CANCELLED_STATUSES)
+        if target in DELIVERY_ORDER_STATUS:
+            values.setdefault('order_status', DELIVERY_ORDER_STATUS[target])
+    return queryset.update(**values)
+
+
+def transition(order, target, role, field='order_status', condition=None, **fields):
+    """Move one order and update the instance to match.
+
+    Raises ``InvalidTransition`` when the move is not allowed from the status on
+    ``order`` and ``TransitionConflict`` when the row no longer has that status
+    (or no longer matches ``condition``), e.g. a concurrent request moved it first.
+    """
+    target = check_transition(getattr(order, field), target, role, field)
+    if field == 'delivery_status' and is_cancelled(order.order_status):
+        raise InvalidTransition('Đơn hàng đã bị huỷ')
+    queryset = Order.objects.filter(pk=order.pk, **{field: getattr(order, field)})
+    if condition is not None:
+        queryset = queryset.filter(condition)
+    if not bulk_transition(queryset, target, role, field, **fields):
+        raise TransitionConflict('Trạng thái đơn hàng vừa được cập nhật, vui lòng tải lại')
+
+    setattr(order, field, target)
+    if field == 'delivery_status' and target in DELIVERY_ORDER_STATUS:
+        fields.setdefault('order_status', DELIVERY_ORDER_STATUS[target])
+    for name, value in fields.items():
+        setattr(order, name, value)
+    publish_orders([order])
+    return order
+
+
+def cancel_group(group_id, user, role=CUSTOMER, **fields):
+    """Cancel a whole checkout group in one statement, or none of it.
+
+    The UPDATE only matches when no order of the group is past the statuses
+    ``role`` may cancel from. Returns the number of orders cancelled.
+    """
+    group = Order.objects.filter(group_id=group_id, user=user)
+    blocked = group.exclude(order_status__in=_spellings(sources_for(CANCELLED, role)))
+    cancelled = bulk_transition(
+        group.filter(~Exists(blocked)), CANCELLED, role,
+        delivery_status=CANCELLED, **cancellation_fields(role), **fields,
+    )
+    if cancelled:
+        publish_rows(lambda: group.values(
+            'id', 'group_id', 'store_id', 'shipper_id', 'user_id', 'order_status', 'delivery_status',
+        ))
+    return cancelled
+
+
+def set_shipper(order, shipper):
+    """Assign (or, with ``None``, unassign) the shipper of ``order`` as a compare-and-set.
+
+    The UPDATE only matches while the row still has the shipper and order status
+    read into ``order``, so an admin assignment cannot overwrite a shipper who
+    accepted the order in the meantime. Raises ``TransitionConflict`` otherwise.
+    """
+    if is_cancelled(order.order_status):
+        raise InvalidTransition('Đơn hàng đã bị huỷ')
+    order_status = order.order_status
+    if shipper is not None and order_status in (PENDING, CONFIRMED):
+        order_status = SHIPPING
+    elif shipper is None and order_status == SHIPPING:
+        order_status = CONFIRMED
+
+    updated = Order.objects.filter(
+        pk=order.pk, shipper_id=order.shipper_id, order_status=order.order_status,
+    ).update(shipper=shipper, order_status=order_status)
+    if not updated:
+        raise TransitionConflict('Đơn hàng vừa được cập nhật, vui lòng tải lại')
+    order.shipper = shipper
+    order.order_status = order_status
+    publish_orders([order])
+    return order
@@ -3,9 +3,13 @@ from . import views
 
 urlpatterns = [
     path('', views.order_list_create, name='orders'),
+    path('shipping-fee/', views.shipping_fee_preview, name='shipping_fee_preview'),
     path('<int:pk>/', views.order_detail, name='order_detail'),
     path('<int:pk>/status/', views.update_order_status, name='update_status'),
     path('<int:pk>/cancel-group/', views.cancel_order_group, name='cancel_order_group'),
+    path('groups/<int:group_id>/', views.order_group_detail, name='order_group_detail'),
+    path('events/', views.order_events, name='order_events'),
+    path('events/token/', views.order_events_token, name='order_events_token'),
     
     # Admin endpoints
     path('admin/', views.admin_orders_list, name='admin_orders_list'),
@@ -1,30 +1,51 @@
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from decimal import Decimal, ROUND_HALF_UP
-import os
-import uuid
-from django.core.files.storage import default_storage
-from .models import Order, OrderDetail
+from .models import CANCELLED_STATUSES, ArchivedOrder, Order, OrderDetail
 from .serializers import OrderSerializer, OrderDetailSerializer
-from apps.menu.models import Food
+from apps.cart.lines import LinePrice, current_prices
+from apps.cart.store import get_cart_store
 from apps.cart.models import Cart, Item
 from apps.promotions.models import Promo
-from django.db import connection
+from django.db import connection, transaction
 from apps.stores.models import Store
 from apps.utils.shipping import (
-    driving_distance_km,
     calculate_shipping_fee,
     normalize_coordinate,
 )
+from apps.utils.route_cache import store_routes_km
+from apps.promotions.engine import evaluate_cart
+from apps.utils.idempotency import idempotent
+from apps.utils.instrumentation import current_trace, traced
+from apps.utils.pagination import InvalidCursor, cursor_page_fields, paginate_keyset, wants_cursor
+from apps.utils.uploads import discard_upload, save_upload
+from .archive import OrderHistory, find_order
+from .checkout import CheckoutWriter
+from .events import (
+    EventStreamRenderer, StreamTokenAuthentication, async_event_stream, event_stream, get_broker, stream_token,
+)
+from .facets import status_facets
+from .status import (
+    ADMIN, CANCELLED, CONFIRMED, CUSTOMER, DELIVERED, PENDING, SHIPPER, STORE,
+    InvalidTransition, TransitionConflict, cancel_group, cancellation_fields, check_transition,
+    is_cancelled, normalize_status, refund_request_fields, set_shipper, transition,
+)
 
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
+@traced('orders.list_create')
+@idempotent('checkout')
 def order_list_create(request):
     """List orders or create new order"""
     if request.method == 'GET':
@@ -41,15 +62,20 @@ def order_list_create(request):
                 Q(order_status='Đã hủy') | Q(order_status='Đã huỷ')  # Exclude cancelled orders (both spellings)
             ).exclude(
                 Q(delivery_status='Đã hủy') | Q(delivery_status='Đã huỷ')  # Also exclude by delivery_status (both spellings)
-            ).order_by('-created_date')
+            ).select_related('user__role', 'shipper__user__role', 'store').order_by('-created_date')
         else:
             # List user's orders sorted by id descending (normal user use case)
-            orders = Order.objects.filter(user=request.user).order_by('-id')
+            orders = Order.objects.filter(user=request.user).select_related('user__role', 'shipper__user__role', 'store').order_by('-id')
+            archived_orders = ArchivedOrder.objects.filter(user=request.user).order_by('-id')
 
             # Filter by status
             status_filter = request.GET.get('status')
             if status_filter:
                 orders = orders.filter(order_status=status_filter)
+                archived_orders = archived_orders.filter(order_status=status_filter)
+
+            # Older delivered/cancelled orders continue from the archive
+            orders = OrderHistory(orders, archived_orders)
         
         # Pagination
         page = request.GET.get('page', 1)
@@ -70,16 +96,24 @@ def order_list_create(request):
     elif request.method == 'POST':
         # Create new order(s) - split by stores
         try:
-            # Get cart
+            # Get cart, with changes still held by the cart store written first
+            cart_store = get_cart_store()
+            item_ids = cart_store.flush(request.user)
             cart = Cart.objects.get(user=request.user)
 
-            # Retrieve cart items via raw SQL to get item id and food_option_id
+            # Retrieve cart items via raw SQL to get item id, food_option_id and the
+            # pricing snapshot, with whether the food's price changed since (stale)
             with connection.cursor() as cursor:
                 cursor.execute(
-                    "SELECT i.id, i.food_id, i.quantity, i.item_note, f.store_id, i.food_option_id FROM item i JOIN food f ON i.food_id = f.id WHERE i.cart_id = %s",
+                    "SELECT i.id, i.food_id, i.quantity, i.item_note, f.store_id, i.food_option_id, "
+                    "i.food_price, i.food_option_price, i.price_version, i.price_version <> f.price_version "
+                    "FROM item i JOIN food f ON i.food_id = f.id WHERE i.cart_id = %s",
                     [cart.id]
                 )
-                cart_rows = cursor.fetchall()
+                rows = cursor.fetchall()
+            cart_rows = [row[:6] for row in rows]
+            line_prices = {row[0]: LinePrice(*row[6:9]) for row in rows}
+            stale_ids = {row[0] for row in rows if row[9]}
 
             # Optional: filter cart items by selected_item_ids from frontend (for partial checkout)
             raw_selected_ids = request.data.get('selected_item_ids') or request.data.get('selected_items') or []
@@ -89,7 +123,8 @@ def order_list_create(request):
                     raw_selected_ids = [raw_selected_ids]
                 for raw_id in raw_selected_ids:
                     try:
-                        selected_item_ids.add(int(raw_id))
+                        # Lines read before the flush carry their provisional id
+                        selected_item_ids.add(item_ids.get(int(raw_id), int(raw_id)))
                     except (TypeError, ValueError):
                         continue
 
@@ -111,26 +146,27 @@ def order_list_create(request):
             store_ids = [store_id for store_id in items_by_store.keys() if store_id is not None]
             stores_cache = {store.id: store for store in Store.objects.filter(id__in=store_ids)}
             
-            # Get food prices for calculating totals
-            food_ids = [food_id for _, food_id, _, _, _, _ in cart_rows]
-            foods = {f.id: f for f in Food.objects.filter(id__in=food_ids)}
-            
-            # Get food options for price calculations
-            food_option_ids = [food_option_id for _, _, _, _, _, food_option_id in cart_rows if food_option_id]
-            food_options = {}
-            if food_option_ids:
-                from apps.menu.models import FoodSize
-                food_options = {fs.id: fs for fs in FoodSize.objects.filter(id__in=food_option_ids)}
-
-            # Calculate selected cart total (only chosen items)
-            selected_cart_total = Decimal('0')
-            for _, food_id, quantity, _, _, food_option_id in cart_rows:
-                food = foods.get(food_id)
-                if food:
-                    item_price = food.price
-                    if food_option_id and food_option_id in food_options:
-                        item_price += food_options[food_option_id].price
-                    selected_cart_total += item_price * Decimal(str(quantity))
+            # Price the lines from their pricing snapshots; only lines whose food
+            # price changed since they were added are priced from the catalog
+            prices = {row[0]: line_prices[row[0]] for row in cart_rows}
+            price_changes = []
+            stale_rows = [row for row in cart_rows if row[0] in stale_ids]
+            if stale_rows:
+                current = current_prices((food_id, food_option_id) for _, food_id, _, _, _, food_option_id in stale_rows)
+                for item_id, food_id, _, _, _, food_option_id in stale_rows:
+                    price = current.get((food_id, food_option_id))
+                    if price is None:
+                        continue
+                    # Version 0: the line was written without a snapshot
+                    if prices[item_id].price_version and price.unit_price != prices[item_id].unit_price:
+                        price_changes.append({
+                            'item_id': item_id,
+                            'food_id': food_id,
+                            'food_option_id': food_option_id,
+                            'old_unit_price': prices[item_id].unit_price,
+                            'unit_price': price.unit_price,
+                        })
+                    prices[item_id] = price
             
             # Determine drop-off coordinates (prefer request payload, fallback to profile)
             customer_latitude = normalize_coordinate(request.data.get('ship_latitude'))
@@ -152,269 +188,202 @@ def order_list_create(request):
                 'payment_method': request.data.get('payment_method', 'COD'),
             }
             
-            # Apply promo if provided
-            promo_discount = Decimal('0')
-            applied_promos = []
-            multi_promo_support = False
-            
-            # Debug: Print received promo data
-            print(f"Received promo data: promo_ids={request.data.get('promo_ids')}, discount_amount={request.data.get('discount_amount')}")
-            
-            # Handle multiple promos (new format)
-            promo_ids = request.data.get('promo_ids', [])
-            discount_amount = request.data.get('discount_amount', 0)
-            promo_details = request.data.get('promo_details', [])  # New: detailed promo info
-            
-            if promo_ids and discount_amount:
-                # Use discount amount calculated by frontend - convert to Decimal
-                promo_discount = Decimal(str(discount_amount))
-                applied_promos = promo_ids
-                # Set first promo as primary for database storage
-                base_order_data['promo'] = promo_ids[0] if promo_ids else None
-                print(f"Applied multiple promos: {applied_promos}, discount: {promo_discount}")
-                print(f"Promo details: {promo_details}")
-                
-                # Store promo info for order_promo table
-                try:
-                    from apps.promotions.order_promo import OrderPromo
-                    multi_promo_support = True
-                except ImportError:
-                    multi_promo_support = False
-                
-                # Validate discount amount is reasonable
-                if promo_discount > Decimal('10000000'):  # 10 million VND max discount
-                    print(f"ERROR: Discount too large: {promo_discount}")
-                    return Response({
-                        'error': f'Số tiền giảm giá quá lớn: {promo_discount}'
-                    }, status=status.HTTP_400_BAD_REQUEST)
-            else:
-                # Handle single promo (legacy format)  
-                promo_id = request.data.get('promo_id')
-                if promo_id:
-                    try:
-                        from django.utils import timezone
-                        now = timezone.now()
-                        promo = Promo.objects.get(
-                            id=promo_id,
-                            start_date__lte=now,
-                            end_date__gte=now
-                        )
-                        if selected_cart_total >= promo.minimum_pay:
-                            # Sử dụng method calculate_discount từ model
-                            promo_discount = promo.calculate_discount(selected_cart_total)
-                            base_order_data['promo'] = promo.id
-                            applied_promos = [promo_id]
-                            print(f"Applied single promo: {promo_id}, discount: {promo_discount}")
-                    except Promo.DoesNotExist:
-                        print(f"Promo {promo_id} not found or expired")
-                        pass
-            
-            created_orders = []
-            first_order_id = None
-            
             # Calculate total cart amount for promo distribution
             total_cart_amount = Decimal('0')
             store_subtotals = {}
             for store_id, store_items in items_by_store.items():
                 store_subtotal = Decimal('0')
-                for _, food_id, quantity, item_note, food_option_id in store_items:
-                    food = foods.get(food_id)
-                    if food:
-                        # Calculate item total: food_price + food_option_price (if any)
-                        item_price = food.price
-                        if food_option_id and food_option_id in food_options:
-                            item_price += food_options[food_option_id].price
-                        store_subtotal += item_price * Decimal(str(quantity))
+                for item_id, food_id, quantity, item_note, food_option_id in store_items:
+                    # Calculate item total: food_price + food_option_price (if any)
+                    store_subtotal += prices[item_id].unit_price * Decimal(str(quantity))
                 store_subtotals[store_id] = store_subtotal
                 total_cart_amount += store_subtotal
             
-            print(f"Total cart amount: {total_cart_amount}, Promo discount: {promo_discount}")
-            print(f"Number of stores: {len(items_by_store)}")
-            
-            # Create separate order for each store
+            # Requested promos: promo_ids (multi-promo checkout) or legacy promo_id.
+            # Discounts are evaluated server-side; the client's discount_amount is
+            # only compared against the result (a mismatch is a 409), never trusted.
+            requested_promo_ids = request.data.get('promo_ids') or []
+            if not isinstance(requested_promo_ids, (list, tuple)):
+                requested_promo_ids = [requested_promo_ids]
+            if not requested_promo_ids and request.data.get('promo_id'):
+                requested_promo_ids = [request.data.get('promo_id')]
+
+            promo_result = evaluate_cart(store_subtotals, requested_promo_ids)
+            if promo_result.unknown:
+                return Response({
+                    'promo': [f'Invalid or expired promo code: {promo_id}' for promo_id in promo_result.unknown]
+                }, status=status.HTTP_400_BAD_REQUEST)
+            # A selected promo that does not apply (minimum amount, store scope)
+            # fails the checkout instead of being dropped silently
+            if promo_result.rejected:
+                return Response({
+                    'promo': [f'Promo {promo_id}: {reason}' for promo_id, reason in promo_result.rejected.items()]
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            promo_discount = promo_result.total_discount
+            primary_promo_id = promo_result.primary_promo_id
+            try:
+                # Clients sum per-promo amounts in floating point (3345.2999999999997);
+                # compare at the engine's 0.01 precision
+                client_discount = Decimal(str(request.data.get('discount_amount'))).quantize(
+                    Decimal('0.01'), rounding=ROUND_HALF_UP,
+                )
+            except ArithmeticError:
+                client_discount = None
+            trace = current_trace()
+            trace.set(
+                stores=len(items_by_store),
+                lines=len(cart_rows),
+                cart_total=total_cart_amount,
+                promo_discount=promo_discount,
+                promos_applied=len(promo_result.applied),
+                stale_lines=len(stale_rows),
+            )
+            if client_discount is not None and client_discount != promo_discount:
+                # The customer confirmed a different discount than the one that would
+                # be charged: return the server's figures instead of creating orders
+                trace.set(client_discount=client_discount)
+                return Response({
+                    'error': 'Số tiền giảm giá đã thay đổi, vui lòng xác nhận lại đơn hàng',
+                    'discount_amount': promo_discount,
+                    'promo_details': [
+                        {'promo_id': entry.id, 'discount_amount': amount} for entry, amount in promo_result.applied
+                    ],
+                    'price_changes': price_changes,
+                }, status=status.HTTP_409_CONFLICT)
+
+            # Resolve every store's route (route cache first, then concurrent Directions
+            # lookups) before the transaction opens, so checkout waits for the slowest
+            # lookup instead of their sum
+            with trace.step('routes'):
+                store_routes = store_routes_km(stores_cache.values(), customer_latitude, customer_longitude)
+
+            # Build every order in memory; nothing touches the database until writer.save()
+            writer = CheckoutWriter(base_order_data)
             for store_id, store_items in items_by_store.items():
                 store_subtotal = store_subtotals[store_id]
-                
-                store_obj = stores_cache.get(store_id)
-                distance_km = None
-                route_polyline = None
-                if store_obj:
-                    route_info = driving_distance_km(
-                        getattr(store_obj, 'latitude', None),
-                        getattr(store_obj, 'longitude', None),
-                        customer_latitude,
-                        customer_longitude,
-                    )
-                    distance_km = route_info.distance_km
-                    route_polyline = route_info.polyline
+
+                route_info = store_routes.get(store_id)
+                distance_km = route_info.distance_km if route_info else None
+                route_polyline = route_info.polyline if route_info else None
 
                 shipping_fee_decimal = calculate_shipping_fee(distance_km)
                 store_total_before_discount = store_subtotal + shipping_fee_decimal
-                
-                print(f"Store {store_id}: subtotal={store_subtotal}, distance_km={distance_km}, shipping={shipping_fee_decimal}, before_discount={store_total_before_discount}")
-                
-                # Apply promo discount proportionally based on store subtotal
-                store_discount = Decimal('0')
-                if promo_discount > Decimal('0') and total_cart_amount > Decimal('0'):
-                    # For single store: apply full discount to that store
-                    if len(items_by_store) == 1:
-                        store_discount = promo_discount
-                    else:
-                        # For multiple stores: distribute proportionally
-                        store_ratio = store_subtotal / total_cart_amount
-                        store_discount = (promo_discount * store_ratio).quantize(Decimal('1'), rounding='ROUND_HALF_UP')
-                    
-                    print(f"Store {store_id}: calculated discount={store_discount}")
-                    
-                    # Apply discount but ensure total >= shipping_fee
-                    store_total = max(shipping_fee_decimal, store_total_before_discount - store_discount)
-                    # Round to 3 decimal places
-                    store_total = store_total.quantize(Decimal('0.001'), rounding=ROUND_HALF_UP)
-                    print(f"Store {store_id}: final total after discount={store_total}")
-                else:
-                    store_total = store_total_before_discount.quantize(Decimal('0.001'), rounding=ROUND_HALF_UP)
-                    print(f"Store {store_id}: no discount applied, final total={store_total}")
-                
+            
+                # Discount allocated to this store by the promotion engine
+                store_discount = promo_result.store_discount(store_id)
+                store_total = max(shipping_fee_decimal, store_total_before_discount - store_discount)
+                store_total = store_total.quantize(Decimal('0.001'), rounding=ROUND_HALF_UP)
+            
                 # Validate total_money is reasonable  
                 if store_total > Decimal('9999999999.999'):  # Max 13 digits with 3 decimal places
-                    print(f"ERROR: Store {store_id} total too large: {store_total}")
-                    print(f"DEBUG: subtotal={store_subtotal}, shipping={shipping_fee_decimal}, discount={store_discount}")
-                    print(f"DEBUG: before_discount={store_total_before_discount}")
+                    trace.error(
+                        'store total too large', store_id=store_id, total=store_total,
+                        subtotal=store_subtotal, shipping=shipping_fee_decimal, discount=store_discount,
+                    )
                     return Response({
                         'error': f'Calculated total for store {store_id} is too large: {store_total}. Subtotal: {store_subtotal}, Shipping: {shipping_fee_decimal}, Discount: {store_discount}'
                     }, status=status.HTTP_400_BAD_REQUEST)
-                
-                # Create order data for this store
-                order_data = base_order_data.copy()
-                # total_money should be FOOD ONLY (no shipping, no discount applied)
-                order_data['total_money'] = float(store_subtotal)
-                order_data['store_id'] = store_id
-                order_data['shipping_fee'] = shipping_fee_decimal
-                if route_polyline:
-                    order_data['route_polyline'] = route_polyline
-                
-                # Only set promo on the first order (for database storage)
-                if len(created_orders) > 0:
-                    order_data.pop('promo', None)
-                
-                serializer = OrderSerializer(data=order_data)
-                if serializer.is_valid():
-                    order = serializer.save()
-                    
-                    # Set group_id - first order's id becomes the group_id for all
-                    if first_order_id is None:
-                        first_order_id = order.id
-                    
-                    order.group_id = first_order_id
-                    if route_polyline and not order.route_polyline:
-                        order.route_polyline = route_polyline
-                    
-                    # Update financial fields if they exist
-                    if hasattr(order, 'total_before_discount'):
-                        # total_money is already set to store_subtotal (food only)
-                        # Now calculate with shipping and discount
-                        order.total_before_discount = store_subtotal + shipping_fee_decimal
-                        order.total_discount = store_discount
-                        order.total_after_discount = max(shipping_fee_decimal, order.total_before_discount - store_discount)
-                        # total_money remains as food subtotal only (no shipping, no discount)
-                    
-                    order.save()
-                    
-                    # Save promotions for this specific store
-                    if applied_promos and multi_promo_support and promo_details:
-                        try:
-                            # Find promos that apply to this store
-                            for promo_detail in promo_details:
-                                promo_id = promo_detail.get('promo_id')
-                                promo_store_id = promo_detail.get('store_id')
-                                promo_discount_amount = Decimal(str(promo_detail.get('discount', 0)))
-                                
-                                # Apply promo to this order if:
-                                # 1. It's a system-wide promo (store_id = 0), OR
-                                # 2. It's specific to this store
-                                if promo_store_id == 0:
-                                    # System-wide promo: distribute proportionally
-                                    if total_cart_amount > Decimal('0'):
-                                        store_ratio = store_subtotal / total_cart_amount
-                                        individual_discount = (promo_discount_amount * store_ratio).quantize(Decimal('0.01'), rounding='ROUND_HALF_UP')
-                                    else:
-                                        individual_discount = Decimal('0')
-                                elif promo_store_id == store_id:
-                                    # Store-specific promo: full discount
-                                    individual_discount = promo_discount_amount
-                                else:
-                                    # This promo doesn't apply to this store
-                                    continue
-                                
-                                if individual_discount > Decimal('0'):
-                                    promo = Promo.objects.get(id=promo_id)
-                                    OrderPromo.objects.create(
-                                        order=order,
-                                        promo=promo,
-                                        applied_amount=individual_discount,
-                                        note=f"Store {store_id}"
-                                    )
-                                    print(f"Saved promo {promo_id} for order {order.id}, store {store_id}, discount: {individual_discount}")
-                        except Exception as e:
-                            print(f"Warning: Could not save promos for store {store_id}: {e}")
-                            import traceback
-                            traceback.print_exc()
-                    
-                    # Insert order details for this store
-                    with connection.cursor() as cursor:
-                        for _, food_id, quantity, item_note, food_option_id in store_items:
-                            food = foods.get(food_id)
-                            if food:
-                                # Get food_option price if exists
-                                food_option_price = None
-                                if food_option_id and food_option_id in food_options:
-                                    food_option_price = food_options[food_option_id].price
-                                
-                                # Insert order detail with separate food_price and food_option_price
-                                cursor.execute(
-                                    "INSERT INTO order_detail (order_id, food_id, food_option_id, quantity, food_price, food_option_price, food_note) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-                                    [order.id, food_id, food_option_id, quantity, food.price, food_option_price, item_note]
-                                )
-                    
-                    created_orders.append(order)
-                else:
-                    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+                order = writer.add_order(
+                    store_id,
+                    store=stores_cache.get(store_id),
+                    # total_money is FOOD ONLY (no shipping, no discount applied)
+                    total_money=store_subtotal,
+                    shipping_fee=shipping_fee_decimal,
+                    route_polyline=route_polyline,
+                    promo_id=primary_promo_id if len(writer.orders) == 0 else None,
+                    total_before_discount=store_total_before_discount,
+                    total_discount=store_discount,
+                    total_after_discount=max(shipping_fee_decimal, store_total_before_discount - store_discount),
+                )
+
+                allocations = promo_result.allocations.get(store_id)
+                if allocations:
+                    writer.add_promos(order, allocations, note=f"Store {store_id}")
+
+                writer.add_details(order, store_items, prices)
+
+            errors = writer.validate()
+            if errors:
+                return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+            with trace.step('write'), transaction.atomic():
+                # Orders, group_id, order details and promos in four statements
+                first_order_id = writer.save()
             
-            # Clear only the items that were actually ordered; if none specified, clear all
-            with connection.cursor() as cursor:
+                # Clear only the items that were actually ordered; if none specified, clear all
                 if selected_item_ids:
-                    placeholders = ','.join(['%s'] * len(selected_item_ids))
-                    params = [cart.id, *selected_item_ids]
-                    cursor.execute(
-                        f"DELETE FROM item WHERE cart_id = %s AND id IN ({placeholders})",
-                        params
-                    )
+                    cart_store.discard_ordered(request.user, cart.id, [row[0] for row in cart_rows], -total_cart_amount)
                 else:
-                    cursor.execute("DELETE FROM item WHERE cart_id = %s", [cart.id])
-            cart.update_total()
+                    cart_store.discard_ordered(request.user, cart.id)
+            trace.set(group_id=first_order_id)
             
-            # Return all created orders
-            serializer = OrderSerializer(created_orders, many=True)
+            # Return all created orders, built from the rows already in memory, with
+            # the lines whose price changed since they were added to the cart
             return Response({
-                'message': f'Đã tạo {len(created_orders)} đơn hàng cho {len(items_by_store)} cửa hàng',
+                'message': f'Đã tạo {len(writer.orders)} đơn hàng cho {len(items_by_store)} cửa hàng',
                 'group_id': first_order_id,
-                'orders': serializer.data
+                'orders': writer.response_data(),
+                'price_changes': price_changes
             }, status=status.HTTP_201_CREATED)
             
         except Cart.DoesNotExist:
             return Response({'error': 'No cart found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def shipping_fee_preview(request):
+    """Preview per-store distance and shipping fee for a drop-off point"""
+    raw_store_ids = request.GET.get('store_ids', '')
+    store_ids = []
+    for raw_id in raw_store_ids.split(','):
+        try:
+            store_ids.append(int(raw_id))
+        except (TypeError, ValueError):
+            continue
+    if not store_ids:
+        return Response({'error': 'store_ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    customer_latitude = normalize_coordinate(request.GET.get('ship_latitude'))
+    customer_longitude = normalize_coordinate(request.GET.get('ship_longitude'))
+    if customer_latitude is None or customer_longitude is None:
+        customer_latitude = normalize_coordinate(getattr(request.user, 'latitude', None))
+        customer_longitude = normalize_coordinate(getattr(request.user, 'longitude', None))
+
+    stores = Store.objects.filter(id__in=store_ids).only('id', 'latitude', 'longitude')
+    routes = store_routes_km(stores, customer_latitude, customer_longitude)
+
+    results = []
+    for store_id in store_ids:
+        route_info = routes.get(store_id)
+        distance_km = route_info.distance_km if route_info else None
+        results.append({
+            'store_id': store_id,
+            'distance_km': round(distance_km, 3) if distance_km is not None else None,
+            'shipping_fee': calculate_shipping_fee(distance_km),
+            'route_polyline': route_info.polyline if route_info else None,
+        })
+
+    return Response({
+        'results': results,
+        'total_shipping_fee': sum((item['shipping_fee'] for item in results), Decimal('0')),
+    })
+
+
 @api_view(['GET', 'PUT'])
 @permission_classes([IsAuthenticated])
 def order_detail(request, pk):
     """Get or update order detail"""
-    order = get_object_or_404(Order, pk=pk, user=request.user)
+    order = find_order(pk=pk, user=request.user)
+    if order is None:
+        return Response({'detail': 'No Order matches the given query.'}, status=status.HTTP_404_NOT_FOUND)
     if request.method == 'GET':
         serializer = OrderSerializer(order, context={'request': request})
         return Response(serializer.data)
     # PUT: update receiver info if status is 'Chờ xác nhận'
-    if order.order_status != 'Chờ xác nhận':
+    if order.is_archived or order.order_status != 'Chờ xác nhận':
         return Response({'error': 'Không thể cập nhật đơn hàng này'}, status=status.HTTP_400_BAD_REQUEST)
     # Update allowed fields
     order.receiver_name = request.data.get('receiver_name', order.receiver_name)
@@ -430,57 +399,29 @@ def order_detail(request, pk):
 @permission_classes([IsAuthenticated])
 def update_order_status(request, pk):
     """Update order status"""
-    print(f"=== UPDATE ORDER STATUS DEBUG ===")
-    print(f"Order ID: {pk}")
-    print(f"Request data: {request.data}")
-    print(f"User: {request.user}")
-    
     order = get_object_or_404(Order, pk=pk, user=request.user)
     
-    new_status = request.data.get('order_status')
-    cancel_reason = request.data.get('cancel_reason')
-    bank_name = request.data.get('bank_name')
-    bank_account = request.data.get('bank_account')
-    refund_requested_flag = request.data.get('refund_requested')
-    
-    print(f"New status: {new_status}")
-    print(f"Cancel reason: {cancel_reason}")
-    
-    # Only allow customer to cancel with Vietnamese status
-    if new_status not in ['Đã huỷ', 'Đã hủy']:
+    # Only allow customer to cancel (either spelling)
+    if not is_cancelled(request.data.get('order_status')):
         return Response({'error': 'Trạng thái không hợp lệ'}, status=status.HTTP_400_BAD_REQUEST)
     
+    fields = cancellation_fields(CUSTOMER, request.data.get('cancel_reason'))
+    # Handle refund info when non-cash payment
+    fields.update(refund_request_fields(
+        order,
+        request.data.get('refund_requested'),
+        request.data.get('bank_name'),
+        request.data.get('bank_account'),
+    ))
+    
     # Only cancel if current status is 'Chờ xác nhận'
-    if order.order_status not in ['Chờ xác nhận']:
+    try:
+        transition(order, CANCELLED, CUSTOMER, **fields)
+    except TransitionConflict as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    except InvalidTransition:
         return Response({'error': 'Không thể hủy đơn hàng này'}, status=status.HTTP_400_BAD_REQUEST)
     
-    order.order_status = new_status
-    if cancel_reason:
-        order.cancel_reason = cancel_reason
-        print(f"Saved cancel_reason: {cancel_reason}")
-    
-    # Set cancellation information
-    if new_status == 'Đã huỷ':
-        from apps.orders.models import get_vietnam_time
-        order.cancelled_date = get_vietnam_time()
-        order.cancelled_by_role = 'Khách hàng'  # Customer is cancelling
-        print(f"Set cancelled_date and cancelled_by_role: Khách hàng")
-
-        # Handle refund info when non-cash payment
-        non_cash_payment = str(order.payment_method).lower() not in ['cash', 'cod']
-        refund_requested = refund_requested_flag is True or non_cash_payment
-        if refund_requested:
-            order.refund_requested = True
-            order.refund_status = 'Chờ xử lý'
-            if bank_name:
-                order.bank_name = bank_name
-            if bank_account:
-                order.bank_account = bank_account
-    
-    order.save()
-    print(f"Order saved successfully")
-    print(f"=== END UPDATE ORDER STATUS DEBUG ===")
-    
     return Response(OrderSerializer(order).data)
 
 
@@ -495,12 +436,11 @@ def cancel_order_group(request, pk):
         return update_order_status(request, pk)
     
     # Get all orders in the same group
-    group_orders = Order.objects.filter(group_id=order.group_id, user=request.user)
+    group_orders = list(Order.objects.filter(group_id=order.group_id, user=request.user).select_related('store'))
     
     # Check if all orders in group are still "Chờ xác nhận"
-    non_pending_orders = group_orders.exclude(order_status='Chờ xác nhận')
-    if non_pending_orders.exists():
-        non_pending_list = list(non_pending_orders.values_list('id', 'order_status'))
+    non_pending_list = [(group_order.id, group_order.order_status) for group_order in group_orders if group_order.order_status != PENDING]
+    if non_pending_list:
         return Response({
             'error': 'Không thể hủy nhóm đơn hàng này. Có đơn hàng đã được xử lý.',
             'non_pending_orders': non_pending_list
@@ -524,20 +464,15 @@ def cancel_order_group(request, pk):
             'total_orders': len(group_details)
         })
     
-    # If confirmed, cancel all orders in the group
+    # If confirmed, cancel all orders in the group with one conditional UPDATE
     if request.data.get('confirmed'):
-        cancelled_orders = []
-        from apps.orders.models import get_vietnam_time
-        cancel_time = get_vietnam_time()
-        
-        for group_order in group_orders:
-            group_order.order_status = 'Đã hủy'
-            group_order.delivery_status = 'Đã hủy'
-            group_order.cancelled_date = cancel_time
-            group_order.cancelled_by_role = 'Khách hàng'  # Group cancellation is done by customer
-            group_order.save()
-            cancelled_orders.append(group_order.id)
+        if not cancel_group(order.group_id, request.user, CUSTOMER):
+            # A store confirmed one of the orders after the check above
+            return Response({
+                'error': 'Không thể hủy nhóm đơn hàng này. Có đơn hàng đã được xử lý.'
+            }, status=status.HTTP_409_CONFLICT)
         
+        cancelled_orders = [group_order.id for group_order in group_orders]
         return Response({
             'message': f'Đã hủy thành công {len(cancelled_orders)} đơn hàng trong nhóm',
             'cancelled_orders': cancelled_orders
@@ -552,6 +487,140 @@ def cancel_order_group(request, pk):
     })
 
 
+def _group_totals(queryset):
+    """Totals of a group's orders, summed by the database in one query."""
+    zero = Value(Decimal('0'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    return queryset.order_by().aggregate(
+        order_count=Count('id'),
+        item_count=Coalesce(Sum('item_count'), 0),
+        items_subtotal=Coalesce(Sum('items_subtotal'), zero),
+        shipping_fee=Coalesce(Sum('shipping_fee'), zero),
+        total_before_discount=Coalesce(Sum('total_before_discount'), zero),
+        total_discount=Coalesce(Sum('total_discount'), zero),
+        total_after_discount=Coalesce(Sum('total_after_discount'), zero),
+        pending_count=Count('id', filter=Q(order_status=PENDING)),
+        cancelled_count=Count('id', filter=Q(order_status__in=CANCELLED_STATUSES)),
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def order_group_detail(request, group_id):
+    """All orders of one checkout with their items, stores, promos and group totals"""
+    filters = {'group_id': group_id}
+    if not is_admin(request.user):
+        filters['user'] = request.user
+    
+    live = Order.objects.filter(**filters)
+    orders = list(live.select_related('user__role', 'shipper__user__role', 'store').order_by('id'))
+    totals = _group_totals(live)
+    # Orders of an old checkout may have been moved to the archive
+    archived = ArchivedOrder.objects.filter(**filters)
+    archived_orders = [order.as_order() for order in archived.order_by('id')]
+    if archived_orders:
+        archived_totals = _group_totals(archived)
+        totals = {key: value + archived_totals[key] for key, value in totals.items()}
+        orders = sorted(orders + archived_orders, key=lambda order: order.id)
+    
+    if not orders:
+        return Response({'error': 'Không tìm thấy nhóm đơn hàng'}, status=status.HTTP_404_NOT_FOUND)
+    
+    totals['can_cancel'] = totals['pending_count'] == totals['order_count']
+    serializer = OrderSerializer(orders, many=True, context={'request': request})
+    return Response({
+        'group_id': group_id,
+        'totals': totals,
+        'orders': serializer.data,
+    })
+
+
+def _event_channels(request):
+    """Channels requested with ``order``/``group``/``store``/``shipper`` that the user may follow.
+
+    Returns ``(channels, None)`` or ``(None, error response)``. Without parameters
+    the user follows their own orders.
+    """
+    from apps.shipper.models import Shipper
+
+    user = request.user
+    admin = is_admin(user)
+    channels = []
+    try:
+        order_id = request.GET.get('order')
+        if order_id:
+            order = find_order(pk=int(order_id))
+            allowed = order is not None and (
+                admin or order.user_id == user.id
+                or Store.objects.filter(pk=order.store_id, manager=user).exists()
+                or Shipper.objects.filter(pk=order.shipper_id, user=user).exists()
+            )
+            if not allowed:
+                return None, Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+            channels.append(f'order:{order.pk}')
+        group_id = request.GET.get('group')
+        if group_id:
+            group_id = int(group_id)
+            if not admin and not Order.objects.filter(group_id=group_id, user=user).exists():
+                return None, Response({'error': 'Không tìm thấy nhóm đơn hàng'}, status=status.HTTP_404_NOT_FOUND)
+            channels.append(f'group:{group_id}')
+        store_id = request.GET.get('store')
+        if store_id:
+            store_id = int(store_id)
+            if not admin and not Store.objects.filter(pk=store_id, manager=user).exists():
+                return None, Response({'error': 'Store Manager access required'}, status=status.HTTP_403_FORBIDDEN)
+            channels.append(f'store:{store_id}')
+        shipper_id = request.GET.get('shipper')
+        if shipper_id:
+            shipper_id = int(shipper_id)
+            if not admin and not Shipper.objects.filter(pk=shipper_id, user=user).exists():
+                return None, Response({'error': 'User is not this shipper'}, status=status.HTTP_403_FORBIDDEN)
+            channels.append(f'shipper:{shipper_id}')
+    except ValueError:
+        return None, Response({'error': 'Invalid id'}, status=status.HTTP_400_BAD_REQUEST)
+    return channels or [f'user:{user.id}'], None
+
+
+@api_view(['GET'])
+@authentication_classes([StreamTokenAuthentication])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def order_events(request):
+    """Server-Sent Events stream of status changes for the requested orders"""
+    asgi = isinstance(request._request, ASGIRequest)
+    if not asgi and not settings.ORDER_EVENTS_WSGI_STREAMING:
+        # Every open stream would hold a WSGI worker until it closes
+        return Response(
+            {'error': 'Event stream cần chạy qua ASGI (fastfood_api.asgi)'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    channels, error = _event_channels(request)
+    if error is not None:
+        return error
+    
+    # EventSource resends the id of the last event it saw when it reconnects
+    last_id = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('last_event_id')
+    try:
+        last_id = int(last_id) if last_id else get_broker().last_id()
+    except ValueError:
+        last_id = get_broker().last_id()
+    
+    stream = async_event_stream if asgi else event_stream
+    response = StreamingHttpResponse(
+        stream(channels, last_id, settings.ORDER_EVENTS_STREAM_SECONDS, settings.ORDER_EVENTS_HEARTBEAT_SECONDS),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def order_events_token(request):
+    """Short-lived token for opening the event stream with EventSource (``?token=``)"""
+    return Response({'token': stream_token(request.user), 'expires_in': settings.ORDER_EVENTS_TOKEN_SECONDS})
+
+
 # Admin-only views for order management
 def is_admin(user):
     return user.is_authenticated and user.role_id and user.role_id == 2
@@ -570,23 +639,18 @@ def admin_orders_list(request):
         return Response({'error': 'Admin or Store Manager access required'}, status=status.HTTP_403_FORBIDDEN)
     
     # List orders sorted by descending ID
-    orders = Order.objects.select_related('user').order_by('-id')
+    orders = Order.objects.select_related('user__role', 'shipper__user__role', 'store').order_by('-id')
     # If store manager, filter orders by their store
     if is_store_manager(request.user):
         from apps.stores.models import Store
         try:
             user_store = Store.objects.get(manager=request.user)
-            orders = orders.filter(orderdetail__food__store=user_store).distinct()
+            orders = orders.filter(details__food__store=user_store).distinct()
         except Store.DoesNotExist:
             return Response({'error': 'Store not found for user'}, status=status.HTTP_404_NOT_FOUND)
         except Exception:
             return Response({'error': 'Store not found for user'}, status=status.HTTP_404_NOT_FOUND)
     
-    # Filter by status
-    status_filter = request.GET.get('status')
-    if status_filter:
-        orders = orders.filter(order_status=status_filter)
-    
     # Search by customer info, order ID, or receiver name
     search = request.GET.get('search')
     if search:
@@ -597,10 +661,31 @@ def admin_orders_list(request):
             Q(id__icontains=search) |
             Q(receiver_name__icontains=search)
         )
+
+    # Tab badges for every status, counted before the status filter
+    facets = status_facets(orders)
+
+    # Filter by status
+    status_filter = request.GET.get('status')
+    if status_filter:
+        orders = orders.filter(order_status=status_filter)
     
     # Pagination with configurable per_page
     page = request.GET.get('page', 1)
     per_page = min(int(request.GET.get('per_page', 10)), 100)  # Max 100 per page for performance
+
+    if wants_cursor(request):
+        try:
+            cursor_page = paginate_keyset(request, orders, ('-id',), per_page)
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = OrderSerializer(cursor_page.items, many=True)
+        return Response({
+            'orders': serializer.data,
+            **cursor_page_fields(request, cursor_page, orders),
+            'status_counts': facets['order_status'],
+        })
+
     paginator = Paginator(orders, per_page)
     page_obj = paginator.get_page(page)
     
@@ -609,7 +694,8 @@ def admin_orders_list(request):
         'orders': serializer.data,
         'total_pages': paginator.num_pages,
         'current_page': int(page),
-        'total_orders': paginator.count
+        'total_orders': paginator.count,
+        'status_counts': facets['order_status'],
     })
 
 
@@ -619,29 +705,28 @@ def admin_order_detail(request, order_id):
     if not is_admin(request.user):
         return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
     
-    try:
-        order = Order.objects.select_related('user').get(id=order_id)
-    except Order.DoesNotExist:
+    order = find_order(id=order_id)
+    if order is None:
         return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
     
     if request.method == 'GET':
         serializer = OrderSerializer(order)
         return Response(serializer.data)
     
+    elif order.is_archived:
+        return Response({'error': 'Đơn hàng đã lưu trữ, không thể cập nhật'}, status=status.HTTP_400_BAD_REQUEST)
+    
     elif request.method == 'PUT':
         # Admin can update order status
-        new_status = request.data.get('order_status')
-        valid_statuses = [
-            'Chờ xác nhận', 'Đã xác nhận', 'Đang chuẩn bị', 
-            'Đang giao', 'Đã giao', 'Đã hủy'
-        ]
-        
-        if new_status not in valid_statuses:
+        new_status = normalize_status(request.data.get('order_status'))
+        fields = cancellation_fields(ADMIN) if new_status == CANCELLED else {}
+        try:
+            transition(order, new_status, ADMIN, **fields)
+        except TransitionConflict as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except InvalidTransition:
             return Response({'error': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
         
-        order.order_status = new_status
-        order.save()
-        
         serializer = OrderSerializer(order)
         return Response(serializer.data)
 
@@ -660,25 +745,23 @@ def assign_shipper(request, order_id):
     
     shipper_id = request.data.get('shipper_id')
     
+    shipper = None
     if shipper_id:
         # Assign shipper
         from apps.shipper.models import Shipper
         try:
             shipper = Shipper.objects.get(id=shipper_id)
-            order.shipper = shipper
-            # Auto update status if assigning shipper
-            if order.order_status in ['Chờ xác nhận', 'Đã xác nhận']:
-                order.order_status = 'Đang giao'
         except Shipper.DoesNotExist:
             return Response({'error': 'Shipper not found'}, status=status.HTTP_404_NOT_FOUND)
-    else:
-        # Unassign shipper
-        order.shipper = None
-        # Revert status if unassigning shipper
-        if order.order_status == 'Đang giao':
-            order.order_status = 'Đã xác nhận'
     
-    order.save()
+    # Shipper and order status (Đang giao on assign, back to Đã xác nhận on unassign)
+    # are written only if nobody changed the order since it was read
+    try:
+        set_shipper(order, shipper)
+    except TransitionConflict as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    except InvalidTransition as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
     serializer = OrderSerializer(order)
     return Response({
@@ -689,23 +772,23 @@ def assign_shipper(request, order_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@traced('orders.shipper_orders')
 def shipper_orders(request):
     """Get orders assigned to current shipper"""
     from apps.shipper.models import Shipper
     
     try:
         shipper = Shipper.objects.get(user=request.user)
-        print(f"DEBUG: Current user: {request.user.id}, Shipper ID: {shipper.id}")
     except Shipper.DoesNotExist:
         return Response({'error': 'User is not a shipper'}, status=status.HTTP_403_FORBIDDEN)
     
     # Get orders assigned to this shipper
-    orders = Order.objects.filter(shipper=shipper).order_by('-created_date')
-    print(f"DEBUG: Total orders for shipper {shipper.id}: {orders.count()}")
+    orders = Order.objects.filter(shipper=shipper).select_related('user__role', 'shipper__user__role', 'store').order_by('-created_date')
+    facets = status_facets(orders)
     
     # Filter by delivery status or order status
     status_filter = request.GET.get('delivery_status') or request.GET.get('status') 
-    print(f"DEBUG: Status filter requested: '{status_filter}'")
+    current_trace().set(shipper_id=shipper.id, status_filter=status_filter)
     
     if status_filter:
         if status_filter == 'Đã hủy' or status_filter == 'Đã huỷ':
@@ -716,8 +799,7 @@ def shipper_orders(request):
                 Q(delivery_status='Đã hủy') | Q(order_status='Đã hủy') |
                 Q(delivery_status='Đã huỷ') | Q(order_status='Đã huỷ'),
                 shipper=shipper
-            ).order_by('-created_date')
-            print(f"DEBUG: Filtering cancelled orders for shipper {shipper.id}")
+            ).select_related('user__role', 'shipper__user__role', 'store').order_by('-created_date')
         else:
             # For other statuses, filter by delivery_status and exclude cancelled orders
             if status_filter == 'Đã xác nhận':
@@ -727,19 +809,26 @@ def shipper_orders(request):
                 ).exclude(
                     Q(order_status='Đã hủy') | Q(order_status='Đã huỷ')  # Exclude customer-cancelled orders (both spellings)
                 )
-                print(f"DEBUG: Filtering accepted orders (excluding customer-cancelled) for shipper {shipper.id}")
             else:
                 # For other statuses, filter normally
                 try:
                     orders = orders.filter(delivery_status=status_filter)
-                    print(f"DEBUG: Filtering by delivery_status: {status_filter}")
                 except:
                     orders = orders.filter(order_status=status_filter)
-                    print(f"DEBUG: Filtering by order_status: {status_filter}")
-    
-    print(f"DEBUG: Found {orders.count()} orders for shipper {shipper.id}")
     
     # Pagination
+    if wants_cursor(request):
+        try:
+            cursor_page = paginate_keyset(request, orders, ('-created_date', '-id'), 10)
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = OrderSerializer(cursor_page.items, many=True, context={'request': request})
+        return Response({
+            'results': serializer.data,
+            **cursor_page_fields(request, cursor_page, orders),
+            'status_counts': facets['delivery_status'],
+        })
+
     page = request.GET.get('page', 1)
     paginator = Paginator(orders, 10)
     page_obj = paginator.get_page(page)
@@ -751,12 +840,14 @@ def shipper_orders(request):
         'current_page': page_obj.number,
         'has_next': page_obj.has_next(),
         'has_previous': page_obj.has_previous(),
-        'results': serializer.data
+        'results': serializer.data,
+        'status_counts': facets['delivery_status'],
     })
 
 
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
+@traced('orders.update_delivery_status')
 def update_delivery_status(request, order_id):
     """Update delivery status by shipper"""
     from apps.shipper.models import Shipper
@@ -771,70 +862,40 @@ def update_delivery_status(request, order_id):
     except Order.DoesNotExist:
         return Response({'error': 'Order not found or not assigned to you'}, status=status.HTTP_404_NOT_FOUND)
     
-    new_status = request.data.get('delivery_status') or request.data.get('order_status')
-    
-    # Define valid delivery status transitions for shipper
-    valid_transitions = {
-        'Chờ xác nhận': ['Đã xác nhận'],   # Can accept pending orders
-        'Đã xác nhận': ['Đã lấy hàng'],    # After accepting, can pick up
-        'Đã lấy hàng': ['Đã giao'],        # After pickup, mark as delivered directly
-        'Đang giao': ['Đã giao'],          # Legacy: still allow from Đang giao
-        'Đã giao': []                       # Cannot change from delivered
-    }
-    
-    current_status = order.delivery_status  # Use delivery_status instead of order_status
-    if current_status not in valid_transitions:
-        return Response({
-            'error': f'Cannot update delivery status from {current_status}'
-        }, status=status.HTTP_400_BAD_REQUEST)
-    
-    if new_status not in valid_transitions[current_status]:
-        return Response({
-            'error': f'Invalid delivery status transition from {current_status} to {new_status}'
-        }, status=status.HTTP_400_BAD_REQUEST)
-    
-    order.delivery_status = new_status  # Update delivery_status instead of order_status
+    current_status = order.delivery_status
+    try:
+        new_status = check_transition(
+            current_status,
+            request.data.get('delivery_status') or request.data.get('order_status'),
+            SHIPPER,
+            field='delivery_status',
+        )
+    except InvalidTransition as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Also update order_status based on delivery_status for consistency
-    if new_status == 'Đã lấy hàng':
-        order.order_status = 'Đã lấy hàng'
-    elif new_status == 'Đang giao':
-        order.order_status = 'Đang giao'  
-    elif new_status == 'Đã giao':
-        order.order_status = 'Đã giao'
-        
+    fields = {}
+    upload = None
+    if new_status == DELIVERED:
         # Handle proof image upload when marking as delivered
         proof_image = request.FILES.get('proof_image')
         if proof_image:
-            import os
-            from django.conf import settings
-            
-            # Generate unique filename
-            ext = os.path.splitext(proof_image.name)[1]
-            filename = f"delivery_proof_{order.id}_{shipper.id}{ext}"
-            # Use forward slash for URL compatibility (not os.path.join which uses backslash on Windows)
-            filepath = f"assets/{filename}"
-            
-            # Save file to media directory
-            full_path = os.path.join(settings.MEDIA_ROOT, 'assets', filename)
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            
-            with open(full_path, 'wb+') as destination:
-                for chunk in proof_image.chunks():
-                    destination.write(chunk)
-            
-            # Save path to database with forward slashes
-            order.proof_image = filepath
-            print(f"DEBUG: Saved delivery proof image: {filepath}")
+            # Stored under its content hash; the thumbnail is built in the background
+            upload = save_upload(proof_image)
+            fields['proof_image'] = upload.name
     
-    print(f"DEBUG: Updating order {order.id}")
-    print(f"DEBUG: Before save - delivery_status: {order.delivery_status}, order_status: {order.order_status}")
-    
-    order.save()
+    # delivery_status and the matching order_status are written in one conditional UPDATE
+    try:
+        transition(order, new_status, SHIPPER, field='delivery_status', condition=Q(shipper=shipper), **fields)
+    except InvalidTransition as e:
+        if upload and upload.created:
+            discard_upload(upload.name, Order.objects.filter(proof_image=upload.name))
+        code = status.HTTP_409_CONFLICT if isinstance(e, TransitionConflict) else status.HTTP_400_BAD_REQUEST
+        return Response({'error': str(e)}, status=code)
     
-    # Refresh from database to verify
-    order.refresh_from_db()
-    print(f"DEBUG: After save - delivery_status: {order.delivery_status}, order_status: {order.order_status}")
+    current_trace().set(
+        order_id=order.id, shipper_id=shipper.id, from_status=current_status,
+        to_status=new_status, proof_image=bool(order.proof_image),
+    )
     
     serializer = OrderSerializer(order)
     return Response({
@@ -847,82 +908,62 @@ def update_delivery_status(request, order_id):
 @permission_classes([IsAuthenticated])
 def admin_update_order_status(request, pk):
     """Update order status by admin or store manager"""
+    if not is_admin_or_store_manager(request.user):
+        return Response({'error': 'Admin or Store Manager access required'}, status=status.HTTP_403_FORBIDDEN)
+
+    # Admin can access all orders, store manager can only access their store orders
+    if is_admin(request.user):
+        role = ADMIN
+        order = get_object_or_404(Order, pk=pk)
+    else:
+        role = STORE
+        order = get_object_or_404(Order, pk=pk, store__manager=request.user)
+
+    upload = None
     try:
-        # Admin can access all orders, store manager can only access their store orders
-        if request.user.role == 'Quản lý':  # Admin
-            order = get_object_or_404(Order, pk=pk)
-        else:
-            # Store manager - check if order belongs to their store
-            # This would need store management logic implementation
-            order = get_object_or_404(Order, pk=pk)
-        
-        new_status = request.data.get('order_status')
+        new_status = normalize_status(request.data.get('order_status'))
         cancel_reason = request.data.get('cancel_reason')
-        bank_name = request.data.get('bank_name')
-        bank_account = request.data.get('bank_account')
-        refund_requested_flag = request.data.get('refund_requested')
         proof_image_file = request.FILES.get('proof_image')
-        
+
         if not new_status:
             return Response({'error': 'order_status is required'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Determine cancellation role based on user role
-        cancelled_by_role = None
-        if new_status in ['Đã huỷ', 'Đã hủy']:
-            if request.user.role == 'Quản lý':
-                cancelled_by_role = 'Quản lý'
-            else:
-                cancelled_by_role = 'Cửa hàng'  # Store manager
-        
-        # Validate status transition (admin has more freedom)
-        valid_statuses = ['Chờ xác nhận', 'Đã xác nhận', 'Đang chuẩn bị', 'Sẵn sàng', 'Đã lấy hàng', 'Đã giao', 'Đã huỷ']
-        if new_status not in valid_statuses:
-            return Response({'error': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Update order
-        order.order_status = new_status
+
+        fields = {}
         if cancel_reason:
-            order.cancel_reason = cancel_reason
-        
-        # Set cancellation info if being cancelled
-        if new_status in ['Đã huỷ', 'Đã hủy']:
-            from apps.orders.models import get_vietnam_time
-            order.cancelled_date = get_vietnam_time()
-            order.cancelled_by_role = cancelled_by_role
-
-            # Handle refund info if supplied or required
-            non_cash_payment = str(order.payment_method).lower() not in ['cash', 'cod']
-            refund_requested = refund_requested_flag is True or non_cash_payment
-            if refund_requested:
-                order.refund_requested = True
-                order.refund_status = 'Chờ xử lý'
-                if bank_name:
-                    order.bank_name = bank_name
-                if bank_account:
-                    order.bank_account = bank_account
+            fields['cancel_reason'] = cancel_reason
+        if new_status == CANCELLED:
+            fields.update(cancellation_fields(role, cancel_reason))
+            fields.update(refund_request_fields(
+                order,
+                request.data.get('refund_requested'),
+                request.data.get('bank_name'),
+                request.data.get('bank_account'),
+            ))
 
+        previous_proof = order.proof_image
         if proof_image_file:
-            ext = os.path.splitext(proof_image_file.name)[1]
-            filename = f"assets/{uuid.uuid4().hex}{ext}"
-            saved_path = default_storage.save(filename, proof_image_file)
+            upload = save_upload(proof_image_file)
+            fields['proof_image'] = upload.name
 
-            if order.proof_image and order.proof_image != saved_path:
-                try:
-                    if default_storage.exists(order.proof_image):
-                        default_storage.delete(order.proof_image)
-                except Exception:
-                    pass
+        try:
+            transition(order, new_status, role, **fields)
+        except TransitionConflict as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except InvalidTransition as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        saved, upload = upload, None
+
+        if saved and previous_proof and previous_proof != saved.name:
+            discard_upload(previous_proof, Order.objects.filter(proof_image=previous_proof))
 
-            order.proof_image = saved_path
-        
-        order.save()
-        
         return Response(OrderSerializer(order).data)
-        
-    except Order.DoesNotExist:
-        return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    finally:
+        # The status was not written, drop the uploaded proof
+        if upload and upload.created:
+            discard_upload(upload.name, Order.objects.filter(proof_image=upload.name))
 
 
 @api_view(['POST'])
@@ -948,18 +989,16 @@ def shipper_accept_order(request, order_id):
             'error': 'Order not found or already assigned to another shipper'
         }, status=status.HTTP_404_NOT_FOUND)
     
-    # Assign shipper and update status
-    order.shipper = shipper
-    order.delivery_status = 'Đã xác nhận'
-    
-    print(f"DEBUG: Accepting order {order.id}")
-    print(f"DEBUG: Before save - shipper: {order.shipper}, delivery_status: {order.delivery_status}")
-    
-    order.save()
-    
-    # Refresh from database to verify
-    order.refresh_from_db()
-    print(f"DEBUG: After save - shipper: {order.shipper}, delivery_status: {order.delivery_status}")
+    # Assign shipper and update status only if nobody accepted it in the meantime
+    try:
+        transition(
+            order, CONFIRMED, SHIPPER, field='delivery_status',
+            condition=Q(shipper__isnull=True), shipper=shipper,
+        )
+    except InvalidTransition:
+        return Response({
+            'error': 'Order not found or already assigned to another shipper'
+        }, status=status.HTTP_409_CONFLICT)
     
     serializer = OrderSerializer(order)
     return Response({
@@ -980,41 +1019,45 @@ def get_orders_by_shipper(request, shipper_id):
         return Response({'error': 'Shipper not found'}, status=status.HTTP_404_NOT_FOUND)
     
     # Get orders assigned to this shipper
-    orders = Order.objects.filter(shipper=shipper).order_by('-created_date')
+    orders = Order.objects.filter(shipper=shipper).select_related('user__role', 'shipper__user__role', 'store').order_by('-created_date')
     
-    # Group by delivery_status
-    status_counts = {}
+    # Badge counts per delivery_status in one query; cancelled orders only count as cancelled
+    facets = status_facets(orders)
     all_statuses = ['Chờ xác nhận', 'Đã xác nhận', 'Đang giao', 'Đã giao', 'Đã hủy', 'Đã huỷ']
-    
-    for status_name in all_statuses:
-        if status_name in ['Đã hủy', 'Đã huỷ']:
-            # For cancelled, count both delivery_status and order_status cancelled
-            count = orders.filter(
-                Q(delivery_status__in=['Đã hủy', 'Đã huỷ']) | 
-                Q(order_status__in=['Đã hủy', 'Đã huỷ'])
-            ).count()
-        else:
-            count = orders.filter(delivery_status=status_name).count()
-        status_counts[status_name] = count
+    status_counts = {status_name: facets['delivery_status'].get(status_name, 0) for status_name in all_statuses}
     
     # Get filtered orders if status is specified
+    cancelled_q = Q(delivery_status__in=CANCELLED_STATUSES) | Q(order_status__in=CANCELLED_STATUSES)
     status_filter = request.GET.get('delivery_status')
     if status_filter:
-        if status_filter in ['Đã hủy', 'Đã huỷ']:
-            orders = orders.filter(
-                Q(delivery_status__in=['Đã hủy', 'Đã huỷ']) | 
-                Q(order_status__in=['Đã hủy', 'Đã huỷ'])
-            )
+        if status_filter in CANCELLED_STATUSES:
+            orders = orders.filter(cancelled_q)
         else:
-            orders = orders.filter(delivery_status=status_filter)
+            orders = orders.filter(delivery_status=status_filter).exclude(cancelled_q)
     
     # Pagination
     page = request.GET.get('page', 1)
     per_page = request.GET.get('per_page', 20)
-    paginator = Paginator(orders, per_page)
-    page_obj = paginator.get_page(page)
-    
-    serializer = OrderSerializer(page_obj, many=True, context={'request': request})
+    if wants_cursor(request):
+        try:
+            cursor_page = paginate_keyset(request, orders, ('-created_date', '-id'), int(per_page))
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = OrderSerializer(cursor_page.items, many=True, context={'request': request})
+        orders_page = {'results': serializer.data, **cursor_page_fields(request, cursor_page, orders)}
+    else:
+        paginator = Paginator(orders, per_page)
+        page_obj = paginator.get_page(page)
+        serializer = OrderSerializer(page_obj, many=True, context={'request': request})
+        orders_page = {
+            'count': paginator.count,
+            'num_pages': paginator.num_pages,
+            'current_page': page_obj.number,
+            'has_next': page_obj.has_next(),
+            'has_previous': page_obj.has_previous(),
+            'results': serializer.data
+        }
+
     return Response({
         'shipper': {
             'id': shipper.id,
@@ -1025,13 +1068,6 @@ def get_orders_by_shipper(request, shipper_id):
             'address': shipper.user.address,
         },
         'status_counts': status_counts,
-        'total_orders': orders.count() if not status_filter else Order.objects.filter(shipper=shipper).count(),
-        'orders': {
-            'count': paginator.count,
-            'num_pages': paginator.num_pages,
-            'current_page': page_obj.number,
-            'has_next': page_obj.has_next(),
-            'has_previous': page_obj.has_previous(),
-            'results': serializer.data
-        }
+        'total_orders': facets['total'],
+        'orders': orders_page
     })
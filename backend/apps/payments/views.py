@@ -7,6 +7,8 @@ from rest_framework.response import Response
 from rest_framework import status
 from decouple import config
 from payos import PaymentData, PayOS
+from apps.utils.idempotency import idempotent
+from apps.utils.instrumentation import current_trace, traced
 
 
 # Initialize PayOS
@@ -30,8 +32,6 @@ def gen_unique_order_code(base_id: str | int) -> int:
     base = int(str(base_id)[-2:]) if base_id else 0
     
     order_code = int(f"{base:02d}{ts:04d}{rnd:03d}")
-    
-    print(f"Generated order code: {order_code} (9 digits)")
     return order_code
 
 
@@ -45,23 +45,20 @@ def _get_payment_link_info(order_code: int):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@traced('payments.create_payment_link')
+@idempotent('payment_link')
 def create_payment_link(request):
     """Create PayOS payment link for bank transfer"""
+    trace = current_trace()
     try:
         data = request.data
         user_id = data.get('user_id')
         order_id = str(data.get('order_id'))
         amount = int(data.get('amount', 0))
         message = data.get('message') or f"Order #{order_id}"
-
-        print(f"=== CREATE PAYMENT LINK ===")
-        print(f"User ID: {user_id}")
-        print(f"Order ID: {order_id}")
-        print(f"Amount: {amount}")
-        print(f"Message: {message}")
+        trace.set(user_id=user_id, order_id=order_id, amount=amount)
 
         if not order_id or amount <= 0:
-            print(f"ERROR: Invalid order_id or amount")
             return Response(
                 {'error': 'Thiếu order_id hoặc amount không hợp lệ'}, 
                 status=status.HTTP_400_BAD_REQUEST
@@ -71,15 +68,13 @@ def create_payment_link(request):
         
         # Check if payment link already exists
         try:
-            print(f"Checking existing payment link for order code: {primary_order_code}")
-            info = _get_payment_link_info(primary_order_code)
+            with trace.step('payos_lookup'):
+                info = _get_payment_link_info(primary_order_code)
             link_status = getattr(info, 'status', None) or (info.get('status') if isinstance(info, dict) else None)
             checkout_url = getattr(info, 'checkoutUrl', None) or (info.get('checkoutUrl') if isinstance(info, dict) else None)
-            
-            print(f"Existing link status: {link_status}, URL: {checkout_url}")
+            trace.set(existing_status=link_status)
             
             if link_status in ('PENDING', 'PROCESSING') and checkout_url:
-                print(f"Returning existing payment link")
                 return Response({
                     'checkoutUrl': checkout_url, 
                     'status': link_status, 
@@ -87,22 +82,20 @@ def create_payment_link(request):
                 })
             
             if link_status == 'PAID':
-                print(f"Order already paid")
                 return Response(
                     {'error': 'Đơn này đã thanh toán.'}, 
                     status=status.HTTP_409_CONFLICT
                 )
-        except Exception as e:
-            print(f"No existing payment link found (this is normal): {e}")
+        except Exception:
+            # No existing payment link found (this is normal)
             pass
 
         # Create new payment link
         new_order_code = gen_unique_order_code(order_id)
-        print(f"Generated new order code: {new_order_code}")
+        trace.set(order_code=new_order_code)
         
         # Validate order code length (PayOS max is usually 9-10 digits)
         if new_order_code > 9999999999:  # 10 digits max
-            print(f"ERROR: Order code too long: {new_order_code}")
             return Response(
                 {'error': f'Order code too long: {new_order_code}'}, 
                 status=status.HTTP_400_BAD_REQUEST
@@ -110,7 +103,6 @@ def create_payment_link(request):
         
         # Get host URL for return/cancel URLs
         host_url = request.build_absolute_uri('/').rstrip('/')
-        print(f"Host URL: {host_url}")
         
         paymentData = PaymentData(
             orderCode=new_order_code,
@@ -120,37 +112,21 @@ def create_payment_link(request):
             cancelUrl=f"{host_url}/api/payments/payos-return?orderCode={new_order_code}&status=cancel"
         )
         
-        print(f"Payment data created: orderCode={new_order_code}, amount={amount}")
-        print(f"Calling PayOS API to create payment link...")
-        
-        try:
-            created = payOs.create_payment_link(paymentData)
-            print("Successfully used method: create_payment_link")
-        except AttributeError:
-            print(f"Using alternative method: createPaymentLink")
-            created = payOs.createPaymentLink(paymentData=paymentData)
-            print("Successfully used method: createPaymentLink")
-        except Exception as e:
-            print(f"=== ERROR IN CREATE PAYMENT LINK ===")
-            print(f"Error type: {type(e)}")
-            print(f"Error message: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            raise
-
-        print(f"PayOS response type: {type(created)}")
-        print(f"PayOS response: {created}")
+        with trace.step('payos_create'):
+            try:
+                created = payOs.create_payment_link(paymentData)
+            except AttributeError:
+                created = payOs.createPaymentLink(paymentData=paymentData)
 
         checkout_url = getattr(created, 'checkoutUrl', None) or (created.get('checkoutUrl') if isinstance(created, dict) else None)
         
         if not checkout_url:
-            print(f"ERROR: No checkoutUrl in response")
+            trace.error('PayOS response has no checkoutUrl', order_code=new_order_code)
             return Response(
                 {'error': 'Không nhận được checkoutUrl từ PayOS'}, 
                 status=status.HTTP_502_BAD_GATEWAY
             )
 
-        print(f"SUCCESS: Payment link created: {checkout_url}")
         return Response({
             'checkoutUrl': checkout_url, 
             'status': 'CREATED', 
@@ -158,11 +134,7 @@ def create_payment_link(request):
         })
 
     except Exception as e:
-        print(f"=== ERROR IN CREATE PAYMENT LINK ===")
-        print(f"Error type: {type(e)}")
-        print(f"Error message: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        trace.error('create payment link failed', error_type=type(e).__name__, error=str(e))
         return Response(
             {'error': str(e)}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -0,0 +1,255 @@
+"""Server-side promotion evaluation.
+
+Active promos are kept in a process-local index keyed by store (``0`` for GLOBAL
+promos) with their time windows already normalized to aware datetimes. The index
+is rebuilt with a single query when a promo is saved or deleted (see
+``signals.py``) or after ``PROMO_INDEX_TTL_SECONDS`` as a safety net for changes
+made by other processes.
+
+``evaluate_cart`` picks the best valid combination for a whole cart in one pass:
+at most one promo per store plus one GLOBAL promo, the same rule the checkout
+screens enforce when selecting vouchers. GLOBAL discounts are split across
+stores proportionally to their subtotals.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+GLOBAL_STORE_ID = 0
+
+_lock = threading.Lock()
+_index: Optional['PromoIndex'] = None
+_built_at = 0.0
+# Bumped by every invalidation; a rebuild only replaces the shared index if no
+# invalidation happened while it was loading
+_generation = 0
+
+
+def _aware(value):
+    if value is not None and timezone.is_naive(value):
+        return timezone.make_aware(value)
+    return value
+
+
+@dataclass(frozen=True)
+class ActivePromo:
+    """An active promo with its evaluation inputs precomputed."""
+    promo: object
+    store_id: int
+    starts_at: object
+    ends_at: object
+
+    @property
+    def id(self) -> int:
+        return self.promo.id
+
+    def is_live(self, now) -> bool:
+        return self.starts_at <= now <= self.ends_at
+
+    def discount_for(self, amount: Decimal) -> Decimal:
+        """Discount on ``amount``, never more than the amount itself."""
+        if amount < self.promo.minimum_pay:
+            return Decimal('0')
+        discount = self.promo.calculate_discount(amount).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        return min(discount, amount)
+
+
+class PromoIndex:
+    """Active promos grouped by store id, with GLOBAL promos under ``0``."""
+
+    def __init__(self, promos: Iterable[object]):
+        self.by_id: Dict[int, ActivePromo] = {}
+        self.by_store: Dict[int, List[ActivePromo]] = {}
+        for promo in promos:
+            store_id = GLOBAL_STORE_ID if promo.scope == 'GLOBAL' else promo.store_id
+            entry = ActivePromo(
+                promo=promo,
+                store_id=store_id,
+                starts_at=_aware(promo.start_date),
+                ends_at=_aware(promo.end_date),
+            )
+            self.by_id[promo.id] = entry
+            self.by_store.setdefault(store_id, []).append(entry)
+
+    @classmethod
+    def load(cls) -> 'PromoIndex':
+        from .models import Promo
+
+        promos = Promo.objects.filter(
+            is_active=True, end_date__gte=timezone.now()
+        ).select_related('store')
+        return cls(promos)
+
+    def get(self, promo_id, now=None) -> Optional[ActivePromo]:
+        """Return the promo if it is active and inside its time window."""
+        try:
+            entry = self.by_id.get(int(promo_id))
+        except (TypeError, ValueError):
+            return None
+        if entry is None or not entry.is_live(now or timezone.now()):
+            return None
+        return entry
+
+    def for_store(self, store_id: int, now=None) -> List[ActivePromo]:
+        now = now or timezone.now()
+        return [entry for entry in self.by_store.get(store_id, []) if entry.is_live(now)]
+
+
+def get_promo_index() -> PromoIndex:
+    """Return the shared index, rebuilding it if invalidated or older than the TTL."""
+    global _index, _built_at
+    ttl = float(getattr(settings, 'PROMO_INDEX_TTL_SECONDS', 60))
+    with _lock:
+        if _index is not None and time.monotonic() - _built_at < ttl:
+            return _index
+        generation = _generation
+    index = PromoIndex.load()
+    with _lock:
+        if _generation == generation:
+            _index, _built_at = index, time.monotonic()
+    return index
+
+
+def invalidate_promo_index() -> None:
+    """Drop the shared index; the next lookup reloads it."""
+    global _index, _generation
+    with _lock:
+        _index = None
+        _generation += 1
+
+
+@dataclass
+class CartPromoResult:
+    """Outcome of ``evaluate_cart``."""
+    applied: List[Tuple[ActivePromo, Decimal]] = field(default_factory=list)
+    allocations: Dict[int, List[Tuple[object, Decimal]]] = field(default_factory=dict)
+    rejected: Dict[int, str] = field(default_factory=dict)
+    unknown: List = field(default_factory=list)
+
+    @property
+    def total_discount(self) -> Decimal:
+        return sum((amount for _, amount in self.applied), Decimal('0'))
+
+    def store_discount(self, store_id: int) -> Decimal:
+        return sum((amount for _, amount in self.allocations.get(store_id, [])), Decimal('0'))
+
+    @property
+    def primary_promo_id(self) -> Optional[int]:
+        return self.applied[0][0].id if self.applied else None
+
+
+def _split_global(amount: Decimal, store_subtotals: Mapping[int, Decimal], total: Decimal) -> Dict[int, Decimal]:
+    """Split a GLOBAL discount by subtotal share; the last store absorbs rounding."""
+    shares = {}
+    remaining = amount
+    store_ids = [store_id for store_id, subtotal in store_subtotals.items() if subtotal > 0]
+    for position, store_id in enumerate(store_ids):
+        if position == len(store_ids) - 1:
+            share = remaining
+        else:
+            share = (amount * store_subtotals[store_id] / total).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            share = min(share, remaining)
+        remaining -= share
+        if share > 0:
+            shares[store_id] = share
+    return shares
+
+
+_ONE_PER_STORE = 'Only one promo per store applies; a larger one was chosen'
+
+
+def evaluate_cart(store_subtotals: Mapping[int, Decimal], promo_ids: Optional[Iterable] = None, now=None) -> CartPromoResult:
+    """Choose and allocate promos for a cart split by store.
+
+    ``promo_ids`` restricts the candidates to the customer's selection; when it is
+    None every live promo for the cart's stores (and every GLOBAL promo) competes.
+    Per store the largest discount wins, then the best GLOBAL promo is applied to
+    the whole cart and split across stores. Selected promos that end up giving
+    no discount are listed in ``rejected`` with the reason.
+    """
+    index = get_promo_index()
+    now = now or timezone.now()
+    result = CartPromoResult()
+    total = sum(store_subtotals.values(), Decimal('0'))
+    selected = promo_ids is not None
+
+    if promo_ids is None:
+        candidates = [
+            entry
+            for store_id in [*store_subtotals.keys(), GLOBAL_STORE_ID]
+            for entry in index.for_store(store_id, now)
+        ]
+    else:
+        candidates = []
+        for promo_id in promo_ids:
+            entry = index.get(promo_id, now)
+            if entry is None:
+                result.unknown.append(promo_id)
+            elif all(candidate.id != entry.id for candidate in candidates):
+                candidates.append(entry)
+
+    best: Dict[int, Tuple[ActivePromo, Decimal]] = {}
+    for entry in candidates:
+        if entry.store_id == GLOBAL_STORE_ID:
+            base = total
+        elif entry.store_id in store_subtotals:
+            base = store_subtotals[entry.store_id]
+        else:
+            result.rejected[entry.id] = 'Promo does not apply to any store in this order'
+            continue
+        if base < entry.promo.minimum_pay:
+            result.rejected[entry.id] = f'Minimum order amount is {entry.promo.minimum_pay:,.0f} VND'
+            continue
+        discount = entry.discount_for(base)
+        current = best.get(entry.store_id)
+        if discount <= 0:
+            loser, reason = entry, 'Promo gives no discount on this order'
+        elif current is None or discount > current[1]:
+            best[entry.store_id] = (entry, discount)
+            loser, reason = (current[0] if current else None), _ONE_PER_STORE
+        else:
+            loser, reason = entry, _ONE_PER_STORE
+        # Without a selection every live promo competes and losing is expected
+        if selected and loser is not None:
+            result.rejected[loser.id] = reason
+
+    global_choice = best.pop(GLOBAL_STORE_ID, None)
+    for store_id, (entry, discount) in best.items():
+        result.applied.append((entry, discount))
+        result.allocations.setdefault(store_id, []).append((entry.promo, discount))
+
+    if global_choice is not None:
+        entry, discount = global_choice
+        # Stack on top of store promos without pushing any store below zero
+        remaining = {
+            store_id: max(Decimal('0'), subtotal - result.store_discount(store_id))
+            for store_id, subtotal in store_subtotals.items()
+        }
+        discount = min(discount, sum(remaining.values(), Decimal('0')))
+        if discount > 0:
+            result.applied.append((entry, discount))
+            for store_id, share in _split_global(discount, remaining, sum(remaining.values(), Decimal('0'))).items():
+                result.allocations.setdefault(store_id, []).append((entry.promo, share))
+        elif selected:
+            result.rejected[entry.id] = 'Store promos already cover the whole order'
+
+    return result
+
+
+def evaluate_promo(promo_id, amount: Decimal, store_id: Optional[int] = None, now=None):
+    """Validate one promo against an amount; return ``(entry, discount, error)``."""
+    entry = get_promo_index().get(promo_id, now)
+    if entry is None:
+        return None, Decimal('0'), 'Invalid or expired promo code'
+    if store_id is not None and entry.store_id not in (GLOBAL_STORE_ID, store_id):
+        return entry, Decimal('0'), 'Promo does not apply to this store'
+    if amount < entry.promo.minimum_pay:
+        return entry, Decimal('0'), f'Minimum order amount is {entry.promo.minimum_pay:,.0f} VND'
+    return entry, entry.discount_for(amount), None
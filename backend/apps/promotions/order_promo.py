@@ -41,14 +41,7 @@ class OrderPromo(models.Model):
     @staticmethod
     def update_order_totals_for_order(order):
         """Update totals for a specific order"""
-        total_discount = OrderPromo.objects.filter(order=order).aggregate(
-            total=models.Sum('applied_amount')
-        )['total'] or 0
-        
-        # Update order
-        order.total_discount = total_discount
-        order.total_after_discount = max(0, order.total_before_discount - total_discount)
-        order.save()
+        order.recompute_aggregates(sync_discount=True)
     
     def __str__(self):
         return f"Order {self.order_id} - Promo {self.promo.name} - {self.applied_amount}"
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .engine import invalidate_promo_index
+from .models import Promo
+
+
+@receiver(post_save, sender=Promo)
+@receiver(post_delete, sender=Promo)
+def refresh_promo_index(sender, **kwargs):
+    """Rebuild the active-promo index after any promo change."""
+    invalidate_promo_index()
@@ -6,6 +6,7 @@ from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from .models import Promo
 from .serializers import PromoSerializer
+from .engine import evaluate_promo
 
 
 def is_store_manager(user):
@@ -51,42 +52,36 @@ def validate_promo(request):
     total_amount = request.data.get('total_amount', 0)
     
     # Convert total_amount to Decimal để tránh type mixing
-    if isinstance(total_amount, (int, float)):
+    try:
         total_amount = Decimal(str(total_amount))
+    except ArithmeticError:
+        return Response({'error': 'Invalid total amount'}, status=status.HTTP_400_BAD_REQUEST)
     
     if not promo_id:
         return Response({'error': 'Promo ID is required'}, status=status.HTTP_400_BAD_REQUEST)
     
+    store_id = request.data.get('store_id')
     try:
-        now = timezone.now()
-        promo = Promo.objects.get(
-            id=promo_id,
-            start_date__lte=now,
-            end_date__gte=now
-        )
-        
-        if total_amount < promo.minimum_pay:
-            return Response({
-                'valid': False,
-                'error': f'Minimum order amount is {promo.minimum_pay:,.0f} VND'
-            })
-        
-        # Sử dụng method calculate_discount từ model
-        discount_amount = promo.calculate_discount(total_amount)
-        final_amount = max(Decimal('0'), total_amount - discount_amount)
-        
-        return Response({
-            'valid': True,
-            'discount_amount': f'{discount_amount:.2f}',
-            'final_amount': f'{final_amount:.2f}',
-            'promo': PromoSerializer(promo).data
-        })
-        
-    except Promo.DoesNotExist:
+        store_id = int(store_id) if store_id not in (None, '') else None
+    except (TypeError, ValueError):
+        store_id = None
+    
+    # Đánh giá qua index khuyến mãi đang hoạt động, không truy vấn DB mỗi lần
+    promo, discount_amount, error = evaluate_promo(promo_id, total_amount, store_id=store_id)
+    if error:
         return Response({
             'valid': False,
-            'error': 'Invalid or expired promo code'
+            'error': error
         })
+    
+    final_amount = max(Decimal('0'), total_amount - discount_amount)
+    
+    return Response({
+        'valid': True,
+        'discount_amount': f'{discount_amount:.2f}',
+        'final_amount': f'{final_amount:.2f}',
+        'promo': PromoSerializer(promo.promo).data
+    })
 
 
 # CRUD Operations for Store Managers
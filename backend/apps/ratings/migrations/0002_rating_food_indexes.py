@@ -0,0 +1,25 @@
+# Generated by Django 5.1.15 on 2026-10-16 23:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_remove_food_is_topping'),
+        ('orders', '0015_order_indexes'),
+        ('ratings', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ratingfood',
+            index=models.Index(fields=['food', 'rating'], name='rating_food_food_point_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ratingfood',
+            index=models.Index(fields=['order', 'user'], name='rating_food_order_user_idx'),
+        ),
+    ]
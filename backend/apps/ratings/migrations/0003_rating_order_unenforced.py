@@ -0,0 +1,20 @@
+# Generated by Django 5.1.15 on 2026-10-16 23:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0016_order_archive'),
+        ('ratings', '0002_rating_food_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ratingfood',
+            name='order',
+            field=models.ForeignKey(db_column='order_id', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='orders.order'),
+        ),
+    ]
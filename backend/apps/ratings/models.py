@@ -10,12 +10,18 @@ class RatingFood(models.Model):
 	content = models.TextField(blank=True)
 	food = models.ForeignKey(Food, on_delete=models.CASCADE, related_name='ratings', db_column='food_id')
 	user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_column='user_id')
-	# Link to order via existing 'order_id' column
-	order = models.ForeignKey(Order, on_delete=models.CASCADE, db_column='order_id')
+	# Link to order via existing 'order_id' column. Not enforced: ratings stay when
+	# their order is moved to orders_archive (manage.py archive_orders)
+	order = models.ForeignKey(Order, on_delete=models.DO_NOTHING, db_constraint=False, db_column='order_id')
 
 	class Meta:
 		db_table = 'rating_food'
 		unique_together = (('user', 'food', 'order'),)
+		indexes = [
+			# Per-food averages and counts can be answered from the index alone
+			models.Index(fields=['food', 'rating'], name='rating_food_food_point_idx'),
+			models.Index(fields=['order', 'user'], name='rating_food_order_user_idx'),
+		]
 
 	def __str__(self):
 		return f"{self.user} rated {self.food} as {self.rating}"
@@ -9,25 +9,40 @@ from rest_framework import status
 from rest_framework.response import Response
 from .models import RatingFood
 from .serializers import RatingFoodSerializer
+from apps.utils.instrumentation import current_trace, traced
+from apps.utils.pagination import InvalidCursor, cursor_page_fields, paginate_keyset, wants_cursor
 
 @api_view(['GET', 'POST'])
 @permission_classes([AllowAny])
+@traced('ratings.list_create')
 def rating_list_create(request):
     if request.method == 'GET':
         # Fetch only existing fields for ratings
         from django.db.models import F
         food_id = request.GET.get('food')
         order_id = request.GET.get('order')
-        print(f"DEBUG - GET params: food={food_id}, order={order_id}")
-        print(f"DEBUG - All GET params: {request.GET}")
+        current_trace().set(food_id=food_id, order_id=order_id)
         qs = RatingFood.objects.all()
-        print(f"DEBUG - Initial queryset count: {qs.count()}")
         if food_id:
             qs = qs.filter(food_id=food_id)
-            print(f"DEBUG - After food filter, count: {qs.count()}")
         if order_id:
             qs = qs.filter(order_id=order_id)
-            print(f"DEBUG - After order filter, count: {qs.count()}")
+        if wants_cursor(request):
+            try:
+                page_size = min(int(request.GET.get('page_size', 20)), 100)
+            except ValueError:
+                page_size = 20
+            try:
+                cursor_page = paginate_keyset(request, qs.select_related('user'), ('-id',), page_size)
+            except InvalidCursor as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({
+                'results': [
+                    {'username': item.user.username, 'rating': item.rating, 'content': item.content}
+                    for item in cursor_page.items
+                ],
+                **cursor_page_fields(request, cursor_page, qs),
+            })
         # Fetch raw values and manually map to avoid annotation conflicts
         raw = qs.values('user__username', 'rating', 'content')
         data = [
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Store
+from .models import Store, RouteCache
 
 
 @admin.register(Store)
@@ -7,3 +7,9 @@ class StoreAdmin(admin.ModelAdmin):
     list_display = ['id', 'store_name', 'description']
     search_fields = ['store_name', 'description']
     list_filter = ['store_name']
+
+
+@admin.register(RouteCache)
+class RouteCacheAdmin(admin.ModelAdmin):
+    list_display = ['id', 'store', 'lat_bucket', 'lng_bucket', 'distance_km', 'updated_at']
+    list_filter = ['store']
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-16 23:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stores', '0004_store_deposit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lat_bucket', models.IntegerField()),
+                ('lng_bucket', models.IntegerField()),
+                ('distance_km', models.FloatField()),
+                ('polyline', models.TextField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField()),
+                ('store', models.ForeignKey(db_column='store_id', on_delete=django.db.models.deletion.CASCADE, related_name='cached_routes', to='stores.store')),
+            ],
+            options={
+                'db_table': 'route_cache',
+                'unique_together': {('store', 'lat_bucket', 'lng_bucket')},
+            },
+        ),
+    ]
@@ -20,3 +20,24 @@ class Store(models.Model):
     
     def __str__(self):
         return self.store_name
+
+
+class RouteCache(models.Model):
+    """Cached driving route from a store to a quantized drop-off point.
+
+    Destinations are bucketed on a ~50 m grid (see ROUTE_CACHE_GRID_DEGREES) so
+    repeated deliveries to the same building reuse one Directions result.
+    """
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, db_column='store_id', related_name='cached_routes')
+    lat_bucket = models.IntegerField()
+    lng_bucket = models.IntegerField()
+    distance_km = models.FloatField()
+    polyline = models.TextField(null=True, blank=True)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'route_cache'
+        unique_together = ('store', 'lat_bucket', 'lng_bucket')
+
+    def __str__(self):
+        return f"Route store {self.store_id} -> ({self.lat_bucket}, {self.lng_bucket}): {self.distance_km} km"
@@ -0,0 +1,17 @@
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from apps.utils.route_cache import quantize_destination
+from .models import RouteCache, Store
+
+
+@receiver(pre_save, sender=Store)
+def drop_moved_store_routes(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Delete the cached routes of a store whose location moves to another grid cell."""
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not {'latitude', 'longitude'} & set(update_fields):
+        return
+    old = Store.objects.filter(pk=instance.pk).values_list('latitude', 'longitude').first()
+    if old is not None and quantize_destination(*old) != quantize_destination(instance.latitude, instance.longitude):
+        RouteCache.objects.filter(store_id=instance.pk).delete()
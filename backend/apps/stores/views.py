@@ -5,16 +5,20 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django.shortcuts import get_object_or_404
 from django.db.models import F
+from django.utils import timezone
 from decimal import Decimal
-import os
-import uuid
-from django.core.files.storage import default_storage
 from .models import Store
 from .serializers import StoreSerializer
 from apps.menu.models import Food
 from apps.menu.serializers import FoodSerializer
 from apps.orders.models import Order, OrderDetail
+from apps.orders.facets import status_facets
 from apps.orders.serializers import OrderSerializer
+from apps.utils.uploads import discard_upload, save_upload
+from apps.orders.status import (
+    CANCELLED, STORE, InvalidTransition, TransitionConflict, cancellation_fields, check_transition,
+    normalize_status, transition,
+)
 
 
 @api_view(['GET'])
@@ -91,23 +95,14 @@ class StoreViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def foods(self, request, pk=None):
         """Get all foods for this store with pagination"""
-        from django.db.models import Avg, Count, Value
-        from django.db.models.functions import Coalesce
-        
         store = self.get_object()
-        foods = Food.objects.filter(store=store)\
-            .select_related('category', 'store')\
-            .annotate(
-                avg_rating=Coalesce(Avg('ratings__rating'), Value(0.0)),
-                rating_count_annotated=Count('ratings')
-            )
+        # Ratings are aggregated for the page's rows only (FoodPageSerializer)
+        foods = Food.objects.filter(store=store).select_related('category', 'store').order_by('id')
         
         # Add pagination
         from django.core.paginator import Paginator
         page_number = request.GET.get('page', 1)
-        # Convert to list to preserve annotations before pagination
-        foods_list = list(foods)
-        paginator = Paginator(foods_list, 12)  # 12 items per page
+        paginator = Paginator(foods, 12)  # 12 items per page
         page_obj = paginator.get_page(page_number)
         
         # Use FoodSerializer with request context so image_url is built correctly
@@ -128,7 +123,7 @@ class StoreViewSet(viewsets.ModelViewSet):
         # Get orders that contain items from this store
         orders = Order.objects.filter(
             details__food__store=store
-        ).distinct().order_by('-created_date')
+        ).distinct().select_related('user__role', 'shipper__user__role', 'store').order_by('-created_date')
         serializer = OrderSerializer(orders, many=True, context={'request': request})
         return Response(serializer.data)
     
@@ -139,69 +134,64 @@ class StoreViewSet(viewsets.ModelViewSet):
         
         # Check if order belongs to this store
         try:
-            order = Order.objects.get(
+            order = Order.objects.filter(
                 id=order_id,
                 details__food__store=store
-            )
+            ).distinct().get()
         except Order.DoesNotExist:
             return Response({'error': 'Order not found or does not belong to this store'}, 
                           status=status.HTTP_404_NOT_FOUND)
         
-        # Validate status
-        new_status = request.data.get('order_status')
+        new_status = normalize_status(request.data.get('order_status'))
         refund_requested = request.data.get('refund_requested')
         refund_status = request.data.get('refund_status')
         bank_name = request.data.get('bank_name')
         bank_account = request.data.get('bank_account')
         proof_image_file = request.FILES.get('proof_image')
-        valid_statuses = [choice[0] for choice in Order.ORDER_STATUS_CHOICES]
-        
-        if new_status not in valid_statuses:
-            return Response({'error': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Disallow changing status away from completed/cancelled; allow metadata updates when status unchanged
-        if order.order_status in ['Đã giao', 'Đã huỷ'] and new_status != order.order_status:
-            return Response({'error': 'Không thể thay đổi trạng thái khi đơn đã hoàn tất hoặc đã huỷ'}, status=status.HTTP_400_BAD_REQUEST)
         
         # Preserve previous refund status to detect state change
         previous_refund_status = order.refund_status
 
-        # Update order status
-        order.order_status = new_status
-        
+        fields = {}
         # Add cancel reason if rejecting
-        if new_status == 'Đã huỷ':
-            order.cancel_reason = request.data.get('cancel_reason', 'Bị từ chối bởi cửa hàng')
-            order.cancelled_by_role = 'Cửa hàng'
-            from django.utils import timezone
-            order.cancelled_date = timezone.now()
+        if new_status == CANCELLED:
+            fields.update(cancellation_fields(
+                STORE, request.data.get('cancel_reason', 'Bị từ chối bởi cửa hàng'), when=timezone.now()
+            ))
 
         # Update refund info if provided
         if refund_requested is not None:
-            order.refund_requested = bool(refund_requested)
+            fields['refund_requested'] = bool(refund_requested)
         if refund_status:
-            order.refund_status = refund_status
+            fields['refund_status'] = refund_status
         if bank_name:
-            order.bank_name = bank_name
+            fields['bank_name'] = bank_name
         if bank_account:
-            order.bank_account = bank_account
+            fields['bank_account'] = bank_account
+
+        # Completed/cancelled orders keep their status; metadata may still be updated
+        try:
+            check_transition(order.order_status, new_status, STORE)
+        except InvalidTransition as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        previous_proof = order.proof_image
+        upload = None
         if proof_image_file:
-            ext = os.path.splitext(proof_image_file.name)[1]
-            filename = f"assets/{uuid.uuid4().hex}{ext}"
-            saved_path = default_storage.save(filename, proof_image_file)
+            upload = save_upload(proof_image_file)
+            fields['proof_image'] = upload.name
 
-            # Remove old proof image if replaced
-            if order.proof_image and order.proof_image != saved_path:
-                try:
-                    if default_storage.exists(order.proof_image):
-                        default_storage.delete(order.proof_image)
-                except Exception:
-                    # Do not fail request if cleanup fails
-                    pass
+        try:
+            transition(order, new_status, STORE, **fields)
+        except InvalidTransition as e:
+            if upload and upload.created:
+                discard_upload(upload.name, Order.objects.filter(proof_image=upload.name))
+            code = status.HTTP_409_CONFLICT if isinstance(e, TransitionConflict) else status.HTTP_400_BAD_REQUEST
+            return Response({'error': str(e)}, status=code)
 
-            order.proof_image = saved_path
-        
-        order.save()
+        # Remove old proof image if replaced and no other order shares it
+        if upload and previous_proof and previous_proof != upload.name:
+            discard_upload(previous_proof, Order.objects.filter(proof_image=previous_proof))
 
         # If refund just completed, deduct deposit by the order's total_after_discount
         if previous_refund_status != 'Đã hoàn thành' and refund_status == 'Đã hoàn thành':
@@ -222,10 +212,9 @@ class StoreViewSet(viewsets.ModelViewSet):
         # Count foods
         total_foods = Food.objects.filter(store=store).count()
         
-        # Count orders
-        total_orders = Order.objects.filter(
-            details__food__store=store
-        ).distinct().count()
+        # Count orders, with per-status badges, in one query
+        facets = status_facets(Order.objects.filter(details__food__store=store).distinct())
+        total_orders = facets['total']
         
         # Calculate total revenue
         total_revenue = 0
@@ -257,5 +246,6 @@ class StoreViewSet(viewsets.ModelViewSet):
             'total_orders': total_orders,
             'total_revenue': total_revenue,
             'average_rating': average_rating,
-            'total_ratings': total_ratings
+            'total_ratings': total_ratings,
+            'status_counts': facets['order_status'],
         })
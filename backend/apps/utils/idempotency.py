@@ -0,0 +1,131 @@
+"""Idempotency keys for retried POST requests.
+
+A client sends ``Idempotency-Key: <uuid>`` with a POST. The first request claims
+the key and its outcome is stored in ``idempotency_record``. A retry with the
+same key and the same payload gets the stored response back (marked with an
+``Idempotent-Replayed: true`` header) at the cost of one SELECT. A retry while
+the first request is still running gets 409. Reusing a key for a different
+payload gets 422. Requests without the header behave as before.
+"""
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+from datetime import timedelta
+from typing import Any, Optional
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+
+
+def _ttl() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, 'IDEMPOTENCY_KEY_TTL_SECONDS', 24 * 3600)))
+
+
+def _pending_timeout() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, 'IDEMPOTENCY_PENDING_TIMEOUT_SECONDS', 120)))
+
+
+def request_fingerprint(request, *args: Any, **kwargs: Any) -> str:
+    """Hash the parts of a request that decide its outcome."""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = {key: values for key, values in data.lists()}
+    payload = json.dumps(
+        {'path': request.path, 'args': args, 'kwargs': kwargs, 'data': data},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _is_stale(record, now) -> bool:
+    if record.status_code is None:
+        return record.created_at < now - _pending_timeout()
+    return record.created_at < now - _ttl()
+
+
+def _claim(scope: str, user_id: Optional[int], key: str, fingerprint: str):
+    """Return ``(record, claimed)``; ``claimed`` is False when the key is already in use."""
+    from apps.orders.models import IdempotencyRecord
+
+    now = timezone.now()
+    record, created = IdempotencyRecord.objects.get_or_create(
+        scope=scope, user_id=user_id, key=key,
+        defaults={'fingerprint': fingerprint, 'created_at': now},
+    )
+    if created:
+        return record, True
+    if not _is_stale(record, now):
+        return record, False
+
+    # Expired result or abandoned attempt: take the key over, unless another
+    # retry got there first
+    taken = IdempotencyRecord.objects.filter(pk=record.pk, created_at=record.created_at).update(
+        fingerprint=fingerprint, status_code=None, response_body=None, created_at=now,
+    )
+    if not taken:
+        return IdempotencyRecord.objects.get(pk=record.pk), False
+    record.fingerprint, record.status_code, record.response_body, record.created_at = fingerprint, None, None, now
+    return record, True
+
+
+def _replay(record, fingerprint: str) -> Response:
+    if record.fingerprint != fingerprint:
+        return Response(
+            {'error': f'{HEADER} đã được dùng cho một yêu cầu khác'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record.status_code is None:
+        return Response(
+            {'error': f'Yêu cầu với {HEADER} này đang được xử lý'},
+            status=status.HTTP_409_CONFLICT,
+        )
+    response = Response(record.response_body, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(scope: str):
+    """Make a function-based DRF view replay its response for a repeated ``Idempotency-Key``.
+
+    Apply it below ``@api_view``/``@permission_classes``. Only POST requests that
+    carry the header are affected. 5xx responses and exceptions release the key
+    so the client can retry for real.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = (request.headers.get(HEADER) or '').strip()[:255]
+            if request.method != 'POST' or not key:
+                return view(request, *args, **kwargs)
+
+            user = getattr(request, 'user', None)
+            user_id = user.id if user is not None and user.is_authenticated else None
+            fingerprint = request_fingerprint(request, *args, **kwargs)
+            record, claimed = _claim(scope, user_id, key, fingerprint)
+            if not claimed:
+                return _replay(record, fingerprint)
+
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+
+            if response.status_code >= 500:
+                record.delete()
+                return response
+
+            record.status_code = response.status_code
+            record.response_body = json.loads(JSONRenderer().render(response.data) or 'null')
+            record.save(update_fields=['status_code', 'response_body'])
+            return response
+        return wrapper
+    return decorator
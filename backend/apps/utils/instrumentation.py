@@ -0,0 +1,130 @@
+"""Sampled, request-scoped instrumentation for hot views.
+
+``@traced('orders.checkout')`` opens a trace for a sampled fraction of requests
+(``REQUEST_TRACE_SAMPLE_RATE``). While the view runs, code anywhere on the
+request path can call ``current_trace()`` to attach fields or time named steps.
+The trace counts the SQL queries it sees through ``connection.execute_wrapper``
+and, when the view returns, emits a single JSON line on the ``fastfood.trace``
+logger.
+
+Unsampled requests get a no-op trace, so instrumented code costs one
+contextvar lookup and never writes to stdout or runs extra queries. Only
+``trace.error()`` is logged for every request, sampled or not.
+"""
+from __future__ import annotations
+
+import contextvars
+import functools
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('fastfood.trace')
+
+
+class _NullTrace:
+    sampled = False
+
+    def set(self, **fields: Any) -> None:
+        pass
+
+    def incr(self, field: str, amount: int = 1) -> None:
+        pass
+
+    @contextmanager
+    def step(self, name: str):
+        yield
+
+    def error(self, message: str, **fields: Any) -> None:
+        logger.warning(json.dumps({'event': 'error', 'message': message, **fields}, default=str))
+
+
+NULL_TRACE = _NullTrace()
+_current: contextvars.ContextVar = contextvars.ContextVar('request_trace', default=NULL_TRACE)
+
+
+class RequestTrace(_NullTrace):
+    sampled = True
+
+    def __init__(self, name: str):
+        self.name = name
+        self.fields: Dict[str, Any] = {}
+        self.steps: Dict[str, float] = {}
+        self.queries = 0
+        self.query_ms = 0.0
+        self.started = time.perf_counter()
+
+    def set(self, **fields: Any) -> None:
+        self.fields.update(fields)
+
+    def incr(self, field: str, amount: int = 1) -> None:
+        self.fields[field] = self.fields.get(field, 0) + amount
+
+    @contextmanager
+    def step(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[name] = round(self.steps.get(name, 0.0) + (time.perf_counter() - started) * 1000, 2)
+
+    def error(self, message: str, **fields: Any) -> None:
+        self.fields.setdefault('errors', []).append({'message': message, **fields})
+
+    def count_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_ms += (time.perf_counter() - started) * 1000
+
+    def emit(self, status_code=None) -> None:
+        event = {
+            'event': self.name,
+            'status': status_code,
+            'duration_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'queries': self.queries,
+            'query_ms': round(self.query_ms, 2),
+            **({'steps': self.steps} if self.steps else {}),
+            **self.fields,
+        }
+        log = logger.warning if status_code is None or status_code >= 500 or 'errors' in self.fields else logger.info
+        log(json.dumps(event, default=str))
+
+
+def current_trace():
+    """Return the active trace, or a no-op one outside sampled requests."""
+    return _current.get()
+
+
+def _sample_rate() -> float:
+    return float(getattr(settings, 'REQUEST_TRACE_SAMPLE_RATE', 0.01))
+
+
+def traced(name: str):
+    """Trace a sampled fraction of calls to a view (apply below ``@api_view``)."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if random.random() >= _sample_rate():
+                return view(request, *args, **kwargs)
+
+            trace = RequestTrace(name)
+            token = _current.set(trace)
+            response = None
+            try:
+                with connection.execute_wrapper(trace.count_query):
+                    response = view(request, *args, **kwargs)
+                return response
+            finally:
+                _current.reset(token)
+                trace.emit(getattr(response, 'status_code', None))
+        return wrapper
+    return decorator
@@ -0,0 +1,136 @@
+"""Opt-in keyset (cursor) pagination for list endpoints.
+
+A client opts in by sending ``cursor`` (empty for the first page) instead of
+``page``. Each page is then fetched with a WHERE on the sort key of the last row
+it has already seen, not with ``COUNT(*)`` plus ``OFFSET``, so with an index on
+the ordering a deep page costs the same as the first one. The response carries
+an opaque ``next_cursor`` to pass back for the following page.
+
+No total is computed unless the client asks for it with ``with_total=1``. The
+count is then cached per query for ``PAGINATION_COUNT_CACHE_SECONDS`` and
+returned as ``approximate_count``.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+CURSOR_PARAM = 'cursor'
+TOTAL_PARAM = 'with_total'
+
+
+class InvalidCursor(ValueError):
+    """The ``cursor`` parameter was not produced by ``encode_cursor`` for this ordering."""
+
+
+def wants_cursor(request) -> bool:
+    return CURSOR_PARAM in request.GET
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    payload = json.dumps(list(values), default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str, size: int, fields: Sequence[Any] = ()) -> List[Any]:
+    """Decode ``token`` into ``size`` values, each converted with ``to_python()`` of its field in ``fields``."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError) as exc:
+        raise InvalidCursor('Invalid cursor') from exc
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Invalid cursor')
+    if any(value is None or isinstance(value, (dict, list)) for value in values):
+        raise InvalidCursor('Invalid cursor')
+    if not fields:
+        return values
+    try:
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValidationError, ValueError, TypeError) as exc:
+        raise InvalidCursor('Invalid cursor') from exc
+
+
+def _ordering_fields(model, ordering: Sequence[str]) -> List[Any]:
+    fields = []
+    for name in ordering:
+        try:
+            fields.append(model._meta.get_field(name.lstrip('-')))
+        except FieldDoesNotExist:
+            raise ValueError(f'Cannot paginate {model.__name__} by {name!r}: not a field of the model')
+    return fields
+
+
+def _after(ordering: Sequence[str], values: Sequence[Any]) -> Q:
+    """Rows strictly after ``values`` in ``ordering`` (e.g. ``('-created_date', '-id')``)."""
+    condition = Q()
+    for position, name in enumerate(ordering):
+        term = Q(**{f'{name.lstrip("-")}__{"lt" if name.startswith("-") else "gt"}': values[position]})
+        for previous, value in zip(ordering[:position], values[:position]):
+            term &= Q(**{previous.lstrip('-'): value})
+        condition |= term
+    # Redundant bound on the leading column so the database can range-scan its index
+    leading = ordering[0]
+    bound = Q(**{f'{leading.lstrip("-")}__{"lte" if leading.startswith("-") else "gte"}': values[0]})
+    return bound & condition
+
+
+@dataclass
+class CursorPage:
+    items: List[Any]
+    next_cursor: Optional[str]
+    page_size: int
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+
+def paginate_keyset(request, queryset, ordering: Sequence[str], page_size: int) -> CursorPage:
+    """Return one page of ``queryset`` after the request's cursor.
+
+    ``ordering`` must be unique and non-null, so end it with ``id``/``-id``.
+    Raises ``InvalidCursor`` for a malformed cursor, including values that do
+    not convert to the type of their ordering field.
+    """
+    page_size = max(1, page_size)
+    queryset = queryset.order_by(*ordering)
+    token = request.GET.get(CURSOR_PARAM) or ''
+    if token:
+        values = decode_cursor(token, len(ordering), _ordering_fields(queryset.model, ordering))
+        queryset = queryset.filter(_after(ordering, values))
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor([getattr(rows[-1], name.lstrip('-')) for name in ordering])
+    return CursorPage(rows, next_cursor, page_size)
+
+
+def approximate_count(queryset) -> int:
+    """``COUNT(*)`` of the query, cached for ``PAGINATION_COUNT_CACHE_SECONDS``."""
+    queryset = queryset.order_by()
+    digest = hashlib.sha1(f'{queryset.model._meta.label}:{queryset.query}'.encode('utf-8')).hexdigest()
+    timeout = int(getattr(settings, 'PAGINATION_COUNT_CACHE_SECONDS', 60))
+    return cache.get_or_set(f'page-count:{digest}', queryset.count, timeout)
+
+
+def cursor_page_fields(request, page: CursorPage, queryset=None) -> Dict[str, Any]:
+    """Pagination keys for a cursor-mode response (add the serialized rows yourself)."""
+    fields = {
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+        'page_size': page.page_size,
+    }
+    if queryset is not None and request.GET.get(TOTAL_PARAM) in ('1', 'true'):
+        fields['approximate_count'] = approximate_count(queryset)
+    return fields
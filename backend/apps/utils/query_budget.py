@@ -0,0 +1,170 @@
+"""Per-endpoint SQL query budgets.
+
+``QUERY_BUDGETS`` declares the maximum number of queries each hot endpoint may
+run, keyed by URL name, or by ``'<METHOD> <url name>'`` where one URL serves
+both a cheap read and an expensive write. Budgets are fixed numbers on purpose:
+an endpoint that issues queries per row (an N+1) will outgrow its budget as
+soon as the page has more rows than the fixtures it was measured with.
+
+``QueryBudgetMiddleware`` (enabled by ``QUERY_BUDGET_HEADERS``, default DEBUG)
+counts queries and DB time per request, returns them as ``X-Query-Count``,
+``X-Query-Time-Ms`` and ``X-Query-Budget`` headers and logs a warning when a
+budget is exceeded.
+
+For tests, ``assert_query_budget`` and ``assert_request_within_budget`` raise
+``QueryBudgetExceeded`` (an ``AssertionError``) so pytest reports the overrun
+as a failure::
+
+    response = assert_request_within_budget(client, 'get', '/api/orders/admin/')
+"""
+from __future__ import annotations
+
+import logging
+import time
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger('fastfood.query_budget')
+
+QUERY_BUDGETS = {
+    # Orders
+    # Customer history reads and prefetches both the live and the archive tables
+    'orders': 23,
+    'POST orders': 20,
+    'shipping_fee_preview': 6,
+    'order_detail': 20,
+    'order_group_detail': 20,
+    'admin_orders_list': 15,
+    'admin_order_detail': 20,
+    'shipper_orders': 15,
+    'get_orders_by_shipper': 15,
+    'update_delivery_status': 15,
+    'shipper_accept_order': 15,
+    'store-orders': 15,
+    # Cart
+    'get_cart': 6,
+    'add_to_cart': 12,
+    'update_cart_item': 8,
+    'remove_from_cart': 8,
+    'clear_cart': 6,
+    'batch_update_cart': 12,
+    # Menu
+    'categories': 4,
+    'stores': 4,
+    'food_list': 12,
+    'food_detail': 8,
+    'search_foods_grouped': 6,
+    'category_foods': 12,
+    'store_foods_list': 12,
+    'admin_foods_list': 12,
+    'store-foods': 12,
+    # Dashboard
+    'admin_dashboard_metrics': 12,
+    'store_dashboard_metrics': 25,
+    'dashboard_overview': 8,
+    'dashboard_revenue_chart': 4,
+    'dashboard_top_stores': 4,
+    'dashboard_order_status': 4,
+    'dashboard_funnel': 6,
+    'dashboard_order_heatmap': 4,
+    'dashboard_stores_table': 4,
+    'dashboard_stats_revenue': 4,
+    'dashboard_stats_top_products': 4,
+    # Chatbot
+    'chatbot-chat': 20,
+    'chatbot-cart': 8,
+    'chatbot-clear-cart': 6,
+    'chatbot-menu': 6,
+}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised by the test helpers when a block runs more queries than allowed."""
+
+
+class QueryCounter:
+    """``connection.execute_wrapper`` callable that counts queries and DB time."""
+
+    def __init__(self):
+        self.count = 0
+        self.time_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time_ms += (time.perf_counter() - started) * 1000
+
+
+def get_query_budget(view_name: Optional[str], method: Optional[str] = None) -> Optional[int]:
+    """Budget for a URL name (and method); ``settings.QUERY_BUDGETS`` entries override the defaults."""
+    if not view_name:
+        return None
+    budgets = {**QUERY_BUDGETS, **getattr(settings, 'QUERY_BUDGETS', {})}
+    if method and f'{method.upper()} {view_name}' in budgets:
+        return budgets[f'{method.upper()} {view_name}']
+    return budgets.get(view_name)
+
+
+@contextmanager
+def assert_query_budget(view_name: Optional[str] = None, budget: Optional[int] = None, method: Optional[str] = None):
+    """Fail if the block runs more queries than ``budget`` (or the view's declared budget)."""
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+    limit = budget if budget is not None else get_query_budget(view_name, method)
+    if limit is not None and counter.count > limit:
+        raise QueryBudgetExceeded(
+            f'{view_name or "block"} ran {counter.count} queries '
+            f'({counter.time_ms:.1f} ms), budget is {limit}'
+        )
+
+
+def assert_request_within_budget(client, method: str, path: str, budget: Optional[int] = None, **kwargs):
+    """Send a request with a Django/DRF test client and check the endpoint's budget."""
+    view_name = resolve(urlsplit(path).path).url_name
+    with assert_query_budget(view_name, budget, method):
+        response = getattr(client, method.lower())(path, **kwargs)
+    return response
+
+
+class QueryBudgetMiddleware:
+    """Expose per-request query counts as headers and warn on budget overruns."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_BUDGET_HEADERS', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                match = None
+        view_name = match.url_name if match else None
+        budget = get_query_budget(view_name, request.method)
+
+        response['X-Query-Count'] = str(counter.count)
+        response['X-Query-Time-Ms'] = f'{counter.time_ms:.1f}'
+        if budget is not None:
+            response['X-Query-Budget'] = str(budget)
+            if counter.count > budget:
+                logger.warning(
+                    'Query budget exceeded for %s (%s %s): %d queries, budget %d',
+                    view_name, request.method, request.path, counter.count, budget,
+                )
+        return response
@@ -0,0 +1,209 @@
+"""Two-level cache for store -> drop-off driving routes.
+
+Lookups hit an in-process LRU first, then the ``route_cache`` table, and only
+then the Google Directions API. Destinations are quantized onto a grid of
+``ROUTE_CACHE_GRID_DEGREES`` (0.0005° ≈ 50 m) so deliveries to the same
+building share one cached route.
+
+In-process entries are also keyed by the store's own grid cell, so a store
+that moves misses in every process; its ``route_cache`` rows are deleted when
+the move is saved (``apps/stores/signals.py``).
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from .shipping import RouteInfo, driving_distances_km, normalize_coordinate
+
+logger = logging.getLogger(__name__)
+
+Bucket = Tuple[int, int]
+RouteKey = Tuple[int, Optional[Bucket], int, int]
+
+_lru: "OrderedDict[RouteKey, Tuple[RouteInfo, Any]]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+
+def _grid_degrees() -> float:
+    return float(getattr(settings, 'ROUTE_CACHE_GRID_DEGREES', 0.0005))
+
+
+def _ttl() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, 'ROUTE_CACHE_TTL_SECONDS', 7 * 24 * 3600)))
+
+
+def _max_entries() -> int:
+    return int(getattr(settings, 'ROUTE_CACHE_MAX_ENTRIES', 2048))
+
+
+def quantize_destination(lat: Any, lon: Any) -> Optional[Bucket]:
+    """Map a coordinate onto the cache grid, or None if it is missing/invalid."""
+    lat = normalize_coordinate(lat)
+    lon = normalize_coordinate(lon)
+    if lat is None or lon is None:
+        return None
+    step = _grid_degrees()
+    return round(lat / step), round(lon / step)
+
+
+def store_origins(stores: Iterable[Any]) -> Dict[int, Optional[Bucket]]:
+    """``{store id: grid cell of the store}`` for keying cached routes."""
+    return {store.id: quantize_destination(store.latitude, store.longitude) for store in stores}
+
+
+def _memory_get(key: RouteKey, now) -> Optional[RouteInfo]:
+    with _lock:
+        entry = _lru.get(key)
+        if entry is None:
+            return None
+        route, expires_at = entry
+        if expires_at <= now:
+            del _lru[key]
+            return None
+        _lru.move_to_end(key)
+        return route
+
+
+def _memory_put(key: RouteKey, route: RouteInfo, expires_at) -> None:
+    with _lock:
+        _lru[key] = (route, expires_at)
+        _lru.move_to_end(key)
+        while len(_lru) > _max_entries():
+            _lru.popitem(last=False)
+
+
+def _record(stat: str, count: int) -> None:
+    if count:
+        with _lock:
+            _stats[stat] += count
+
+
+def route_cache_stats() -> Dict[str, int]:
+    """Return process-local hit/miss counters and the current LRU size."""
+    with _lock:
+        return {**_stats, 'memory_entries': len(_lru)}
+
+
+def clear_route_cache() -> None:
+    """Drop the in-process LRU (the database rows are left untouched)."""
+    with _lock:
+        _lru.clear()
+
+
+def get_cached_routes(origins: Dict[int, Optional[Bucket]], dest_lat: Any, dest_lon: Any) -> Dict[int, RouteInfo]:
+    """Return fresh cached routes for the stores in ``origins`` (from ``store_origins``).
+
+    Stores without one are omitted.
+    """
+    from apps.stores.models import RouteCache
+
+    bucket = quantize_destination(dest_lat, dest_lon)
+    if bucket is None:
+        return {}
+
+    now = timezone.now()
+    found: Dict[int, RouteInfo] = {}
+    missing = []
+    for store_id, origin in origins.items():
+        route = _memory_get((store_id, origin, *bucket), now)
+        if route is not None:
+            found[store_id] = route
+        else:
+            missing.append(store_id)
+    _record('memory_hits', len(found))
+
+    if missing:
+        ttl = _ttl()
+        rows = RouteCache.objects.filter(
+            store_id__in=missing,
+            lat_bucket=bucket[0],
+            lng_bucket=bucket[1],
+            updated_at__gte=now - ttl,
+        ).values_list('store_id', 'distance_km', 'polyline', 'updated_at')
+        for store_id, distance_km, polyline, updated_at in rows:
+            route = RouteInfo(distance_km=distance_km, polyline=polyline)
+            found[store_id] = route
+            _memory_put((store_id, origins[store_id], *bucket), route, updated_at + ttl)
+            _record('db_hits', 1)
+
+    return found
+
+
+def save_routes(
+    routes: Dict[int, RouteInfo], origins: Dict[int, Optional[Bucket]], dest_lat: Any, dest_lon: Any,
+) -> None:
+    """Upsert Directions results into both cache levels.
+
+    Only routes that carry a polyline (i.e. real Directions answers) are kept, so a
+    transient API failure never pins the haversine estimate for a whole TTL.
+    """
+    from apps.stores.models import RouteCache
+
+    bucket = quantize_destination(dest_lat, dest_lon)
+    if bucket is None:
+        return
+
+    now = timezone.now()
+    expires_at = now + _ttl()
+    rows = []
+    for store_id, route in routes.items():
+        if route.distance_km is None or not route.polyline:
+            continue
+        _memory_put((store_id, origins.get(store_id), *bucket), route, expires_at)
+        rows.append(RouteCache(
+            store_id=store_id,
+            lat_bucket=bucket[0],
+            lng_bucket=bucket[1],
+            distance_km=route.distance_km,
+            polyline=route.polyline,
+            updated_at=now,
+        ))
+
+    if rows:
+        RouteCache.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['store', 'lat_bucket', 'lng_bucket'],
+            update_fields=['distance_km', 'polyline', 'updated_at'],
+        )
+
+
+def store_routes_km(stores: Iterable[Any], dest_lat: Any, dest_lon: Any) -> Dict[int, RouteInfo]:
+    """Resolve routes from each store to one destination, cache first.
+
+    Cache misses are looked up concurrently via ``driving_distances_km`` (one shared
+    deadline, haversine fallback) and written back to the cache.
+    """
+    stores = {store.id: store for store in stores}
+    if not stores:
+        return {}
+
+    origins = store_origins(stores.values())
+    routes = get_cached_routes(origins, dest_lat, dest_lon)
+    misses = {
+        store_id: (store.latitude, store.longitude)
+        for store_id, store in stores.items()
+        if store_id not in routes
+    }
+    _record('misses', len(misses))
+
+    if misses:
+        fetched = driving_distances_km(misses, dest_lat, dest_lon)
+        save_routes(fetched, origins, dest_lat, dest_lon)
+        routes.update(fetched)
+
+    logger.debug('Route cache stats: %s', route_cache_stats())
+    return routes
+
+
+def store_route_km(store: Any, dest_lat: Any, dest_lon: Any) -> RouteInfo:
+    """Single-store convenience wrapper around ``store_routes_km``."""
+    return store_routes_km([store], dest_lat, dest_lon).get(store.id, RouteInfo(distance_km=None))
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from dataclasses import dataclass
 from decimal import Decimal, ROUND_HALF_UP
 from math import radians, sin, cos, sqrt, atan2
-from typing import Optional, Any
+from typing import Optional, Any, Dict, Hashable, Mapping, Tuple
 
 import requests
 from django.conf import settings
@@ -15,6 +17,9 @@ GOOGLE_DIRECTIONS_URL = 'https://maps.googleapis.com/maps/api/directions/json'
 
 logger = logging.getLogger(__name__)
 
+_route_executor: Optional[ThreadPoolExecutor] = None
+_route_executor_lock = threading.Lock()
+
 
 @dataclass
 class RouteInfo:
@@ -106,6 +111,63 @@ def driving_distance_km(lat1: Any, lon1: Any, lat2: Any, lon2: Any) -> RouteInfo
     return RouteInfo(distance_km=fallback_distance)
 
 
+def _get_route_executor() -> ThreadPoolExecutor:
+    """Return the shared pool used for concurrent Directions lookups."""
+    global _route_executor
+    if _route_executor is None:
+        # Concurrent first requests must not each start (and leak) a pool
+        with _route_executor_lock:
+            if _route_executor is None:
+                max_workers = int(getattr(settings, 'ROUTE_LOOKUP_MAX_WORKERS', 8))
+                _route_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='route-lookup')
+    return _route_executor
+
+
+def driving_distances_km(
+    origins: Mapping[Hashable, Tuple[Any, Any]],
+    lat2: Any,
+    lon2: Any,
+    deadline: Optional[float] = None,
+) -> Dict[Hashable, RouteInfo]:
+    """Resolve driving distances from several origins to one destination concurrently.
+
+    ``origins`` maps a caller-chosen key (e.g. store id) to a ``(lat, lon)`` pair.
+    All lookups share a single deadline; any origin still pending when it expires
+    (or whose lookup raised) falls back to the haversine distance.
+    """
+    if not origins:
+        return {}
+
+    if deadline is None:
+        deadline = float(getattr(settings, 'ROUTE_LOOKUP_DEADLINE_SECONDS', 8))
+
+    executor = _get_route_executor()
+    futures = {
+        executor.submit(driving_distance_km, lat1, lon1, lat2, lon2): key
+        for key, (lat1, lon1) in origins.items()
+    }
+    done, not_done = wait(futures, timeout=deadline)
+
+    results: Dict[Hashable, RouteInfo] = {}
+    for future in done:
+        key = futures[future]
+        try:
+            results[key] = future.result()
+        except Exception as exc:  # pragma: no cover - driving_distance_km already guards requests errors
+            logger.warning('Route lookup for %s failed: %s', key, exc)
+
+    if not_done:
+        logger.warning('Route lookup deadline (%ss) exceeded for %d origin(s); using haversine distance', deadline, len(not_done))
+        for future in not_done:
+            future.cancel()
+
+    for key, (lat1, lon1) in origins.items():
+        if key not in results:
+            results[key] = RouteInfo(distance_km=haversine_distance_km(lat1, lon1, lat2, lon2))
+
+    return results
+
+
 def _to_decimal(value: Any) -> Decimal:
     if isinstance(value, Decimal):
         return value
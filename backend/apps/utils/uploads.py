@@ -0,0 +1,139 @@
+"""Content-addressed image uploads with thumbnails built off the request thread.
+
+``save_upload`` hashes the uploaded file chunk by chunk and stores it through
+``default_storage`` under its SHA-256 (``<prefix>/<ab>/<sha256><ext>``), so the
+same photo uploaded twice is stored once and the name cannot be guessed. The
+file is streamed to the backend, never read into memory as a whole.
+
+Decoding and resizing the image for its thumbnail is submitted to a small
+shared thread pool; the request returns as soon as the original is stored. The
+thumbnail name is deterministic (``thumbnail_name``), so clients fall back to the
+original until the thumbnail exists.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+_thumbnail_executor: Optional[ThreadPoolExecutor] = None
+_thumbnail_executor_lock = threading.Lock()
+
+_HASHED_NAME = re.compile(r'^(?P<prefix>.+)/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})\.[A-Za-z0-9]+$')
+
+
+@dataclass
+class StoredUpload:
+    name: str
+    digest: str
+    created: bool
+    thumbnail: Optional[Future] = None
+
+
+def _extension(filename: str) -> str:
+    ext = os.path.splitext(filename or '')[1].lower()
+    return ext if re.fullmatch(r'\.[a-z0-9]{1,5}', ext) else '.bin'
+
+
+def _thumbnail_size() -> int:
+    return int(getattr(settings, 'UPLOAD_THUMBNAIL_SIZE', 320))
+
+
+def _get_thumbnail_executor() -> ThreadPoolExecutor:
+    """Return the shared pool that decodes and resizes uploaded images."""
+    global _thumbnail_executor
+    if _thumbnail_executor is None:
+        # Concurrent first uploads must not each start (and leak) a pool
+        with _thumbnail_executor_lock:
+            if _thumbnail_executor is None:
+                max_workers = int(getattr(settings, 'UPLOAD_THUMBNAIL_MAX_WORKERS', 2))
+                _thumbnail_executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix='upload-thumbnail',
+                )
+    return _thumbnail_executor
+
+
+def thumbnail_name(name: Optional[str], size: Optional[int] = None) -> Optional[str]:
+    """Storage name of the thumbnail of a file stored by ``save_upload``, else None."""
+    match = _HASHED_NAME.match(name or '')
+    if not match:
+        return None
+    return f"{match['prefix']}/thumbs/{match['digest']}_{size or _thumbnail_size()}.jpg"
+
+
+def build_thumbnail(name: str, size: Optional[int] = None) -> Optional[str]:
+    """Decode ``name``, shrink it to fit ``size`` px and store it as JPEG. Runs in the pool."""
+    from PIL import Image, ImageOps
+
+    target = thumbnail_name(name, size)
+    if target is None:
+        return None
+    size = size or _thumbnail_size()
+    try:
+        if default_storage.exists(target):
+            return target
+        with default_storage.open(name, 'rb') as source, Image.open(source) as image:
+            image.draft('RGB', (size, size))  # Let JPEG decode at a reduced scale
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size))
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            buffer = BytesIO()
+            image.save(buffer, 'JPEG', quality=80, optimize=True)
+        return default_storage.save(target, ContentFile(buffer.getvalue()))
+    except Exception:
+        logger.warning('Could not build thumbnail for %s', name, exc_info=True)
+        return None
+
+
+def save_upload(file, prefix: str = 'assets/proofs', thumbnail: bool = True) -> StoredUpload:
+    """Store an uploaded file under its content hash and queue its thumbnail.
+
+    An identical file already in storage is reused rather than stored again.
+    """
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    digest = sha256.hexdigest()
+    name = f'{prefix}/{digest[:2]}/{digest}{_extension(file.name)}'
+
+    created = not default_storage.exists(name)
+    if created:
+        file.seek(0)
+        name = default_storage.save(name, file)
+
+    upload = StoredUpload(name=name, digest=digest, created=created)
+    if thumbnail and thumbnail_name(name) is not None:
+        upload.thumbnail = _get_thumbnail_executor().submit(build_thumbnail, name)
+    return upload
+
+
+def discard_upload(name: Optional[str], still_referenced=None) -> None:
+    """Delete a stored file and its thumbnail unless ``still_referenced`` (a queryset) has rows.
+
+    Content-addressed files can be shared by several rows, so callers pass the
+    rows that may still point at ``name``.
+    """
+    if not name:
+        return
+    try:
+        if still_referenced is not None and still_referenced.exists():
+            return
+        for path in (name, thumbnail_name(name)):
+            if path and default_storage.exists(path):
+                default_storage.delete(path)
+    except Exception:
+        # Do not fail request if cleanup fails
+        logger.warning('Could not delete upload %s', name, exc_info=True)
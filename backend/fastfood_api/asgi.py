@@ -0,0 +1,15 @@
+"""
+ASGI config for fastfood_api project.
+
+Serving through an ASGI server (e.g. ``uvicorn fastfood_api.asgi:application``)
+keeps the order event streams (/api/orders/events/) from holding a worker thread
+each.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fastfood_api.settings')
+
+application = get_asgi_application()
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'apps.utils.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -139,6 +140,74 @@ REST_FRAMEWORK = {
 SHIPPING_BASE_FEE = Decimal(config('SHIPPING_BASE_FEE', default='15000'))
 SHIPPING_FEE_PER_KM = Decimal(config('SHIPPING_FEE_PER_KM', default='4000'))
 GOOGLE_MAPS_API_KEY = config('GOOGLE_MAPS_API_KEY', default='')
+# Overall deadline (seconds) for resolving all store routes of one checkout concurrently
+ROUTE_LOOKUP_DEADLINE_SECONDS = config('ROUTE_LOOKUP_DEADLINE_SECONDS', default=8, cast=float)
+ROUTE_LOOKUP_MAX_WORKERS = config('ROUTE_LOOKUP_MAX_WORKERS', default=8, cast=int)
+# Route cache: destinations snapped to a ~50 m grid, cached in-process and in the route_cache table
+ROUTE_CACHE_GRID_DEGREES = config('ROUTE_CACHE_GRID_DEGREES', default=0.0005, cast=float)
+ROUTE_CACHE_TTL_SECONDS = config('ROUTE_CACHE_TTL_SECONDS', default=7 * 24 * 3600, cast=int)
+ROUTE_CACHE_MAX_ENTRIES = config('ROUTE_CACHE_MAX_ENTRIES', default=2048, cast=int)
+# Active-promo index: rebuilt on promo save/delete, and at least this often
+PROMO_INDEX_TTL_SECONDS = config('PROMO_INDEX_TTL_SECONDS', default=60, cast=int)
+# Idempotency-Key replay window, and how long an unfinished attempt blocks retries
+IDEMPOTENCY_KEY_TTL_SECONDS = config('IDEMPOTENCY_KEY_TTL_SECONDS', default=24 * 3600, cast=int)
+IDEMPOTENCY_PENDING_TIMEOUT_SECONDS = config('IDEMPOTENCY_PENDING_TIMEOUT_SECONDS', default=120, cast=int)
+# Fraction of requests to hot views that emit a structured trace (apps/utils/instrumentation.py)
+REQUEST_TRACE_SAMPLE_RATE = config('REQUEST_TRACE_SAMPLE_RATE', default=1.0 if DEBUG else 0.01, cast=float)
+# X-Query-Count / X-Query-Time-Ms / X-Query-Budget response headers (apps/utils/query_budget.py)
+QUERY_BUDGET_HEADERS = config('QUERY_BUDGET_HEADERS', default=DEBUG, cast=bool)
+# Cache lifetime of the optional total returned by cursor-paginated lists (apps/utils/pagination.py)
+PAGINATION_COUNT_CACHE_SECONDS = config('PAGINATION_COUNT_CACHE_SECONDS', default=60, cast=int)
+# Proof image thumbnails: longest side in px and decode/resize pool size (apps/utils/uploads.py)
+UPLOAD_THUMBNAIL_SIZE = config('UPLOAD_THUMBNAIL_SIZE', default=320, cast=int)
+UPLOAD_THUMBNAIL_MAX_WORKERS = config('UPLOAD_THUMBNAIL_MAX_WORKERS', default=2, cast=int)
+# Delivered/cancelled orders older than this are moved to the archive tables (apps/orders/archive.py)
+ORDER_ARCHIVE_AFTER_DAYS = config('ORDER_ARCHIVE_AFTER_DAYS', default=400, cast=int)
+# Order status push (apps/orders/events.py): broker class (default in-process), events kept for
+# Last-Event-ID replay, heartbeat interval, how long one stream stays open before the client reconnects,
+# lifetime of the ?token= that opens a stream, and whether streams may run under WSGI (one thread each)
+ORDER_EVENTS_BROKER = config('ORDER_EVENTS_BROKER', default='') or None
+ORDER_EVENTS_BUFFER_SIZE = config('ORDER_EVENTS_BUFFER_SIZE', default=1000, cast=int)
+ORDER_EVENTS_HEARTBEAT_SECONDS = config('ORDER_EVENTS_HEARTBEAT_SECONDS', default=15, cast=float)
+ORDER_EVENTS_STREAM_SECONDS = config('ORDER_EVENTS_STREAM_SECONDS', default=300, cast=float)
+ORDER_EVENTS_TOKEN_SECONDS = config('ORDER_EVENTS_TOKEN_SECONDS', default=60, cast=int)
+ORDER_EVENTS_WSGI_STREAMING = config('ORDER_EVENTS_WSGI_STREAMING', default=DEBUG, cast=bool)
+# Cart storage (apps/cart/store.py): DatabaseCartStore writes every change; CacheCartStore keeps carts in
+# the CART_STORE_CACHE alias and writes them at checkout or this many seconds after the first unsaved change
+CART_STORE = config('CART_STORE', default='apps.cart.store.DatabaseCartStore')
+CART_STORE_CACHE = config('CART_STORE_CACHE', default='carts')
+CART_STORE_FLUSH_SECONDS = config('CART_STORE_FLUSH_SECONDS', default=30, cast=float)
+CART_STORE_TTL_SECONDS = config('CART_STORE_TTL_SECONDS', default=7 * 24 * 3600, cast=int)
+
+# Caches: the carts alias must be shared by all workers (e.g. django.core.cache.backends.redis.RedisCache
+# with CART_CACHE_LOCATION=redis://...) when CacheCartStore runs with more than one process
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'carts': {
+        'BACKEND': config('CART_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CART_CACHE_LOCATION', default='carts'),
+    },
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'fastfood.trace': {
+            'handlers': ['console'],
+            'level': config('REQUEST_TRACE_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+        'fastfood.query_budget': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
 
 # JWT Configuration
 SIMPLE_JWT = {
@@ -202,4 +271,5 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
 ]
@@ -0,0 +1,149 @@
+"""Shared fixtures: a small marketplace with enough rows per page to expose an N+1."""
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.core.cache import caches
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+STORES = 3
+FOODS_PER_STORE = 8
+CHECKOUTS = 10  # One order per store each, so 30 orders with 2 lines apiece
+
+
+@pytest.fixture(autouse=True)
+def _isolated(settings):
+    # No Directions API calls and no state carried between tests
+    settings.GOOGLE_MAPS_API_KEY = ''
+    settings.CART_STORE = None
+    for cache in caches.all():
+        cache.clear()
+    import apps.cart.store as cart_store
+    import apps.promotions.engine as promo_engine
+    from apps.utils.route_cache import clear_route_cache
+
+    cart_store._store = None
+    promo_engine.invalidate_promo_index()
+    clear_route_cache()
+
+
+def _user(role, username, **fields):
+    from apps.authentication.models import User
+
+    return User.objects.create(
+        username=username, email=f'{username}@example.com', fullname=username.title(),
+        phone_number=f'090000000{role.id}', role=role, **fields,
+    )
+
+
+@pytest.fixture
+def roles(db):
+    from apps.authentication.models import Role
+
+    return {
+        role_id: Role.objects.create(id=role_id, role_name=name)
+        for role_id, name in [(1, 'Khách hàng'), (2, 'Quản lý'), (3, 'Cửa hàng'), (4, 'Shipper')]
+    }
+
+
+@pytest.fixture
+def customer(roles):
+    return _user(roles[1], 'customer', latitude=10.77, longitude=106.70)
+
+
+@pytest.fixture
+def admin(roles):
+    return _user(roles[2], 'admin')
+
+
+@pytest.fixture
+def manager(roles):
+    return _user(roles[3], 'manager')
+
+
+@pytest.fixture
+def shipper(roles):
+    from apps.shipper.models import Shipper
+
+    return Shipper.objects.create(user=_user(roles[4], 'shipper'))
+
+
+@pytest.fixture
+def catalog(db, manager):
+    """``STORES`` stores (the first managed by ``manager``), each with sized foods."""
+    from apps.menu.models import Category, Food, FoodSize
+    from apps.promotions.models import Promo
+    from apps.stores.models import Store
+
+    system_store = Store.objects.create(id=0, store_name='System')
+    category = Category.objects.create(cate_name='Cơm')
+    stores, foods = [], []
+    for position in range(STORES):
+        store = Store.objects.create(
+            store_name=f'Store {position}', latitude=Decimal('10.78') + position / Decimal(100),
+            longitude=Decimal('106.69'), manager=manager if position == 0 else None,
+        )
+        stores.append(store)
+        for number in range(FOODS_PER_STORE):
+            food = Food.objects.create(
+                title=f'Food {position}-{number}', price=Decimal(20000 + 1000 * number),
+                category=category, store=store,
+            )
+            FoodSize.objects.create(food=food, size_name='L', price=Decimal('5000'))
+            foods.append(food)
+    now = timezone.now()
+    promo = Promo.objects.create(
+        name='Giảm 10%', discount_type='PERCENT', discount_value=Decimal('10'), minimum_pay=0,
+        start_date=now - timedelta(days=1), end_date=now + timedelta(days=1), store=system_store,
+    )
+    return {'category': category, 'stores': stores, 'foods': foods, 'promo': promo}
+
+
+def api_client(user=None):
+    client = APIClient()
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def fill_cart(customer, catalog):
+    """Put two lines of every store in the customer's cart through the API."""
+    client = api_client(customer)
+
+    def fill():
+        operations = []
+        for position in range(STORES):
+            plain, sized = catalog['foods'][position * FOODS_PER_STORE:][:2]
+            operations.append({'op': 'add', 'food_id': plain.id})
+            operations.append({'op': 'add', 'food_id': sized.id, 'food_option_id': sized.sizes.get().id})
+        response = client.post('/api/cart/batch/', {'operations': operations}, format='json')
+        assert response.status_code == 200, response.json()
+        return response
+
+    return fill
+
+
+@pytest.fixture
+def orders(customer, catalog, shipper, fill_cart):
+    """``CHECKOUTS`` multi-store checkouts, half of them delivered and rated, all assigned to ``shipper``."""
+    from apps.orders.models import Order, OrderDetail
+    from apps.ratings.models import RatingFood
+
+    client = api_client(customer)
+    for _ in range(CHECKOUTS):
+        fill_cart()
+        response = client.post('/api/orders/', {
+            'receiver_name': 'Khách', 'phone_number': '0900000000', 'ship_address': '1 Lê Lợi',
+            'promo_ids': [catalog['promo'].id],
+        }, format='json')
+        assert response.status_code == 201, response.json()
+    Order.objects.update(shipper=shipper)
+    delivered = list(Order.objects.order_by('id').values_list('id', flat=True))[::2]
+    Order.objects.filter(id__in=delivered).update(order_status='Đã giao', delivery_status='Đã giao')
+    RatingFood.objects.bulk_create(
+        RatingFood(user=customer, food_id=detail.food_id, order_id=detail.order_id, rating=1 + detail.id % 5, content='Ngon')
+        for detail in OrderDetail.objects.filter(order_id__in=delivered)
+    )
+    return list(Order.objects.order_by('id'))
@@ -0,0 +1,63 @@
+"""``CacheCartStore`` keeps its cached carts in step with checkout and price changes."""
+from decimal import Decimal
+
+import pytest
+
+from apps.cart.lines import current_prices
+from apps.cart.store import CacheCartStore, get_cart_store
+
+
+@pytest.fixture
+def store(settings):
+    import apps.cart.store as cart_store
+
+    settings.CART_STORE = 'apps.cart.store.CacheCartStore'
+    settings.CART_STORE_FLUSH_SECONDS = 3600
+    cart_store._store = None
+    yield get_cart_store()
+    with CacheCartStore._timers_lock:
+        for timer in CacheCartStore._timers.values():
+            timer.cancel()
+        CacheCartStore._timers.clear()
+
+
+def _add(store, user, *foods):
+    keys = [(food.id, None) for food in foods]
+    store.add(user, [(food_id, None, 1, None) for food_id, _ in keys], current_prices(keys))
+
+
+def test_checkout_keeps_lines_added_after_flush(store, customer, catalog, django_capture_on_commit_callbacks):
+    ordered, kept = catalog['foods'][0], catalog['foods'][1]
+    _add(store, customer, ordered)
+    store.flush(customer)
+    state = store.load(customer)
+    # Added by another request between checkout's flush and its commit
+    _add(store, customer, kept)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        store.discard_ordered(customer, state.id, [line.id for line in state.lines], -ordered.price)
+
+    state = store.load(customer)
+    assert [line.food_id for line in state.lines] == [kept.id]
+    assert state.total_money == kept.price
+
+
+def test_price_change_reprices_cached_cart(store, customer, catalog, django_capture_on_commit_callbacks):
+    food = catalog['foods'][0]
+    _add(store, customer, food)
+
+    food.price += Decimal('1000')
+    with django_capture_on_commit_callbacks(execute=True):
+        food.save()
+
+    assert store.load(customer).total_money == food.price
+
+
+def test_non_price_save_keeps_price_epoch(store, catalog, django_capture_on_commit_callbacks):
+    food = catalog['foods'][0]
+
+    food.availability = 'Hết hàng'
+    with django_capture_on_commit_callbacks(execute=True):
+        food.save()
+
+    assert store.cache.get(store.epoch_key) is None
@@ -0,0 +1,28 @@
+"""Cart totals follow food and size price changes (``apps/cart/signals.py``)."""
+from decimal import Decimal
+
+from apps.cart.models import Cart
+
+
+def test_price_change_repairs_cart_totals(customer, catalog, fill_cart):
+    fill_cart()
+    before = Cart.objects.get(user=customer).total_money
+    food = catalog['foods'][0]
+
+    food.price += Decimal('1000')
+    food.save()
+
+    assert Cart.objects.get(user=customer).total_money == before + Decimal('1000')
+
+
+def test_non_price_save_leaves_carts_alone(customer, catalog, fill_cart, django_assert_num_queries):
+    fill_cart()
+    food = catalog['foods'][0]
+    size = catalog['foods'][1].sizes.get()
+
+    food.availability = 'Hết hàng'
+    with django_assert_num_queries(1):
+        food.save()
+    size.size_name = 'XL'
+    with django_assert_num_queries(1):
+        size.save()
@@ -0,0 +1,42 @@
+"""Opening the order event stream (``apps/orders/events.py``)."""
+import pytest
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .conftest import api_client
+
+
+@pytest.fixture
+def token(customer):
+    response = api_client(customer).post('/api/orders/events/token/')
+    assert response.status_code == 200
+    return response.json()['token']
+
+
+@pytest.fixture
+def streaming(settings):
+    settings.ORDER_EVENTS_WSGI_STREAMING = True
+    settings.ORDER_EVENTS_STREAM_SECONDS = 0
+
+
+def test_stream_token_opens_stream(streaming, token):
+    response = APIClient().get('/api/orders/events/', {'token': token}, HTTP_ACCEPT='text/event-stream')
+    assert response.status_code == 200
+    assert b''.join(response.streaming_content).startswith(b'retry:')
+
+
+def test_access_jwt_in_query_is_rejected(streaming, customer):
+    response = APIClient().get('/api/orders/events/', {'access_token': str(AccessToken.for_user(customer))})
+    assert response.status_code == 401
+
+
+def test_expired_stream_token_is_rejected(streaming, settings, token):
+    settings.ORDER_EVENTS_TOKEN_SECONDS = -1
+    response = APIClient().get('/api/orders/events/', {'token': token})
+    assert response.status_code == 401
+
+
+def test_wsgi_streaming_is_refused(settings, token):
+    settings.ORDER_EVENTS_WSGI_STREAMING = False
+    response = APIClient().get('/api/orders/events/', {'token': token})
+    assert response.status_code == 503
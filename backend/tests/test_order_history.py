@@ -0,0 +1,29 @@
+"""Order history across the live and archive tables (``apps/orders/archive.py``)."""
+from apps.orders.archive import OrderHistory, archive_batch
+from apps.orders.models import ArchivedOrder, Order
+
+
+def test_history_pages_follow_id_order(customer, orders):
+    # Archive the newer half, so the older live orders (e.g. refunds still pending) sort after them
+    newer = [order.id for order in orders[len(orders) // 2:]]
+    archive_batch(Order.objects.filter(id__in=newer), batch_size=len(newer))
+    history = OrderHistory(
+        Order.objects.filter(user=customer).order_by('-id'),
+        ArchivedOrder.objects.filter(user=customer).order_by('-id'),
+    )
+    expected = sorted((order.id for order in orders), reverse=True)
+
+    assert len(history) == len(expected)
+    assert [order.id for order in history[0:len(expected)]] == expected
+    assert [order.id for order in history[10:20]] == expected[10:20]
+    assert history[len(expected) - 1].id == expected[-1]
+
+
+def test_history_endpoint_pages_in_order(customer, orders):
+    from .conftest import api_client
+
+    archive_batch(Order.objects.filter(id__in=[order.id for order in orders[::3]]), batch_size=len(orders))
+    response = api_client(customer).get('/api/orders/', {'page': 1})
+    assert response.status_code == 200
+    ids = [order['id'] for order in response.json()['results']]
+    assert ids == sorted(ids, reverse=True)
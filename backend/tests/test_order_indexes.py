@@ -0,0 +1,28 @@
+"""The hot order/analytics queries are planned on the indexes added for them.
+
+Uses the query list of ``manage.py check_order_indexes``; partial indexes make
+this PostgreSQL only.
+"""
+import pytest
+from django.db import connection
+
+from apps.orders.management.commands.check_order_indexes import plan_checks
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(connection.vendor != 'postgresql', reason='plans are checked on PostgreSQL'),
+]
+
+
+@pytest.fixture(autouse=True)
+def _no_seqscan(db):
+    # The test tables are tiny and a sequential scan always looks cheapest there
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+
+
+@pytest.mark.parametrize('position', range(len(plan_checks())), ids=[label for label, _, _ in plan_checks()])
+def test_query_uses_index(position):
+    label, queryset, expected = plan_checks()[position]
+    plan = queryset.explain()
+    assert any(name in plan for name in expected), f'{label}: expected {" or ".join(expected)}\n{plan}'
@@ -0,0 +1,35 @@
+"""Order status moves allowed per actor (``apps/orders/status.py``)."""
+import pytest
+
+from apps.orders.status import (
+    ADMIN, CANCELLED, CONFIRMED, DELIVERED, PENDING, PREPARING, READY, SHIPPING, STORE, InvalidTransition,
+    check_transition,
+)
+
+
+@pytest.mark.parametrize('current,target', [
+    (PENDING, CONFIRMED), (CONFIRMED, PREPARING), (PREPARING, READY), (READY, CANCELLED),
+    (SHIPPING, PREPARING), (SHIPPING, SHIPPING), (READY, READY),
+])
+def test_store_moves_forward(current, target):
+    assert check_transition(current, target, STORE) == target
+
+
+@pytest.mark.parametrize('current,target', [
+    (READY, PENDING), (PREPARING, CONFIRMED), (SHIPPING, CONFIRMED), (DELIVERED, CANCELLED), (PENDING, SHIPPING),
+])
+def test_store_cannot_move_backward(current, target):
+    with pytest.raises(InvalidTransition):
+        check_transition(current, target, STORE)
+
+
+@pytest.mark.parametrize('role', [STORE, ADMIN])
+@pytest.mark.parametrize('current', [PENDING, CONFIRMED, READY])
+def test_shipping_is_never_written(role, current):
+    with pytest.raises(InvalidTransition):
+        check_transition(current, SHIPPING, role)
+
+
+def test_admin_corrects_any_status():
+    assert check_transition(READY, PENDING, ADMIN) == PENDING
+    assert check_transition(SHIPPING, CONFIRMED, ADMIN) == CONFIRMED
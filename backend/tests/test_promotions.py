@@ -0,0 +1,71 @@
+"""Promo selection at checkout (``apps/promotions/engine.py``)."""
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+
+from apps.promotions.engine import evaluate_cart
+from apps.promotions.models import Promo
+
+from .conftest import api_client
+
+
+def _promo(store, value, discount_type='AMOUNT'):
+    now = timezone.now()
+    return Promo.objects.create(
+        name=f'Giảm {value}', discount_type=discount_type, discount_value=Decimal(value), minimum_pay=0,
+        start_date=now - timedelta(days=1), end_date=now + timedelta(days=1), store=store,
+    )
+
+
+def test_smaller_promo_for_same_store_is_rejected(catalog):
+    store = catalog['stores'][0]
+    small, large = _promo(store, 1000), _promo(store, 5000)
+
+    result = evaluate_cart({store.id: Decimal('50000')}, [small.id, large.id])
+
+    assert [entry.id for entry, _ in result.applied] == [large.id]
+    assert small.id in result.rejected
+
+
+def test_repeated_selection_is_applied_once(catalog):
+    store = catalog['stores'][0]
+    promo = _promo(store, 1000)
+
+    result = evaluate_cart({store.id: Decimal('50000')}, [promo.id, promo.id])
+
+    assert result.total_discount == Decimal('1000')
+    assert not result.rejected
+
+
+def test_unselected_losers_are_not_rejected(catalog):
+    store = catalog['stores'][0]
+    _promo(store, 1000)
+    _promo(store, 5000)
+
+    assert not evaluate_cart({store.id: Decimal('50000')}).rejected
+
+
+@pytest.mark.parametrize('offset', ['0.0000000003', '-0.0000000003'])
+def test_checkout_accepts_float_rounded_discount(customer, catalog, fill_cart, offset):
+    fill_cart()
+    client = api_client(customer)
+    preview = evaluate_cart(
+        {store.id: store_total for store, store_total in _cart_subtotals(customer).items()}, [catalog['promo'].id],
+    )
+    response = client.post('/api/orders/', {
+        'receiver_name': 'Khách', 'phone_number': '0900000000', 'ship_address': '1 Lê Lợi',
+        'promo_ids': [catalog['promo'].id], 'discount_amount': float(preview.total_discount + Decimal(offset)),
+    }, format='json')
+    assert response.status_code == 201, response.json()
+
+
+def _cart_subtotals(user):
+    from apps.cart.models import Item
+
+    subtotals = {}
+    for item in Item.objects.filter(cart__user=user).select_related('food__store', 'food_option'):
+        price = item.food.price + (item.food_option.price if item.food_option else 0)
+        subtotals[item.food.store] = subtotals.get(item.food.store, Decimal('0')) + price * item.quantity
+    return subtotals
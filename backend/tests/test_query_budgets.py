@@ -0,0 +1,152 @@
+"""Hot endpoints stay within their declared query budgets (``apps/utils/query_budget.py``).
+
+The fixtures put more rows on each page than any budget allows queries, so a
+query per order, line, food or store fails here instead of in production.
+"""
+import pytest
+
+from apps.utils.query_budget import assert_request_within_budget
+
+from .conftest import api_client
+
+DAY = '2000-01-01'
+TODAY = '2100-01-01'
+
+ORDER_ENDPOINTS = [
+    ('customer', 'get', '/api/orders/'),
+    ('admin', 'get', '/api/orders/admin/'),
+    ('admin', 'get', '/api/orders/admin/?cursor='),
+    ('shipper', 'get', '/api/orders/shipper/'),
+    ('admin', 'get', '/api/orders/shipper/{shipper.id}/orders/'),
+    ('customer', 'get', '/api/orders/{order.id}/'),
+    ('admin', 'get', '/api/orders/admin/{order.id}/'),
+    ('manager', 'get', '/api/stores/{store.id}/orders/'),
+]
+
+MENU_ENDPOINTS = [
+    ('customer', 'get', '/api/menu/items/'),
+    ('customer', 'get', '/api/menu/items/?cursor='),
+    ('customer', 'get', '/api/menu/categories/'),
+    ('customer', 'get', '/api/menu/stores/'),
+    ('customer', 'get', '/api/menu/categories/{category.id}/foods/'),
+    ('customer', 'get', '/api/menu/items/{food.id}/'),
+    ('customer', 'get', '/api/menu/search/?q=Food'),
+    ('manager', 'get', '/api/menu/store/foods/'),
+    ('admin', 'get', '/api/menu/admin/foods/'),
+]
+
+DASHBOARD_ENDPOINTS = [
+    ('admin', 'get', '/api/dashboard/admin/'),
+    ('manager', 'get', '/api/dashboard/store/{store.id}/'),
+    ('admin', 'get', '/api/admin/dashboard/overview/'),
+    ('admin', 'get', '/api/admin/dashboard/revenue-chart/'),
+    ('admin', 'get', '/api/admin/dashboard/top-stores/'),
+    ('admin', 'get', '/api/admin/dashboard/order-status/'),
+    ('admin', 'get', '/api/admin/dashboard/funnel/'),
+    ('admin', 'get', '/api/admin/dashboard/order-heatmap/'),
+    ('admin', 'get', '/api/admin/dashboard/stores-table/'),
+    ('admin', 'get', f'/api/admin/dashboard/stats/revenue/?start_date={DAY}&end_date={TODAY}'),
+    ('admin', 'get', f'/api/admin/dashboard/stats/top-products/?start_date={DAY}&end_date={TODAY}'),
+]
+
+
+@pytest.fixture
+def context(request, orders, catalog, customer, admin, manager, shipper):
+    return {
+        'users': {'customer': customer, 'admin': admin, 'manager': manager, 'shipper': shipper.user},
+        'paths': {
+            'order': orders[-1], 'shipper': shipper, 'store': catalog['stores'][0],
+            'category': catalog['category'], 'food': catalog['foods'][0],
+        },
+    }
+
+
+def _get_within_budget(context, role, method, path):
+    client = api_client(context['users'][role])
+    response = assert_request_within_budget(client, method, path.format(**context['paths']))
+    assert response.status_code == 200, response.content[:300]
+    return response
+
+
+@pytest.mark.parametrize('role,method,path', ORDER_ENDPOINTS)
+def test_order_endpoints(context, role, method, path):
+    _get_within_budget(context, role, method, path)
+
+
+def test_order_history_with_archive(context, orders):
+    from apps.orders.archive import archive_batch
+    from apps.orders.models import Order
+
+    archive_batch(Order.objects.filter(id__in=[order.id for order in orders[::3]]), batch_size=len(orders))
+    _get_within_budget(context, 'customer', 'get', '/api/orders/')
+
+
+@pytest.mark.parametrize('role,method,path', MENU_ENDPOINTS)
+def test_menu_endpoints(context, role, method, path):
+    _get_within_budget(context, role, method, path)
+
+
+@pytest.mark.parametrize('role,method,path', DASHBOARD_ENDPOINTS)
+def test_dashboard_endpoints(context, role, method, path):
+    _get_within_budget(context, role, method, path)
+
+
+def test_checkout(customer, catalog, fill_cart):
+    fill_cart()
+    client = api_client(customer)
+    response = assert_request_within_budget(client, 'post', '/api/orders/', data={
+        'receiver_name': 'Khách', 'phone_number': '0900000000', 'ship_address': '1 Lê Lợi',
+        'promo_ids': [catalog['promo'].id],
+    }, format='json')
+    assert response.status_code == 201, response.json()
+    assert len(response.json()['orders']) == len(catalog['stores'])
+
+
+def test_cart_endpoints(customer, catalog, fill_cart):
+    fill_cart()
+    client = api_client(customer)
+    food, other = catalog['foods'][0], catalog['foods'][2]
+    toppings = {str(topping.id): 1 for topping in catalog['foods'][3:8]}
+
+    response = assert_request_within_budget(client, 'get', '/api/cart/')
+    assert response.status_code == 200
+    assert len(response.json()['items']) == 6
+
+    response = assert_request_within_budget(client, 'post', '/api/cart/add/', data={
+        'food_id': other.id, 'quantity': 2, 'toppings': toppings,
+    }, format='json')
+    assert response.status_code == 201, response.json()
+
+    response = assert_request_within_budget(
+        client, 'put', f'/api/cart/items/{food.id}/', data={'quantity': 3}, format='json',
+    )
+    assert response.status_code == 200, response.json()
+
+    operations = [{'op': 'add', 'food_id': topping.id, 'quantity': 1} for topping in catalog['foods'][8:16]]
+    operations.append({'op': 'remove', 'food_id': other.id})
+    response = assert_request_within_budget(
+        client, 'post', '/api/cart/batch/', data={'operations': operations}, format='json',
+    )
+    assert response.status_code == 200, response.json()
+
+    response = assert_request_within_budget(client, 'delete', f'/api/cart/items/{food.id}/remove/')
+    assert response.status_code == 200
+    response = assert_request_within_budget(client, 'delete', '/api/cart/clear/')
+    assert response.status_code == 200
+
+
+def test_chatbot_endpoints(customer, catalog):
+    from apps.chatbot.models import ChatCart, ChatSession
+
+    session = ChatSession.objects.create(session_id='budget', user=customer)
+    for food in catalog['foods'][:12]:
+        ChatCart.objects.create(session=session, food=food, food_size=food.sizes.get(), quantity=2)
+    client = api_client(customer)
+
+    response = assert_request_within_budget(client, 'get', '/api/chatbot/menu/')
+    assert response.status_code == 200
+    response = assert_request_within_budget(client, 'get', '/api/chatbot/cart/?session_id=budget')
+    assert response.status_code == 200
+    assert response.json()['count'] == 12
+    response = assert_request_within_budget(client, 'post', '/api/chatbot/cart/clear/', data={'session_id': 'budget'})
+    assert response.status_code == 200
@@ -0,0 +1,29 @@
+"""Cached routes are keyed by the store's location as well as the drop-off."""
+from decimal import Decimal
+
+from apps.stores.models import RouteCache
+from apps.utils.route_cache import RouteInfo, get_cached_routes, save_routes, store_origins
+
+DROP_OFF = (10.77, 106.70)
+
+
+def test_moving_store_drops_its_routes(catalog):
+    store = catalog['stores'][0]
+    save_routes({store.id: RouteInfo(distance_km=2.5, polyline='abc')}, store_origins([store]), *DROP_OFF)
+    assert get_cached_routes(store_origins([store]), *DROP_OFF)[store.id].distance_km == 2.5
+
+    store.latitude += Decimal('0.01')
+    store.save()
+
+    assert not RouteCache.objects.filter(store=store).exists()
+    assert get_cached_routes(store_origins([store]), *DROP_OFF) == {}
+
+
+def test_unrelated_store_save_keeps_routes(catalog):
+    store = catalog['stores'][0]
+    save_routes({store.id: RouteInfo(distance_km=2.5, polyline='abc')}, store_origins([store]), *DROP_OFF)
+
+    store.store_name = 'Renamed'
+    store.save()
+
+    assert RouteCache.objects.filter(store=store).exists()